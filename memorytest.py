@@ -0,0 +1,90 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+# Prep memory benchmark.  Preps a large generated document, and checks that
+# the growth of the peak resident set size during prep, measured in copies
+# of the parsed document tree, stays below a limit.  Full-tree copies made
+# by the preptool, such as for schema validation, show up here.
+#
+# The number of sections of the generated document can be set with the
+# environment variable XML2RFC_MEMORY_TEST_SECTIONS, and the maximum
+# accepted peak growth, in tree copies, with XML2RFC_MAX_PREP_MEMORY.
+
+import os
+import subprocess
+import sys
+
+
+SECTIONS = int(os.environ.get('XML2RFC_MEMORY_TEST_SECTIONS', '2000'))
+MAX_PREP_MEMORY = float(os.environ.get('XML2RFC_MAX_PREP_MEMORY', '4.5'))
+
+# Run in a fresh process for each measurement, so that the peak resident set
+# size of one doesn't hide the other.  Prints the peak growth in bytes.
+MEASURE = r'''
+import copy, datetime, sys
+import xml2rfc, xml2rfc.log
+from xml2rfc.timings import peak_rss
+from xml2rfc.writers.base import default_options
+
+what, sections = sys.argv[1], int(sys.argv[2])
+paragraph = ('<t anchor="p-%d-%d">Paragraph %d of section %d, citing <xref target="RFC2119"/> '
+             'and <xref target="s-%d"/>.  ' + 'Lorem ipsum dolor sit amet. '*5 + '</t>')
+middle = ''.join(
+    '<section anchor="s-%d"><name>Section %d</name>%s</section>' % (i, i, ''.join(
+        paragraph % (i, j, j, i, (i+1) % sections) for j in range(10)))
+    for i in range(sections))
+source = """<?xml version="1.0" encoding="utf-8"?>
+<rfc version="3" ipr="trust200902" docName="draft-memory-test-00" category="info" submissionType="IETF">
+  <front>
+    <title>Memory Test</title>
+    <author fullname="Jane Doe" initials="J." surname="Doe"/>
+    <date year="2026" month="10" day="1"/>
+    <abstract><t>Abstract.</t></abstract>
+  </front>
+  <middle>%s</middle>
+  <back>
+    <references>
+      <name>References</name>
+      <reference anchor="RFC2119" target="https://www.rfc-editor.org/info/rfc2119">
+        <front><title>Key words</title><author fullname="S. Bradner"/><date year="1997" month="March"/></front>
+      </reference>
+    </references>
+  </back>
+</rfc>""" % middle
+
+xml2rfc.log.quiet = True
+options = copy.deepcopy(default_options)
+options.quiet = True
+options.date = datetime.date(2026, 10, 1)
+parser = xml2rfc.XmlRfcParser(None, options=options, quiet=True)
+parser.text = source.encode('utf-8')
+xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+before = peak_rss()
+if what == 'copy':
+    tree = copy.deepcopy(xmlrfc.tree)
+else:
+    tree = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date).prep()
+print(peak_rss() - before)
+'''
+
+def measure(what):
+    output = subprocess.run([ sys.executable, '-c', MEASURE, what, str(SECTIONS) ], capture_output=True, text=True, check=True).stdout
+    return int(output.split()[-1])
+
+errors = 0
+
+sys.stderr.write("Measuring peak memory growth, for a document with %s sections:\n" % SECTIONS)
+tree_size = measure('copy')
+prep_size = measure('prep')
+if not tree_size:
+    sys.stderr.write("  Peak resident set size is not available on this platform\n")
+    sys.exit(0)
+copies = prep_size / tree_size
+sys.stderr.write("  %-20s %8.1fM\n" % ('tree copy', tree_size / 1e6))
+sys.stderr.write("  %-20s %8.1fM  (%.1f tree copies)\n" % ('prep', prep_size / 1e6, copies))
+if copies > MAX_PREP_MEMORY:
+    errors += 1
+    sys.stderr.write("  Peak memory growth during prep is above %.1f tree copies\n" % (MAX_PREP_MEMORY, ))
+
+if errors:
+    sys.exit(errors)
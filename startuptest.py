@@ -0,0 +1,61 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+# Startup time benchmark.  Times some quick xml2rfc invocations, and checks
+# that the modules which are slow to import, and only needed by some
+# formatters, are not loaded by them.
+#
+# The maximum accepted median time, in seconds, can be set with the
+# environment variable XML2RFC_MAX_STARTUP_TIME.
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+RUNS = 10
+MAX_STARTUP_TIME = float(os.environ.get('XML2RFC_MAX_STARTUP_TIME', '1.0'))
+
+# Modules which should only be loaded when needed
+LAZY_MODULES = [
+    'intervaltree',
+    'pycountry',
+    'requests',
+    'weasyprint',
+    'xml2rfc.writers.doc',
+    'xml2rfc.writers.html',
+    'xml2rfc.writers.pdf',
+]
+
+COMMANDS = [
+    ('import xml2rfc',      [ sys.executable, '-c', 'import xml2rfc' ]),
+    ('import xml2rfc.run',  [ sys.executable, '-c', 'import xml2rfc.run' ]),
+    ('xml2rfc --version',   [ sys.executable, '-c', 'import sys; sys.argv = ["xml2rfc", "--version"]; import xml2rfc.run; xml2rfc.run.main()' ]),
+]
+
+errors = 0
+
+sys.stderr.write("Checking for eagerly imported modules:\n")
+check = 'import sys, xml2rfc.run; print(" ".join(m for m in %r if m in sys.modules))' % (LAZY_MODULES, )
+loaded = subprocess.run([ sys.executable, '-c', check ], capture_output=True, text=True, check=True).stdout.split()
+for name in loaded:
+    errors += 1
+    sys.stderr.write("  Module '%s' is loaded at startup\n" % (name, ))
+
+sys.stderr.write("Timing startup, median of %s runs:\n" % RUNS)
+for label, command in COMMANDS:
+    times = []
+    for i in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    sys.stderr.write("  %-20s %6.3fs\n" % (label, median))
+    if median > MAX_STARTUP_TIME:
+        errors += 1
+        sys.stderr.write("  Startup time for '%s' is above %.3fs\n" % (label, MAX_STARTUP_TIME))
+
+if errors:
+    sys.exit(errors)
@@ -1,21 +1,45 @@
 #!/usr/bin/env python
 
+import base64
+import concurrent.futures
+import contextlib
 import copy
+import datetime
 import difflib
+import functools
+import http.client
+import http.server
+import io
+import json
 import lxml
+import os
 import re
+import shutil
 import sys
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
 import xml2rfc
+import xml2rfc.buildcache
+import xml2rfc.bundle
+import xml2rfc.lockfile
+import xml2rfc.schemas
+import xml2rfc.scripts
+import xml2rfc.server
+import xml2rfc.timings
 import xml2rfc.utils
+import zipfile
 
 from xml2rfc.boilerplate_rfc_7841 import boilerplate_rfc_status_of_memo
+from xml2rfc.run import expand_batch_sources, get_mtimes, process
 from xml2rfc.walkpdf import xmldoc
 from xml2rfc.writers.base import default_options, BaseV3Writer, RfcWriterError
 from xml2rfc.writers import DatatrackerToBibConverter
 from xml2rfc.writers.text import MAX_WIDTH
 from xml2rfc.utils import strip_link_attachments
-from xml2rfc.util.file import can_access, FileAccessError
+from xml2rfc.util.file import can_access, file_sha256, FileAccessError
 
 try:
     from xml2rfc import debug
@@ -731,6 +755,120 @@ class PrepToolWriterTest(unittest.TestCase):
         target = 'https://www.rfc-editor.org/info/rfc9280'
         self.assertEqual(target, rfc.xpath('./section/t/eref')[0].get('target'))
 
+    def test_references_check_usage(self):
+        rfc = lxml.etree.fromstring('''
+<rfc>
+    <middle>
+        <section><t><xref target="used"/>, <xref target="used"/>, <relref target="relref"/></t></section>
+    </middle>
+    <back>
+        <references>
+            <reference anchor="used"/>
+            <reference anchor="relref"/>
+            <reference anchor="unused"/>
+            <referencegroup anchor="unused-group"/>
+        </references>
+    </back>
+</rfc>''')
+        self.writer.root = rfc
+        warnings = []
+        self.writer.warn = lambda e, text: warnings.append(e.get('anchor'))
+        self.writer.references_check_usage(rfc.find('./back/references'), None)
+        self.assertEqual(warnings, ['unused', 'unused-group'])
+        self.assertEqual(len(self.writer.get_target_usage()['used']), 2)
+
+    def test_dispatch_phase(self):
+        '''Test that a dispatch() phase gives the same result as its selectors one by one.'''
+        source = '''
+<rfc tocDepth="2">
+    <middle>
+        <section title="One" removeInRFC="true">
+            <t>Text, see <relref target="RFC1" section="1"/></t>
+            <section title="Two">
+                <t keepWithPrevious="true">Text</t>
+                <section><name>Three</name></section>
+            </section>
+        </section>
+        <section toc="exclude"><name>Four</name>
+            <note removeInRFC="true" title="Five"><t>Text</t></note>
+        </section>
+    </middle>
+</rfc>'''
+        phases = [
+            ('//*;insert_attribute_defaults()', './/relref;to_xref()',
+             './/section', './/note[@removeInRFC="true"]', './/section[@removeInRFC="true"]', ),
+            ('.//*[@title]', './/*[@keepWithPrevious="true"]', ),
+        ]
+        self.writer.options.rfc = False
+        results = []
+        for selectors in [ phases, xml2rfc.writers.base.flatten_selectors(phases) ]:
+            rfc = lxml.etree.fromstring(source)
+            self.writer.root = rfc
+            self.writer.tree = rfc.getroottree()
+            self.writer.dispatch(selectors)
+            results.append(lxml.etree.tostring(rfc))
+        self.assertEqual(len(self.writer.errors), 0)
+        self.assertEqual(results[0], results[1])
+        self.assertIn(b'This section is to be removed', results[0])
+        self.assertIn(b'<name>Five</name>', results[0])
+        self.assertIn(b'<xref target="RFC1" section="1" sectionFormat="of"', results[0])
+
+    def test_dispatch_phase_matches(self):
+        '''Test that a dispatch() phase matches elements before running its handlers.'''
+        rfc = lxml.etree.fromstring('<rfc><middle><section/><section/></middle></rfc>')
+        self.writer.root = rfc
+        self.writer.tree = rfc.getroottree()
+        visited = []
+        def section_mark(e, p):
+            # Mark the next section, which the walk has not reached yet
+            if e.getnext() is not None:
+                e.getnext().set('marked', 'true')
+        self.writer.section_mark = section_mark
+        self.writer.attribute_marked_true = lambda e, p: visited.append(e)
+        self.writer.dispatch([ ('.//section;mark()', './/*[@marked="true"]', ), ])
+        self.assertEqual(rfc[0][1].get('marked'), 'true')
+        self.assertEqual(visited, [])
+        # The same selectors, one by one
+        self.writer.dispatch([ './/section;mark()', './/*[@marked="true"]', ])
+        self.assertEqual(visited, [ rfc[0][1] ])
+
+    def test_id_index_reset(self):
+        rfc = lxml.etree.fromstring('''
+<rfc>
+    <middle>
+        <section anchor="dup"><name>One</name></section>
+        <section anchor="dup" pn="s-2"><name>Two</name></section>
+    </middle>
+</rfc>''')
+        one, two = rfc[0]
+        self.writer.root = rfc
+        self.writer.reset_id_index()
+        # The first element in document order, as for './/*[@anchor="dup"]'
+        self.assertIs(self.writer.get_element_from_id('dup'), one)
+        self.assertIs(self.writer.get_element_from_id('s-2'), two)
+        # An id added before the indexed element
+        self.writer.set_element_pn(one, 's-2')
+        self.assertIs(self.writer.get_element_from_id('s-2'), one)
+        # An element inserted before the indexed element
+        new = self.writer.element('section', anchor='dup')
+        rfc[0].insert(0, new)
+        self.assertIs(self.writer.get_element_from_id('dup'), new)
+
+    def test_compile_selector(self):
+        rfc = lxml.etree.fromstring('<rfc removeInRFC="true"><section removeInRFC="false"><t/></section></rfc>')
+        section = rfc[0]
+        compile_selector = xml2rfc.writers.base.compile_selector
+        self.assertTrue(compile_selector('.//section')(section, rfc))
+        self.assertFalse(compile_selector('.//section')(rfc[0][0], rfc))
+        self.assertFalse(compile_selector('.//*[@removeInRFC]')(rfc, rfc))
+        self.assertTrue(compile_selector('//*[@removeInRFC]')(rfc, rfc))
+        self.assertFalse(compile_selector('.//*[@removeInRFC="true"]')(section, rfc))
+        self.assertTrue(compile_selector('.//section[@removeInRFC="false"]')(section, rfc))
+        with self.assertRaises(ValueError):
+            compile_selector('//*[@*="yes" or @*="no"]')
+        with self.assertRaises(ValueError):
+            compile_selector('./front/date')
+
 class TextWriterTest(unittest.TestCase):
     '''TextWriter tests'''
 
@@ -1084,6 +1222,45 @@ class BaseV3WriterTest(unittest.TestCase):
         table_2 = self.writer.root.xpath("//table")[1]
         self.assertEqual(self.writer.get_relevant_pi(table_2, "table_borders"), "min")
 
+    def test_validate_policy(self):
+        rfc = lxml.etree.fromstring('<rfc><front><title>Foo</title></front><bar/></rfc>')
+        self.writer.root = rfc
+        self.writer.tree = rfc.getroottree()
+        self.writer.options = copy.deepcopy(default_options)
+        self.writer.options.validate = 'never'
+        self.assertTrue(self.writer.validate(warn=True))
+        self.assertEqual(len(self.writer.errors), 0)
+        for policy in ['once', 'always']:
+            self.writer.options.validate = policy
+            self.assertFalse(self.writer.validate(warn=True))
+
+    def test_get_element_from_id(self):
+        rfc = lxml.etree.fromstring('''
+<rfc anchor="root">
+    <middle>
+        <section anchor="intro" pn="section-1"><name slugifiedName="name-intro">Intro</name></section>
+        <section pn="intro"><t anchor="para">Text</t></section>
+    </middle>
+</rfc>''')
+        self.writer.root = rfc
+        get = self.writer.get_element_from_id
+        # anchor= before pn= before slugifiedName=, and not the root element
+        self.assertEqual(get('intro').get('pn'), 'section-1')
+        self.assertEqual(get('name-intro').tag, 'name')
+        self.assertIsNone(get('root'))
+        # ids added, changed and removed after the index was built
+        para = get('para')
+        para.set('pn', 'section-2-1')
+        self.assertIs(get('section-2-1'), para)
+        para.set('anchor', 'text')
+        self.assertIsNone(get('para'))
+        self.assertIs(get('text'), para)
+        para.getparent().remove(para)
+        self.assertIsNone(get('text'))
+        # a new root
+        self.writer.root = lxml.etree.fromstring('<rfc><front anchor="intro"/></rfc>')
+        self.assertEqual(get('intro').tag, 'front')
+
 
 class DatatrackerToBibConverterTest(unittest.TestCase):
     """DatatrackerToBibConverter tests"""
@@ -1192,5 +1369,939 @@ class StripLinkAttachmentsTest(unittest.TestCase):
         self.assertNotIn("/home/vader/ds-1/schematics", xml_str)
 
 
+class XmlRfcCopyTest(unittest.TestCase):
+    """XmlRfc.copy() tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        path = 'tests/input/elements.xml'
+        self.parser = xml2rfc.XmlRfcParser(path,
+                                           quiet=True,
+                                           options=default_options,
+                                           **options_for_xmlrfcparser)
+        self.xmlrfc = self.parser.parse()
+
+    def test_copy_has_own_tree(self):
+        xmlrfc = self.xmlrfc.copy()
+        self.assertEqual(xmlrfc.source, self.xmlrfc.source)
+        self.assertIsNot(xmlrfc.tree, self.xmlrfc.tree)
+        xmlrfc.getroot().set('prepTime', '2026-01-01T00:00:00')
+        self.assertIsNone(self.xmlrfc.getroot().get('prepTime'))
+        xmlrfc.pis['toc'] = 'yes'
+        self.assertEqual(self.xmlrfc.pis['toc'], 'no')
+
+
+class ScanRootTest(unittest.TestCase):
+    """XmlRfcParser.scan_root() tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+
+    def test_scan_root(self):
+        text = (b'<?xml version="1.0"?>\n<!DOCTYPE rfc SYSTEM "rfc2629.dtd" [ <!ENTITY X SYSTEM "x.xml"> ]>\n'
+                b'<!-- <rfc number="1"> -->\n<rfc number="9999" version="2"><front><title>&rfc.number;</title></front></rfc>')
+        parser = xml2rfc.XmlRfcParser('', quiet=True, options=default_options, text=text)
+        self.assertEqual(parser.scan_root(), ('9999', '2'))
+        xmlrfc = parser.parse()
+        self.assertEqual(xmlrfc.getroot().find('front/title').text, '9999')
+        parser = xml2rfc.XmlRfcParser('', quiet=True, options=default_options, text=b'<rfc><front>')
+        self.assertEqual(parser.scan_root(), (None, None))
+        parser = xml2rfc.XmlRfcParser('', quiet=True, options=default_options, text=b'<reference number="1"/>')
+        self.assertEqual(parser.scan_root(), (None, None))
+
+
+class ProcessTest(unittest.TestCase):
+    """ Base for tests which render with process() into a temporary directory """
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        self.tmpdir = tempfile.mkdtemp()
+        self.options = copy.deepcopy(default_options)
+        self.options.date = datetime.date(2026, 10, 1)
+        self.options.text = True
+        self.options.quiet = True
+        self.options.output_path = self.tmpdir
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class BatchTest(ProcessTest):
+    """Batch mode tests"""
+
+    def setUp(self):
+        super().setUp()
+        indexes = os.path.join(self.tmpdir, 'indexes.xml')
+        shutil.copyfile('tests/input/indexes.xml', indexes)
+        # An RFC, for which rendering sets options such as options.rfc
+        rfc = os.path.join(self.tmpdir, 'rfc.xml')
+        with open(rfc, 'w') as file:
+            file.write('<rfc version="3" ipr="trust200902" number="9999" category="info" submissionType="IETF">'
+                       '<front><title>Batch Test</title><author fullname="Jane Doe" initials="J." surname="Doe"/>'
+                       '<date year="2026" month="10"/><abstract><t>Abstract.</t></abstract></front>'
+                       '<middle><section><name>Introduction</name><t>Text.</t></section></middle></rfc>')
+        self.bad = os.path.join(self.tmpdir, 'bad.xml')
+        with open(self.bad, 'w') as file:
+            file.write('<rfc><middle>')
+        self.sources = [rfc, self.bad, indexes]
+        self.write_err = xml2rfc.log.write_err
+        xml2rfc.log.write_err = io.StringIO()
+
+    def tearDown(self):
+        xml2rfc.log.write_err = self.write_err
+        super().tearDown()
+
+    def check_batch(self, jobs):
+        self.options.jobs = jobs
+        options = copy.deepcopy(vars(self.options))
+        failures = xml2rfc.run.process_batch(self.sources, self.options)
+        self.assertEqual(failures, [self.bad])
+        summary = xml2rfc.log.write_err.getvalue()
+        self.assertIn('  failed  %s: ' % self.bad, summary)
+        self.assertIn('2 of 3 documents rendered, 1 failed', summary)
+        # Each document is written to its own output file
+        with open(os.path.join(self.tmpdir, 'rfc.txt')) as file:
+            self.assertIn('https://www.rfc-editor.org/info/rfc9999', file.read())
+        with open(os.path.join(self.tmpdir, 'indexes.txt')) as file:
+            text = file.read()
+        self.assertIn('Index', text)
+        self.assertNotIn('rfc9999', text)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'bad.txt')))
+        # The options set while rendering one document don't leak into the next
+        self.assertEqual(vars(self.options), options)
+
+    def test_process_batch(self):
+        self.check_batch(2)
+
+    def test_process_batch_in_process(self):
+        self.check_batch(1)
+
+    def test_batch_exit_status(self):
+        argv = sys.argv
+        sys.argv = ['xml2rfc', '--skip-config', '--batch', '--text', '--quiet', '--jobs', '2'] + self.sources
+        try:
+            with self.assertRaises(SystemExit) as cm:
+                xml2rfc.run.main()
+        finally:
+            sys.argv = argv
+        self.assertEqual(cm.exception.code, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'indexes.txt')))
+
+    def test_expand_batch_sources(self):
+        sources = expand_batch_sources(['tests/input/list_*.xml', 'tests/input/list_format.xml', 'missing.xml'])
+        self.assertEqual(sources, [
+            'tests/input/list_format.xml',
+            'tests/input/list_hanging.xml',
+            'tests/input/list_letters.xml',
+            'missing.xml',
+        ])
+
+
+class RenderTest(unittest.TestCase):
+    """In-memory render API tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        self.options = copy.deepcopy(default_options)
+        self.options.date = datetime.date(2026, 10, 1)
+        self.options.pagination = None
+        with open('tests/input/indexes.xml', 'rb') as file:
+            self.source = file.read()
+
+    def test_render(self):
+        outputs, diagnostics = xml2rfc.render(self.source, ['text', 'info'], options=self.options, name='indexes.xml')
+        self.assertEqual(set(outputs.keys()), set(['text', 'info']))
+        self.assertIn(b'Index', outputs['text'])
+        self.assertIn(b'"sections"', outputs['info'])
+        info = json.loads(outputs['info'].decode('utf-8'))
+        self.assertEqual(info['references'], {'ref0': 1, 'refgroup0': 1})
+
+    def test_render_same_as_file(self):
+        outputs, diagnostics = xml2rfc.render(self.source, ['text'], options=self.options, name='indexes.xml')
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir, 'indexes.xml')
+            with open(source, 'wb') as file:
+                file.write(self.source)
+            options = copy.deepcopy(self.options)
+            options.text = True
+            process(source, options)
+            with open(os.path.join(tmpdir, 'indexes.txt'), 'rb') as file:
+                self.assertEqual(outputs['text'], file.read())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_render_includes(self):
+        source = self.source.replace(b'<middle>', b'<middle><xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="sub/section.xml"/>')
+        includes = {
+            'sub/section.xml': b'<section><name>Included</name><sourcecode src="sub/code.c"/></section>',
+            'sub/code.c': b'int main() { return 0; }',
+        }
+        outputs, diagnostics = xml2rfc.render(source, ['text'], includes=includes, options=self.options)
+        self.assertIn(b'Included', outputs['text'])
+        self.assertIn(b'int main()', outputs['text'])
+        with self.assertRaises(ValueError):
+            xml2rfc.render(source, ['text'], includes={'../section.xml': b''}, options=self.options)
+
+    def test_render_failure(self):
+        outputs, diagnostics = xml2rfc.render(b'<rfc>', ['text'], options=self.options, name='bad.xml')
+        self.assertIsNone(outputs)
+        self.assertIn('Unable to parse the XML document: bad.xml', diagnostics[0])
+
+
+class ServerTest(unittest.TestCase):
+    """Render server tests"""
+
+    def test_request_options(self):
+        server = xml2rfc.server.RenderServer.__new__(xml2rfc.server.RenderServer)
+        server.options = copy.deepcopy(default_options)
+        options = server.request_options({'date': ['2026-10-01'], 'table-borders': ['full']})
+        self.assertEqual(options.date, datetime.date(2026, 10, 1))
+        self.assertEqual(options.table_borders, 'full')
+        with self.assertRaises(xml2rfc.server.RenderError):
+            server.request_options({'allow-local-file-access': ['1']})
+        with self.assertRaises(xml2rfc.server.RenderError) as cm:
+            server.request_options({'table-borders': ['bogus']})
+        self.assertEqual(cm.exception.status, 400)
+
+    def test_unix_socket_path(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'draft.xml')
+            with open(path, 'w') as file:
+                file.write('<rfc/>')
+            options = copy.deepcopy(default_options)
+            options.serve = 'unix:%s' % path
+            with self.assertRaises(SystemExit) as cm:
+                xml2rfc.server.serve(options)
+            self.assertIn('not a socket', cm.exception.code)
+            self.assertTrue(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+def sleeping_render_job(source, formats, options, name):
+    """ A stand-in for xml2rfc.server.render_job() which doesn't finish in time """
+    time.sleep(60)
+
+
+class ServerRenderTest(unittest.TestCase):
+    """Render server request tests, with a running server"""
+
+    @classmethod
+    def setUpClass(cls):
+        xml2rfc.log.quiet = True
+        options = copy.deepcopy(default_options)
+        options.quiet = True
+        options.jobs = 1
+        options.pagination = None
+        cls.renderer = xml2rfc.server.RenderServer(options)
+        cls.httpd = http.server.ThreadingHTTPServer(('localhost', 0), xml2rfc.server.RenderRequestHandler)
+        cls.httpd.renderer = cls.renderer
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+        with open('tests/input/indexes.xml', 'rb') as file:
+            cls.source = file.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.renderer.shutdown()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection('localhost', self.httpd.server_port, timeout=60)
+        try:
+            connection.request(method, path, body=body)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def test_render(self):
+        status, data = self.request('POST', '/render?format=text,info&date=2026-10-01&name=indexes.xml', self.source)
+        self.assertEqual(status, 200)
+        result = json.loads(data)
+        self.assertEqual(set(result['outputs'].keys()), set(['text', 'info']))
+        self.assertIn(b'Index', base64.b64decode(result['outputs']['text']))
+        status, data = self.request('POST', '/render/text?date=2026-10-01', self.source)
+        self.assertEqual(status, 200)
+        self.assertIn(b'Index', data)
+
+    def test_request_errors(self):
+        self.assertEqual(self.request('POST', '/render/bogus', self.source)[0], 400)
+        self.assertEqual(self.request('POST', '/render?name=../x.txt', self.source)[0], 400)
+        self.assertEqual(self.request('POST', '/render?strict=1&allow-local-file-access=1', self.source)[0], 400)
+        self.assertEqual(self.request('POST', '/render', b'')[0], 400)
+        status, data = self.request('POST', '/render?table-borders=bogus', self.source)
+        self.assertEqual(status, 400)
+        self.assertIn('table_borders', json.loads(data)['error'])
+        self.assertEqual(self.request('POST', '/other', self.source)[0], 404)
+        self.assertEqual(self.request('GET', '/other')[0], 404)
+        status, data = self.request('POST', '/render', b'<rfc><unclosed></rfc>')
+        self.assertEqual(status, 422)
+        self.assertIn('diagnostics', json.loads(data))
+
+    def test_busy(self):
+        max_jobs = self.renderer.max_jobs
+        self.renderer.max_jobs = 0
+        try:
+            status, data = self.request('POST', '/render', self.source)
+        finally:
+            self.renderer.max_jobs = max_jobs
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(data)['error'], 'Too many queued render jobs, try again later')
+
+    def test_internal_error(self):
+        def fail(*args):
+            raise ValueError('Unexpected failure')
+        self.renderer.request_options = fail
+        try:
+            status, data = self.request('POST', '/render', self.source)
+        finally:
+            del self.renderer.request_options
+        self.assertEqual(status, 500)
+        self.assertIn('Unexpected failure', json.loads(data)['error'])
+
+    def test_timeout(self):
+        render_job = xml2rfc.server.render_job
+        pool = self.renderer.pool
+        start_pool = self.renderer.start_pool
+        def restore_and_start_pool():
+            # New workers must not inherit the stand-in
+            xml2rfc.server.render_job = render_job
+            return start_pool()
+        xml2rfc.server.render_job = sleeping_render_job
+        self.renderer.start_pool = restore_and_start_pool
+        self.renderer.options.render_timeout = 1
+        try:
+            status, data = self.request('POST', '/render', self.source)
+        finally:
+            xml2rfc.server.render_job = render_job
+            del self.renderer.start_pool
+            self.renderer.options.render_timeout = 300
+        self.assertEqual(status, 504)
+        # The stuck worker has been replaced
+        self.assertIsNot(self.renderer.pool, pool)
+        self.assertEqual(self.request('GET', '/health')[0], 200)
+        self.assertEqual(self.request('POST', '/render/text', self.source)[0], 200)
+
+    def test_broken_pool(self):
+        # A worker process which dies breaks the pool
+        with self.assertRaises(concurrent.futures.process.BrokenProcessPool):
+            self.renderer.pool.submit(os._exit, 1).result()
+        # The pool can't be restarted: the failure is reported by /health
+        start_pool = self.renderer.start_pool
+        def fail():
+            raise OSError('No more processes')
+        self.renderer.start_pool = fail
+        try:
+            self.assertEqual(self.request('POST', '/render', self.source)[0], 500)
+            status, data = self.request('GET', '/health')
+            self.assertEqual(status, 503)
+            self.assertEqual(json.loads(data)['status'], 'broken')
+        finally:
+            self.renderer.start_pool = start_pool
+        # The pool is restarted on the next request
+        self.assertEqual(self.request('POST', '/render/text', self.source)[0], 200)
+        self.assertEqual(self.request('GET', '/health')[0], 200)
+        self.assertEqual(self.request('POST', '/render/text', self.source)[0], 200)
+
+
+class BuildCacheTest(ProcessTest):
+    """Build cache tests"""
+
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.tmpdir, 'indexes.xml')
+        shutil.copyfile('tests/input/indexes.xml', self.source)
+        self.options.build_cache = os.path.join(self.tmpdir, 'cache')
+        self.output = os.path.join(self.tmpdir, 'indexes.txt')
+
+    def test_cache_hit(self):
+        process(self.source, copy.deepcopy(self.options))
+        with open(self.output, 'rb') as file:
+            text = file.read()
+        os.unlink(self.output)
+        cache = xml2rfc.buildcache.BuildCache(self.options.build_cache)
+        self.assertEqual(len(cache.entries()), 1)
+        key = cache.key(self.source, self.options)
+        manifest = cache.get(key, self.source, [('text', self.output)], self.options)
+        self.assertEqual(manifest['diagnostics'], '')
+        with open(self.output, 'rb') as file:
+            self.assertEqual(file.read(), text)
+
+    def test_cache_miss(self):
+        cache = xml2rfc.buildcache.BuildCache(self.options.build_cache)
+        key = cache.key(self.source, self.options)
+        process(self.source, copy.deepcopy(self.options))
+        self.options.date = datetime.date(2026, 10, 2)
+        self.assertNotEqual(cache.key(self.source, self.options), key)
+        self.options.no_build_cache = True
+        process(self.source, copy.deepcopy(self.options))
+        self.assertEqual(len(cache.entries()), 1)
+
+    def test_evict(self):
+        process(self.source, copy.deepcopy(self.options))
+        cache = xml2rfc.buildcache.BuildCache(self.options.build_cache, max_size=1)
+        cache.evict()
+        self.assertEqual(cache.entries(), [])
+
+
+class WatchTest(ProcessTest):
+    """Watch mode tests"""
+
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.tmpdir, 'draft.xml')
+        self.include = os.path.join(self.tmpdir, 'section.xml')
+        with open('tests/input/indexes.xml') as file:
+            xml = file.read()
+        with open(self.source, 'w') as file:
+            file.write(xml.replace('<middle>', '<middle><xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="section.xml"/>'))
+        with open(self.include, 'w') as file:
+            file.write('<section><name>Included</name><t>Included text.</t></section>')
+        self.options.allow_local_file_access = True
+
+    def test_watched_files(self):
+        resources = process(self.source, copy.deepcopy(self.options))
+        self.assertIn(self.include, [ r['path'] for r in resources.values() ])
+        mtimes = get_mtimes([self.source, self.include])
+        os.utime(self.include, ns=(0, 0))
+        self.assertNotEqual(get_mtimes([self.source, self.include]), mtimes)
+
+    def test_watch(self):
+        output = os.path.join(self.tmpdir, 'draft.txt')
+        # After each render, change the include file: break it, fix it, and stop
+        changes = [
+            '<section><name>Included</name><t>Broken',
+            '<section><name>Included</name><t>Fixed text.</t></section>',
+            None,
+        ]
+        outputs = []
+        checks = []
+        def render(source, options):
+            del checks[:]
+            try:
+                return process(source, options)
+            finally:
+                if os.path.exists(output):
+                    with open(output) as file:
+                        outputs.append(file.read())
+                    os.unlink(output)
+                else:
+                    outputs.append(None)
+        def get_mtimes_and_change(paths):
+            # The first call after a render gets the mtimes to compare with
+            checks.append(paths)
+            if len(checks) == 2:
+                change = changes[len(outputs)-1]
+                if change is None:
+                    raise KeyboardInterrupt
+                with open(self.include, 'w') as file:
+                    file.write(change)
+                os.utime(self.include, ns=(len(outputs)*10**9, len(outputs)*10**9))
+            return get_mtimes(paths)
+        saved = xml2rfc.run.process, xml2rfc.run.get_mtimes, xml2rfc.run.WATCH_INTERVAL, xml2rfc.log.write_err
+        xml2rfc.run.process, xml2rfc.run.get_mtimes, xml2rfc.run.WATCH_INTERVAL = render, get_mtimes_and_change, 0
+        xml2rfc.log.write_err = io.StringIO()
+        try:
+            xml2rfc.run.watch(self.source, self.options)
+            errors = xml2rfc.log.write_err.getvalue()
+        finally:
+            xml2rfc.run.process, xml2rfc.run.get_mtimes, xml2rfc.run.WATCH_INTERVAL, xml2rfc.log.write_err = saved
+        self.assertEqual(len(outputs), 3)
+        self.assertIn('Included text.', outputs[0])
+        # The failed render is reported, and the files of the last good
+        # render are still watched
+        self.assertIsNone(outputs[1])
+        self.assertIn('XInclude processing failed', errors)
+        self.assertIn('Fixed text.', outputs[2])
+
+
+class TimingsTest(ProcessTest):
+    """Stage timings tests"""
+
+    def test_json_report(self):
+        self.options.timings = 'json'
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            process('tests/input/indexes.xml', self.options)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['source'], 'tests/input/indexes.xml')
+        stages = dict( (s['stage'], s) for s in report['stages'] )
+        for stage in ['total', 'total/parse', 'total/prep/preptool/element_xref', 'total/text/render']:
+            self.assertIn(stage, stages)
+        self.assertEqual(report['stages'][0]['stage'], 'total')
+        self.assertGreaterEqual(stages['total']['wall'], stages['total/text']['wall'])
+        self.assertFalse(xml2rfc.timings.enabled)
+
+    def test_disabled(self):
+        xml2rfc.timings.stages.clear()
+        process('tests/input/indexes.xml', self.options)
+        self.assertEqual(xml2rfc.timings.stages, {})
+
+
+class RenderProfileTest(ProcessTest):
+    """Render profile tests"""
+
+    def test_table(self):
+        self.options.render_profile = 'table'
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            process('tests/input/indexes.xml', self.options)
+        lines = stderr.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Render profile for tests/input/indexes.xml, text:')
+        rows = dict( (l.split()[0], l.split()[1:]) for l in lines[2:] )
+        self.assertIn('render_rfc', rows)
+        self.assertEqual(rows['render_rfc'][:2], ['1', '1'])
+
+    def test_stacks(self):
+        self.options.render_profile = 'stacks'
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            process('tests/input/indexes.xml', self.options)
+        stacks = [ l.rsplit(' ', 1) for l in stdout.getvalue().splitlines() ]
+        self.assertIn('text;render_rfc;render_middle;render_section', [ s for s, t in stacks ])
+        for stack, usecs in stacks:
+            self.assertTrue(stack.startswith('text;render_'))
+            self.assertTrue(usecs.isdigit())
+
+
+class ScriptsTest(unittest.TestCase):
+    """Unicode script table tests"""
+
+    def test_concurrent_init(self):
+        xml2rfc.scripts.scripts = None
+        init = xml2rfc.scripts.init
+        tables = []
+        def counting_init():
+            init()
+            tables.append(xml2rfc.scripts.scripts)
+        xml2rfc.scripts.init = counting_init
+        try:
+            with concurrent.futures.ThreadPoolExecutor(8) as pool:
+                results = list(pool.map(xml2rfc.scripts.get_scripts, ['abc \u0391\u0392\u0393'] * 8))
+        finally:
+            xml2rfc.scripts.init = init
+        self.assertEqual(len(tables), 1)
+        for result in results:
+            self.assertEqual(result, set(['Latin', 'Common', 'Greek']))
+
+
+class SchemaRegistryTest(unittest.TestCase):
+    """Schema registry tests"""
+
+    def test_shared(self):
+        for name in xml2rfc.schemas.SCHEMA_FILES:
+            self.assertIs(xml2rfc.schemas.get_schema(name), xml2rfc.schemas.get_schema(name))
+
+    def test_validate(self):
+        ref = lxml.etree.fromstring('<reference anchor="foo"><front><title>Foo</title><author/><date/></front></reference>')
+        self.assertTrue(xml2rfc.schemas.validate('reference', ref))
+        ref.set('bar', 'baz')
+        self.assertFalse(xml2rfc.schemas.validate('reference', ref))
+        with self.assertRaises(lxml.etree.DocumentInvalid) as cm:
+            xml2rfc.schemas.assert_valid('reference', ref)
+        self.assertIn('bar', cm.exception.error_log.last_error.message)
+
+    def test_verdict_cache(self):
+        source = '<reference anchor="foo"><front><title>Foo</title><author/><date/></front></reference>'
+        ref = lxml.etree.fromstring(source)
+        verdict = ('reference', xml2rfc.schemas.tree_digest(ref))
+        xml2rfc.schemas.verdicts.discard(verdict)
+        xml2rfc.schemas.assert_valid('reference', ref)
+        self.assertNotIn(verdict, xml2rfc.schemas.verdicts)
+        xml2rfc.schemas.assert_valid('reference', ref, cache=True)
+        self.assertIn(verdict, xml2rfc.schemas.verdicts)
+        # The same content, parsed again
+        self.assertEqual(xml2rfc.schemas.tree_digest(lxml.etree.fromstring(source)), verdict[1])
+        # Invalid verdicts are not kept
+        ref.set('bar', 'baz')
+        for i in range(2):
+            with self.assertRaises(lxml.etree.DocumentInvalid):
+                xml2rfc.schemas.assert_valid('reference', ref, cache=True)
+        self.assertNotIn(('reference', xml2rfc.schemas.tree_digest(ref)), xml2rfc.schemas.verdicts)
+
+
+class ReferenceFetchTest(unittest.TestCase):
+    """Reference prefetch and cache tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        self.delay = [ 0 ]
+        self.delays = {}
+        paths = self.paths
+        delay = self.delay
+        delays = self.delays
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(delays.get(self.path, delay[0]))
+                super().do_GET()
+            def log_message(self, *args):
+                paths.append(self.path)
+        handler = functools.partial(Handler, directory=self.tmpdir)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%s/' % self.server.server_address[1]
+        for name in ['T.1', 'T.2']:
+            with open(os.path.join(self.tmpdir, 'reference.%s.xml' % name), 'w') as file:
+                file.write('<reference anchor="%s"><front><title>%s</title><author/><date/></front></reference>' % (name, name))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_requests(self):
+        text = b"""<!DOCTYPE rfc [ <!ENTITY T1 SYSTEM "http://example.com/a.xml"> <!ENTITY T2 SYSTEM "c.xml"> ]>
+            &T1; <?rfc include="reference.RFC.2119"?> <xi:include href='sub/b.xml'/>"""
+        self.assertEqual(xml2rfc.parser.find_requests(text, '/doc/draft.xml'), [
+            ('http://example.com/a.xml', False), ('/doc/sub/b.xml', False), ('reference.RFC.2119', True), ])
+        self.assertEqual(xml2rfc.parser.find_requests(text, 'http://example.com/x/draft.xml')[1],
+            ('http://example.com/x/sub/b.xml', False))
+
+    def test_prefetch(self):
+        source = os.path.join(self.tmpdir, 'draft.xml')
+        with open(source, 'w') as file:
+            file.write('<!DOCTYPE rfc [ <!ENTITY T1 SYSTEM "%sreference.T.1.xml"> ]>'
+                       '<rfc xmlns:xi="http://www.w3.org/2001/XInclude"><back><references>&T1;<xi:include href="refs.xml"/>'
+                       '</references></back></rfc>' % self.url)
+        with open(os.path.join(self.tmpdir, 'refs.xml'), 'w') as file:
+            file.write('<xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="%sreference.T.2.xml"/>' % self.url)
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        options.allow_local_file_access = True
+        parser = xml2rfc.XmlRfcParser(source, quiet=True, options=options)
+        parser.prefetch()
+        self.assertEqual(sorted(self.paths), ['/reference.T.1.xml', '/reference.T.2.xml'])
+        cached = [ f for f in os.listdir(os.path.join(options.cache, xml2rfc.CACHE_PREFIX)) if f.endswith('.xml') ]
+        self.assertEqual(sorted(cached), ['reference.T.1.xml', 'reference.T.2.xml'])
+        # Parsing uses the cached references
+        parser.parse()
+        self.assertEqual(len(self.paths), 2)
+
+    def test_unreachable(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        self.server.server_close()
+        self.assertEqual(resolver.cache(self.url + 'reference.T.1.xml'), '')
+        netloc = '127.0.0.1:%s' % self.server.server_address[1]
+        reason = resolver.unreachable[netloc]
+        self.assertTrue(reason.startswith('host %s unreachable: Failed to establish a new connection: ' % netloc), reason)
+        self.assertNotIn('reference.T.1.xml', reason)
+        # Not tried again
+        resolver.get_session = None
+        self.assertEqual(resolver.cache(self.url + 'reference.T.2.xml'), '')
+        # Nor added to the negative cache, as the failure may be transient
+        index = resolver.get_write_index()
+        self.assertIsNone(index.get_miss(self.url + 'reference.T.1.xml'))
+        self.assertIsNone(index.get_miss(self.url + 'reference.T.2.xml'))
+
+    def test_revalidate(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        path = resolver.cache(self.url + 'reference.T.1.xml')
+        self.assertTrue(resolver.read_cache_metadata(path)['last_modified'])
+        # Too old to be used while refreshed
+        old = time.time() - xml2rfc.parser.CACHE_STALE_SECS - 60
+        os.utime(path, (old, old))
+        self.assertEqual(resolver.cache(self.url + 'reference.T.1.xml'), path)
+        self.assertGreater(os.path.getmtime(path), old + 60)
+        self.assertEqual(len(self.paths), 2)
+
+    def test_refresh_in_background(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        path = resolver.cache(self.url + 'reference.T.1.xml')
+        old = time.time() - xml2rfc.parser.CACHE_REFRESH_SECS - 60
+        os.utime(path, (old, old))
+        self.assertEqual(resolver.cache(self.url + 'reference.T.1.xml'), path)
+        for thread in threading.enumerate():
+            if thread.name == 'cache refresh':
+                thread.join()
+        self.assertGreater(os.path.getmtime(path), old + 60)
+        self.assertEqual(len(self.paths), 2)
+
+    def test_cache_index(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        path = resolver.cache(self.url + 'reference.T.1.xml')
+        entry = resolver.read_cache_metadata(path)
+        self.assertEqual(entry['url'], self.url + 'reference.T.1.xml')
+        self.assertEqual(entry['root'], 'reference')
+        self.assertTrue(entry['valid'])
+        self.assertEqual(entry['sha256'], file_sha256(path))
+        # A hit doesn't validate the cached file again
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        resolver.validate_ref = None
+        self.assertEqual(resolver.cache(self.url + 'reference.T.1.xml'), path)
+        # A cached file changed by someone else is validated again, and
+        # fetched again if it's invalid
+        with open(path, 'w') as file:
+            file.write('<reference anchor="T.1"/>')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        self.assertEqual(resolver.cache(self.url + 'reference.T.1.xml'), path)
+        self.assertEqual(len(self.paths), 2)
+        self.assertTrue(resolver.read_cache_metadata(path)['valid'])
+
+    def test_probe_subdirs(self):
+        for name in ['T.3', 'T.4']:
+            os.makedirs(os.path.join(self.tmpdir, 'bibxml-ids'), exist_ok=True)
+            with open(os.path.join(self.tmpdir, 'bibxml-ids', 'reference.%s.xml' % name), 'w') as file:
+                file.write('<reference anchor="%s"><front><title>%s</title><author/><date/></front></reference>' % (name, name))
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options, library_dirs=[], network_locs=[self.url])
+        path = resolver.getReferenceRequest('reference.T.3', include=True)
+        self.assertEqual(os.path.basename(path), 'reference.T.3.xml')
+        self.assertEqual(self.paths[0], '/bibxml/reference.T.3.xml')
+        self.assertIn('/bibxml-ids/reference.T.3.xml', self.paths)
+        # The subdirectory is learned for the name prefix
+        self.assertEqual(resolver.get_subdirs('reference.T.4.xml')[0], 'bibxml-ids')
+        resolver = xml2rfc.parser.CachingResolver(options=options, library_dirs=[], network_locs=[self.url])
+        resolver.getReferenceRequest('reference.T.4', include=True)
+        self.assertEqual([ p for p in self.paths if 'T.4' in p ], ['/bibxml-ids/reference.T.4.xml'])
+
+    def test_probe_messages(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        candidates = [ (subdir, self.url + subdir + '/reference.T.1.xml') for subdir in ['a', 'b', 'c'] ]
+        candidates[1] = ('b', self.url + 'reference.T.1.xml')
+        self.delays['/c/reference.T.1.xml'] = 0.5
+        saved = xml2rfc.log.write_err, xml2rfc.log.quiet, xml2rfc.log.verbose
+        xml2rfc.log.write_err, xml2rfc.log.quiet, xml2rfc.log.verbose = io.StringIO(), False, True
+        try:
+            self.assertTrue(resolver.probe(candidates, 'reference.T.1.xml'))
+            messages = xml2rfc.log.write_err.getvalue()
+            time.sleep(0.7)
+            # The probe which lost has finished, without logging anything
+            self.assertIn('/c/reference.T.1.xml', self.paths)
+            self.assertEqual(xml2rfc.log.write_err.getvalue(), messages)
+        finally:
+            xml2rfc.log.write_err, xml2rfc.log.quiet, xml2rfc.log.verbose = saved
+        # The messages are those of the candidates up to the winner, in order
+        self.assertLess(messages.index(candidates[0][1]), messages.index(candidates[1][1]))
+        self.assertNotIn(candidates[2][1], messages)
+
+    def test_negative_cache(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        url = self.url + 'reference.T.9.xml'
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        self.assertEqual(resolver.cache(url), '')
+        requests = len(self.paths)
+        # Not tried again
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        self.assertEqual(resolver.cache(url), '')
+        self.assertEqual(len(self.paths), requests)
+        self.assertEqual(resolver.negative, set([url]))
+        # Unless asked to
+        with open(os.path.join(self.tmpdir, 'reference.T.9.xml'), 'w') as file:
+            file.write('<reference anchor="T.9"><front><title>T.9</title><author/><date/></front></reference>')
+        options.refresh_negative = True
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        self.assertTrue(resolver.cache(url))
+        self.assertGreater(len(self.paths), requests)
+        self.assertIsNone(resolver.get_write_index().get_miss(url))
+
+    def test_single_flight(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        self.delay[0] = 0.2
+        results = []
+        def fetch():
+            resolver = xml2rfc.parser.CachingResolver(options=options)
+            results.append(resolver.cache(self.url + 'reference.T.1.xml'))
+        threads = [ threading.Thread(target=fetch) for i in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        self.assertTrue(os.path.exists(results[0]))
+        self.assertEqual(self.paths, ['/reference.T.1.xml'])
+
+    def test_cache_stats(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        path = resolver.cache(self.url + 'reference.T.1.xml')
+        resolver.cache(self.url + 'reference.T.1.xml')
+        index = resolver.get_write_index()
+        index.flush()
+        self.assertEqual(index.stats(), {'hits': 1, 'misses': 1, 'negative': 0})
+        self.assertEqual(index.get(os.path.basename(path))['hits'], 1)
+
+    def test_batch_cache_stats(self):
+        sources = []
+        for n in (1, 2):
+            source = os.path.join(self.tmpdir, 'draft-%s.xml' % n)
+            with open(source, 'w') as file:
+                file.write('<!DOCTYPE rfc [ <!ENTITY T1 SYSTEM "%sreference.T.1.xml"> ]>'
+                           '<rfc><back><references>&T1;</references></back></rfc>' % self.url)
+            sources.append(source)
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        options.text = True
+        options.quiet = True
+        options.jobs = 2
+        options.prefetch_jobs = 0
+        with contextlib.redirect_stderr(io.StringIO()):
+            xml2rfc.run.process_batch(sources, options)
+        # The pool workers have written their hits and misses to the index
+        index = xml2rfc.cacheindex.CacheIndex(os.path.join(options.cache, xml2rfc.CACHE_PREFIX))
+        self.assertTrue(index.open())
+        stats = index.stats()
+        self.assertEqual(stats.get('hits', 0) + stats.get('misses', 0), 4)
+
+    def test_evict_cache(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options)
+        paths = [ resolver.cache(self.url + 'reference.T.%s.xml' % n) for n in (1, 2) ]
+        sizes = [ os.path.getsize(path) for path in paths ]
+        # Recently used entries are kept
+        self.assertEqual(resolver.evict_cache(0), (0, 0))
+        index = resolver.get_write_index()
+        for i, path in enumerate(paths):
+            entry = index.get(os.path.basename(path))
+            entry['used'] = time.time() - xml2rfc.parser.CACHE_EVICT_GRACE_SECS - 100 + i
+            index.put(entry)
+        # The least recently used entry goes first
+        self.assertEqual(resolver.evict_cache(sizes[1]), (1, sizes[0]))
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertIsNone(index.get(os.path.basename(paths[0])))
+
+    def test_warm_cache(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        parser = xml2rfc.XmlRfcParser('', quiet=True, options=options, text=b'')
+        parser.prefetch(requests=[ (self.url + 'reference.T.%s.xml' % n, False) for n in (1, 2) ])
+        self.assertEqual(sorted(self.paths), ['/reference.T.1.xml', '/reference.T.2.xml'])
+        cached = [ f for f in os.listdir(os.path.join(options.cache, xml2rfc.CACHE_PREFIX)) if f.endswith('.xml') ]
+        self.assertEqual(sorted(cached), ['reference.T.1.xml', 'reference.T.2.xml'])
+
+class BundleTest(unittest.TestCase):
+    """Offline bibxml bundle tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        self.tmpdir = tempfile.mkdtemp()
+        self.members = {
+            'bibxml/reference.T.1.xml': b'<reference anchor="T.1"><front><title>T.1</title><author/><date/></front></reference>',
+            'bibxml-ids/reference.T.2.xml': b'<reference anchor="T.2"><front><title>T.2</title><author/><date/></front></reference>',
+        }
+        self.zip = os.path.join(self.tmpdir, 'bibxml.zip')
+        with zipfile.ZipFile(self.zip, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.members.items():
+                archive.writestr(name, data)
+        self.tar = os.path.join(self.tmpdir, 'bibxml.tar')
+        with tarfile.open(self.tar, 'w') as archive:
+            for name, data in self.members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        for path in [ self.zip, self.tar ]:
+            bundle = xml2rfc.bundle.get_bundle(path)
+            self.assertTrue(os.path.exists(path + xml2rfc.bundle.INDEX_SUFFIX))
+            for name, data in self.members.items():
+                self.assertEqual(bundle.read(name), data)
+                self.assertEqual(xml2rfc.bundle.read(bundle.find(name)), data)
+            self.assertIsNone(bundle.find('bibxml/reference.T.3.xml'))
+        self.assertIsNone(xml2rfc.bundle.get_bundle(self.tmpdir))
+
+    def test_resolve(self):
+        options = copy.deepcopy(default_options)
+        options.cache = os.path.join(self.tmpdir, 'cache')
+        resolver = xml2rfc.parser.CachingResolver(options=options, library_dirs=[self.zip], no_network=True)
+        self.assertEqual(resolver.getReferenceRequest('reference.T.2', include=True),
+            self.zip + '!/bibxml-ids/reference.T.2.xml')
+        self.assertEqual(resolver.getReferenceRequest('https://bib.ietf.org/public/rfc/bibxml/reference.T.1.xml'),
+            self.zip + '!/bibxml/reference.T.1.xml')
+        source = os.path.join(self.tmpdir, 'draft.xml')
+        with open(source, 'w') as file:
+            file.write('<!DOCTYPE rfc [ <!ENTITY T1 SYSTEM "https://bib.ietf.org/public/rfc/bibxml/reference.T.1.xml"> ]>'
+                       '<rfc><back><references>&T1;</references></back></rfc>')
+        options.no_network = True
+        parser = xml2rfc.XmlRfcParser(source, quiet=True, options=options, library_dirs=self.tar)
+        xmlrfc = parser.parse()
+        self.assertEqual(xmlrfc.getroot().find('.//reference/front/title').text, 'T.1')
+
+class LockfileTest(unittest.TestCase):
+    """Reference lockfile tests"""
+
+    def setUp(self):
+        xml2rfc.log.quiet = True
+        self.tmpdir = tempfile.mkdtemp()
+        self.library = os.path.join(self.tmpdir, 'lib')
+        os.mkdir(self.library)
+        with open(os.path.join(self.tmpdir, 'ref1.xml'), 'w') as file:
+            file.write('<reference anchor="T.1"><front><title>T.1</title><author/><date/></front></reference>')
+        with open(os.path.join(self.library, 'reference.T.2.xml'), 'w') as file:
+            file.write('<reference anchor="T.2"><front><title>T.2</title><author/><date/></front></reference>')
+        self.source = os.path.join(self.tmpdir, 'draft.xml')
+        with open(self.source, 'w') as file:
+            file.write('<!DOCTYPE rfc [ <!ENTITY T1 SYSTEM "ref1.xml"> ]>'
+                       '<rfc><back><references>&T1;<?rfc include="reference.T.2"?></references></back></rfc>')
+        self.options = copy.deepcopy(default_options)
+        self.options.cache = os.path.join(self.tmpdir, 'cache')
+        self.options.allow_local_file_access = True
+        self.options.no_network = True
+        self.lockfile = os.path.join(self.tmpdir, 'draft' + xml2rfc.lockfile.LOCKFILE_SUFFIX)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def titles(self, xmlrfc):
+        return [ e.text for e in xmlrfc.getroot().findall('.//reference/front/title') ]
+
+    def test_locked(self):
+        parser = xml2rfc.XmlRfcParser(self.source, quiet=True, options=self.options, library_dirs=self.library)
+        self.assertEqual(self.titles(parser.parse()), ['T.1', 'T.2'])
+        xml2rfc.lockfile.write(self.lockfile, parser.resources)
+        # The resources are no longer needed
+        os.unlink(os.path.join(self.tmpdir, 'ref1.xml'))
+        shutil.rmtree(self.library)
+        locked = xml2rfc.lockfile.Lockfile(self.lockfile)
+        self.assertEqual(sorted(locked.entries), [os.path.join(self.tmpdir, 'ref1.xml'), 'reference.T.2'])
+        self.options.allow_local_file_access = False
+        parser = xml2rfc.XmlRfcParser(self.source, quiet=True, options=self.options, locked=locked)
+        self.assertEqual(self.titles(parser.parse()), ['T.1', 'T.2'])
+        self.assertEqual(sorted(parser.resources), sorted(locked.entries))
+
+    def test_not_locked(self):
+        xml2rfc.lockfile.write(self.lockfile, {})
+        parser = xml2rfc.XmlRfcParser(self.source, quiet=True, options=self.options, library_dirs=self.library,
+                                      locked=xml2rfc.lockfile.Lockfile(self.lockfile))
+        with self.assertRaises(xml2rfc.parser.XmlRfcError) as context:
+            parser.parse()
+        self.assertIn('not in the lockfile', str(context.exception))
+
+    def test_tampered(self):
+        parser = xml2rfc.XmlRfcParser(self.source, quiet=True, options=self.options, library_dirs=self.library)
+        parser.parse()
+        xml2rfc.lockfile.write(self.lockfile, parser.resources)
+        with open(self.lockfile) as file:
+            content = file.read()
+        with open(self.lockfile, 'w') as file:
+            file.write(content.replace('T.1</title>', 'T.9</title>'))
+        with self.assertRaises(xml2rfc.lockfile.LockfileError):
+            xml2rfc.lockfile.Lockfile(self.lockfile)
+
+
 if __name__ == '__main__':
     unittest.main()
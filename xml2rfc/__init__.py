@@ -13,11 +13,10 @@ V3_PI_TARGET = 'v3xml2rfc'
 
 from xml2rfc.parser import  XmlRfcError, CachingResolver, XmlRfcParser, XmlRfc
 
-from xml2rfc.writers import ( BaseRfcWriter, RawTextRfcWriter, PaginatedTextRfcWriter,
-	 HtmlRfcWriter, NroffRfcWriter, ExpandedXmlWriter, RfcWriterError,
-         V2v3XmlWriter, PrepToolWriter, TextWriter, HtmlWriter, PdfWriter,
-         ExpandV3XmlWriter, UnPrepWriter, DocWriter, DatatrackerToBibConverter,
-     )
+from xml2rfc import writers
+from xml2rfc.writers import BaseRfcWriter, RfcWriterError
+
+from xml2rfc.api import render
 
 # This defines what 'from xml2rfc import *' actually imports:
 __all__ = ['XmlRfcError', 'CachingResolver', 'XmlRfcParser', 'XmlRfc',
@@ -25,22 +24,43 @@ __all__ = ['XmlRfcError', 'CachingResolver', 'XmlRfcParser', 'XmlRfc',
            'HtmlRfcWriter', 'NroffRfcWriter', 'ExpandedXmlWriter',
            'RfcWriterError', 'V2v3XmlWriter', 'PrepToolWriter', 'TextWriter',
            'HtmlWriter', 'PdfWriter', 'ExpandV3XmlWriter', 'UnPrepWriter', 
-           'DocWriter', 'DatatrackerToBibConverter',
+           'DocWriter', 'DatatrackerToBibConverter', 'render',
        ]
 
-try:
-    import weasyprint
-    HAVE_WEASYPRINT = True
-except (ImportError, OSError, ValueError):
-    weasyprint = False
-    HAVE_WEASYPRINT = False
-try:
-    from weasyprint.text.ffi import pango
-    HAVE_PANGO = True
-    PANGO_VERSION = pango.pango_version
-except (ImportError, OSError, AttributeError):
-    HAVE_PANGO = False
-    PANGO_VERSION = None
+def get_pdf_libs():
+    """ Import weasyprint and its pango bindings, if available
+
+        This is slow, so is done only when the values are first used (see
+        __getattr__() below), rather than at import time.
+    """
+    try:
+        import weasyprint
+        have_weasyprint = True
+    except (ImportError, OSError, ValueError):
+        weasyprint = False
+        have_weasyprint = False
+    try:
+        from weasyprint.text.ffi import pango
+        have_pango = True
+        pango_version = pango.pango_version
+    except (ImportError, OSError, AttributeError):
+        have_pango = False
+        pango_version = None
+    return {
+        'weasyprint': weasyprint,
+        'HAVE_WEASYPRINT': have_weasyprint,
+        'HAVE_PANGO': have_pango,
+        'PANGO_VERSION': pango_version,
+    }
+
+def __getattr__(name):
+    # The writers, and the PDF libraries, are loaded when first used
+    if name in writers.writer_modules:
+        return getattr(writers, name)
+    if name in ['weasyprint', 'HAVE_WEASYPRINT', 'HAVE_PANGO', 'PANGO_VERSION', ]:
+        globals().update(get_pdf_libs())
+        return globals()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def get_versions():
@@ -0,0 +1,199 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" In-memory render API
+
+    Renders a document given as bytes to the v3 output formats, returning
+    the outputs as bytes, without writing to the file system:
+
+      >>> import xml2rfc
+      >>> outputs, diagnostics = xml2rfc.render(source, formats=['text', 'html'],
+      ...                                       includes={'section.xml': data})
+
+    Files included by the document with xi:include, entity declarations, or
+    the src attribute of <artwork> and <sourcecode> are looked up in the
+    includes dictionary, by path relative to the document.  References are
+    resolved through the reference cache, as for the command line.
+"""
+
+import copy
+import datetime
+import io
+import json
+import posixpath
+
+import lxml.etree
+
+import xml2rfc
+import xml2rfc.log
+
+from xml2rfc.utils import get_target_usage
+from xml2rfc.writers.base import default_options
+
+
+# Output formats, in the order they are produced, with their output file
+# extension and content type
+FORMATS = {
+    'expand':   ('.exp.xml',      'application/xml'),
+    'v2v3':     ('.v2v3.xml',     'application/xml'),
+    'prepped':  ('.prepped.xml',  'application/xml'),
+    'text':     ('.txt',          'text/plain; charset=utf-8'),
+    'html':     ('.html',         'text/html; charset=utf-8'),
+    'pdf':      ('.pdf',          'application/pdf'),
+    'info':     ('.json',         'application/json'),
+}
+
+
+def extract_anchor_info(xml):
+    info = {
+        'version': 1,
+        'sections': {},
+        'references': {},
+        }
+    for item in xml.xpath('./middle//section'):
+        anchor = item.get('anchor')
+        label  = item.get('pn')
+        if anchor and label and not anchor.startswith('anchor-'):
+            info['sections'][anchor] = label.replace('section-','')
+    # The number of citations of each reference
+    usage = get_target_usage(xml)
+    for item in xml.xpath('./back//references/reference|./back//references/referencegroup'):
+        anchor = item.get('anchor')
+        if anchor:
+            info['references'][anchor] = len(usage.get(anchor, []))
+    return info
+
+def get_prepped_xmlrfc(parser, options):
+    """ Parse the source, convert it to v3 and run the preptool on it
+
+        Already prepped input is returned as parsed.  The result is shared by
+        all the v3 formatters, which should each be given their own copy of
+        it (see XmlRfc.copy()).
+    """
+    xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+    if not xmlrfc.tree.getroot().get('prepTime'):
+        v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
+        xmlrfc.tree = v2v3.convert2to3()
+        prep = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date, liberal=True, keep_pis=[xml2rfc.V3_PI_TARGET])
+        xmlrfc.tree = prep.prep()
+    return xmlrfc
+
+def normalize_includes(includes):
+    """ Return the includes with their names normalized, see get_include() """
+    normalized = {}
+    for name, data in (includes or {}).items():
+        path = posixpath.normpath(name.replace('\\', '/'))
+        if path.startswith('../') or path.startswith('/'):
+            raise ValueError('Expected an include file name relative to the document, but found "%s"' % name)
+        normalized[path] = data
+    return normalized
+
+def render(source, formats=['text'], includes=None, options=None, name='draft.xml'):
+    """ Render a document held in memory
+
+        source      The document source, as bytes
+        formats     A list of output formats, from FORMATS
+        includes    A dictionary of the content of included files, as bytes,
+                    keyed by path relative to the document
+        options     The options to use, as from the command line; defaults to
+                    xml2rfc.writers.base.default_options.  Not modified.
+        name        The file name of the document, used in messages and to
+                    resolve relative include paths
+
+        Returns a dictionary of output bytes by format, or None if the
+        document could not be rendered, and a list of diagnostic messages.
+
+        Diagnostics are collected by redirecting xml2rfc.log while
+        rendering, so concurrent renders should use separate processes.
+    """
+    for fmt in formats:
+        if not fmt in FORMATS:
+            raise ValueError('Unknown format "%s", expected one of %s' % (fmt, ', '.join(FORMATS)))
+    includes = normalize_includes(includes)
+    options = copy.deepcopy(options or default_options)
+    if not options.date:
+        options.date = datetime.date.today()
+    # Anything else would write files beside the output
+    options.external_css = False
+    options.external_js = False
+    options.legacy = False
+
+    diagnostics = io.StringIO()
+    write_err = xml2rfc.log.write_err
+    xml2rfc.log.write_err = diagnostics
+    try:
+        outputs = render_formats(source, formats, includes, options, name)
+    except xml2rfc.parser.XmlRfcError as e:
+        xml2rfc.log.exception('Unable to parse the XML document: ' + name, e)
+        outputs = None
+    except lxml.etree.XMLSyntaxError as e:
+        xml2rfc.log.exception('Unable to parse the XML document: ' + name, e.error_log)
+        outputs = None
+    except xml2rfc.RfcWriterError as e:
+        xml2rfc.log.write(e.msg)
+        xml2rfc.log.write('Unable to complete processing %s' % name)
+        outputs = None
+    finally:
+        xml2rfc.log.write_err = write_err
+    return outputs, diagnostics.getvalue().splitlines()
+
+def render_formats(source, formats, includes, options, name):
+    parser = xml2rfc.XmlRfcParser(name, options=options, templates_path=options.template_dir,
+                                  text=source, includes=includes)
+    xmlrfc = parser.parse(remove_pis=options.remove_pis, normalize=True)
+    root = xmlrfc.tree.getroot()
+
+    options.rfc = root.get('number')
+    if options.pagination == None:
+        options.pagination = False if options.rfc else True
+    if root.get('version') == '3':
+        options.vocabulary = 'v3'
+    options.no_dtd = True
+    if options.legacy_list_symbols:
+        options.list_symbols = ('o', '*', '+', '-')
+    elif options.list_symbols:
+        options.list_symbols = tuple(list(options.list_symbols))
+    else:
+        options.list_symbols = ('*', '-', 'o', '+')
+
+    outputs = {}
+    prepped = None
+    for fmt in FORMATS:
+        if not fmt in formats:
+            continue
+        if fmt == 'expand':
+            xmlrfc = parser.parse(remove_comments=False, quiet=True, normalize=False, strip_cdata=False, add_xmlns=True)
+            writer = xml2rfc.ExpandV3XmlWriter(xmlrfc, options=options, date=options.date)
+            output = writer.tostring().encode('utf-8')
+        elif fmt == 'v2v3':
+            xmlrfc = parser.parse(remove_comments=False, quiet=True, normalize=False, strip_cdata=False, add_xmlns=True)
+            writer = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
+            output = writer.tostring().encode('utf-8')
+        elif fmt == 'prepped':
+            xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+            v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
+            xmlrfc.tree = v2v3.convert2to3()
+            writer = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date)
+            output = writer.tostring().encode('utf-8')
+        else:
+            if prepped is None:
+                prepped = get_prepped_xmlrfc(parser, options)
+            if fmt == 'text':
+                writer = xml2rfc.TextWriter(prepped.copy(), options=options, date=options.date)
+                output = writer.tostring().encode('utf-8-sig' if options.bom else 'utf-8')
+            elif fmt == 'html':
+                writer = xml2rfc.HtmlWriter(prepped.copy(), options=options, date=options.date)
+                # Output file name, for relative links to metadata js
+                writer.filename = posixpath.splitext(name)[0] + FORMATS[fmt][0]
+                output = writer.tostring().encode('utf-8')
+            elif fmt == 'pdf':
+                writer = xml2rfc.PdfWriter(prepped.copy(), options=options, date=options.date)
+                output = writer.pdf()
+                if not output:
+                    writer.err(None, 'PDF creation failed')
+                    continue
+            elif fmt == 'info':
+                info = extract_anchor_info(prepped.tree)
+                output = json.dumps(info, indent=2, ensure_ascii=False).encode('utf-8')
+        outputs[fmt] = output
+    return outputs
@@ -0,0 +1,242 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" A content-addressed cache of rendered outputs
+
+    Cache entries are keyed by a hash of the xml2rfc version, the source
+    bytes and the options which affect the output.  Each entry holds the
+    output files of a render, the diagnostics it produced, and a manifest of
+    the external resources (includes, entities, references, artwork and
+    sourcecode files) the render used, with their sha256 digests.  An entry
+    is only used if all those resources are unchanged.
+
+    Entries are evicted least recently used first when the cache grows
+    beyond its maximum size.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import xml2rfc
+import xml2rfc.bundle
+import xml2rfc.log
+
+from xml2rfc.parser import CACHE_REFRESH_SECS
+from xml2rfc.util.file import file_sha256
+
+
+MANIFEST = 'manifest.json'
+
+# Stands for the source file name in stored diagnostics
+SOURCE = '\0source'
+
+# Options which don't affect the content of the outputs.  The output
+# location and the selection of formats are handled separately.
+IGNORED_OPTIONS = [
+    'basename',
+    'batch',
+    'batch_file',
+    'build_cache',
+    'build_cache_size',
+    'cache',
+    'cache_size',
+    'cache_stats',
+    'clear_cache',
+    'config_file',
+    'country_help',
+    'debug',
+    'evict_cache',
+    'filename',
+    'jobs',
+    'negative_cache_ttl',
+    'no_build_cache',
+    'output_filename',
+    'output_path',
+    'pdf_help',
+    'pi_help',
+    'prefetch_jobs',
+    'refresh_negative',
+    'render_profile',
+    'serve',
+    'source',
+    'timings',
+    'values',
+    'version',
+    'warm_cache',
+    'watch',
+]
+
+# Options which name files whose content affects the outputs
+FILE_OPTIONS = [
+    'css',
+    'dtd',
+]
+
+
+def resource_sha256(path):
+    """ Return the sha256 digest of a local file or bibxml bundle member, or None if it doesn't exist """
+    data = xml2rfc.bundle.read(path)
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    return file_sha256(path) if os.path.isfile(path) else None
+
+
+class DiagnosticsRecorder(object):
+    """ Passes log output on to a stream, keeping a copy of it """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = io.StringIO()
+
+    def write(self, text):
+        self.stream.write(text)
+        self.buffer.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+class BuildCache(object):
+
+    def __init__(self, path, max_size=1024*1024*1024):
+        self.path = path
+        self.max_size = max_size
+
+    def key(self, source, options):
+        """ Return the cache key for rendering source with options
+
+            Returns None if the render can't be cached.
+        """
+        if options.external_css or options.external_js or options.lockfile:
+            # Outputs which are written beside the main output
+            return None
+        if options.locked:
+            # The resources come from the lockfile, which isn't checked
+            return None
+        digest = hashlib.sha256()
+        digest.update(xml2rfc.__version__.encode('ascii'))
+        with io.open(source, 'rb') as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+        values = dict( (k, v) for k, v in vars(options).items() if not k in IGNORED_OPTIONS )
+        for name in FILE_OPTIONS:
+            path = values.get(name)
+            if path:
+                if not os.path.isfile(path):
+                    return None
+                values[name] = (path, file_sha256(path))
+        digest.update(repr(sorted(values.items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_fresh(self, resources, options):
+        """ Check that the resources of a cache entry are unchanged """
+        now = time.time()
+        for request, resource in resources.items():
+            path = resource['path']
+            if resource_sha256(path) != resource['sha256']:
+                return False
+            if resource['cached'] and not options.no_network:
+                # A new render would fetch this reference again
+                if now - os.path.getmtime(path) > CACHE_REFRESH_SECS:
+                    return False
+        return True
+
+    def get(self, key, source, outputs, options):
+        """ Copy the cached outputs for key to their output files
+
+            The outputs are a list of (format, filename) pairs.  Returns the
+            manifest of the cache entry, with the diagnostics of the cached
+            render of source, or None on a cache miss.
+        """
+        entry = os.path.join(self.path, key)
+        try:
+            with io.open(os.path.join(entry, MANIFEST), encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (IOError, OSError, ValueError):
+            return None
+        if not all( fmt in manifest['outputs'] for fmt, filename in outputs ):
+            return None
+        if not self.is_fresh(manifest['resources'], options):
+            return None
+        try:
+            for fmt, filename in outputs:
+                shutil.copyfile(os.path.join(entry, manifest['outputs'][fmt]), filename)
+        except (IOError, OSError):
+            return None
+        # Mark the entry as recently used
+        os.utime(entry)
+        manifest['diagnostics'] = manifest['diagnostics'].replace(SOURCE, source)
+        return manifest
+
+    def put(self, key, source, outputs, resources, diagnostics):
+        """ Store the output files of a render of source under key
+
+            Renders which used resources that can't be checked later, such
+            as uncached network resources, are not stored.  The messages
+            about created files are dropped from the diagnostics.
+        """
+        for resource in resources.values():
+            path = resource['path']
+            if resource['sha256'] is None or not (os.path.isfile(path) or xml2rfc.bundle.read(path) is not None):
+                return
+        for fmt, filename in outputs:
+            if not os.path.exists(filename):
+                return
+        manifest = {
+            'version': xml2rfc.__version__,
+            'resources': resources,
+            'outputs': {},
+            'diagnostics': ''.join( l.replace(source, SOURCE) for l in diagnostics.splitlines(True)
+                                    if not l.lstrip().startswith('Created file') ),
+        }
+        tmpdir = None
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            # Build the entry in a temporary directory, and rename it into
+            # place, so that partial entries are never seen
+            tmpdir = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+            for fmt, filename in outputs:
+                name = fmt + os.path.splitext(filename)[1]
+                shutil.copyfile(filename, os.path.join(tmpdir, name))
+                manifest['outputs'][fmt] = name
+            with io.open(os.path.join(tmpdir, MANIFEST), 'w', encoding='utf-8') as file:
+                json.dump(manifest, file, indent=2)
+            entry = os.path.join(self.path, key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmpdir, entry)
+        except (IOError, OSError) as e:
+            xml2rfc.log.warn('Could not store the render in the build cache: %s' % e)
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """ Return a list of (mtime, size, path) for all cache entries """
+        entries = []
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                path = os.path.join(self.path, name)
+                if name.startswith('.') or not os.path.isdir(path):
+                    continue
+                size = sum( os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) )
+                entries.append((os.path.getmtime(path), size, path))
+        return entries
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits max_size """
+        entries = sorted(self.entries())
+        total = sum( size for mtime, size, path in entries )
+        while entries and total > self.max_size:
+            mtime, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,234 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" Offline bibxml bundles
+
+    A bundle is a zip file, or an uncompressed tar file, of bibxml
+    directories (bibxml/, bibxml-ids/, ...), which can be given in the
+    library path ($XML_LIBRARY) instead of a directory.  References are
+    read from the bundle directly, without extracting it.
+
+    Members are found through an index file next to the bundle, with the
+    suffix .idx, which is built when the bundle is first used, and again
+    whenever the bundle changes.  The index is a hash table of member names,
+    with the offset, size and compression of each member, and both the
+    index and the bundle are memory-mapped, so that a lookup reads only
+    the hash table slots probed and the member itself.  If the index can't
+    be written next to the bundle it is built in memory, which costs a scan
+    of the bundle per process.
+
+    Bundle members are referred to by paths of the form
+    '/path/to/bibxml.zip!/bibxml/reference.RFC.2119.xml'.
+
+    A bundle is opened once, and then used for the rest of the process; a
+    long running process, such as --serve, checks every CHECK_SECS whether
+    the bundle was replaced.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+import xml2rfc.log
+
+
+BUNDLE_SUFFIXES = ('.zip', '.tar', )
+MEMBER_SEPARATOR = '!/'
+INDEX_SUFFIX = '.idx'
+
+# Index file layout: a header, a hash table with a power of 2 number of
+# slots, and the member names.  Empty slots have a name offset of 0.
+INDEX_MAGIC = b'X2RBIDX1'
+HEADER = struct.Struct('<8sIIQQ')      # magic, slots, members, bundle size, bundle mtime
+SLOT = struct.Struct('<QQQIII')        # name hash, name offset, data offset, stored size, size, compression
+NAME_LENGTH = struct.Struct('<H')
+
+STORED = 0
+DEFLATED = 8
+
+CHECK_SECS = 10
+
+bundles = {}
+registry_lock = threading.Lock()
+
+
+def get_bundle(path):
+    """ Return the bundle at path, or None if path isn't a bundle """
+    if not path.endswith(BUNDLE_SUFFIXES):
+        return None
+    with registry_lock:
+        bundle = bundles.get(path)
+        if bundle and time.monotonic() - bundle.checked > CHECK_SECS:
+            bundle.checked = time.monotonic()
+            try:
+                stat = os.stat(path)
+                replaced = (stat.st_size, stat.st_mtime_ns) != bundle.stat
+            except OSError:
+                replaced = True
+            if replaced:
+                del bundles[path]
+        if not path in bundles:
+            bundle = None
+            if os.path.isfile(path):
+                try:
+                    bundle = Bundle(path)
+                except (IOError, OSError, ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+                    xml2rfc.log.warn('Could not use the bibxml bundle at %s: %s' % (path, e))
+            bundles[path] = bundle
+        return bundles[path]
+
+def split(path):
+    """ Split the path of a bundle member into the bundle and member name
+
+        Returns (None, None) if path isn't the path of a bundle member.
+    """
+    if not MEMBER_SEPARATOR in path:
+        return None, None
+    bundle_path, name = path.split(MEMBER_SEPARATOR, 1)
+    return get_bundle(bundle_path), name
+
+def read(path):
+    """ Return the content of the bundle member at path, or None if there is none """
+    bundle, name = split(path)
+    return bundle.read(name) if bundle else None
+
+def name_hash(name):
+    return struct.unpack('<Q', hashlib.blake2b(name, digest_size=8).digest())[0]
+
+
+class Bundle(object):
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        with io.open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stat = (stat.st_size, stat.st_mtime_ns)
+        self.checked = time.monotonic()
+        self.index = self.load_index(stat)
+        if self.index is None:
+            index = self.build_index(stat)
+            self.index = self.save_index(index) or index
+        magic, self.slots, self.members, size, mtime = HEADER.unpack_from(self.index, 0)
+
+    def load_index(self, stat):
+        """ Return the mapped index file, or None if it's missing or out of date """
+        try:
+            with io.open(self.path + INDEX_SUFFIX, 'rb') as file:
+                index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        if len(index) >= HEADER.size:
+            magic, slots, members, size, mtime = HEADER.unpack_from(index, 0)
+            if magic == INDEX_MAGIC and size == stat.st_size and mtime == stat.st_mtime_ns:
+                return index
+        index.close()
+        return None
+
+    def save_index(self, index):
+        """ Write the index next to the bundle, and return it mapped, or None if that fails """
+        path = self.path + INDEX_SUFFIX
+        tmp_path = '%s.%s-%s.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            with io.open(tmp_path, 'wb') as file:
+                file.write(index)
+            os.replace(tmp_path, path)
+            with io.open(path, 'rb') as file:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError) as e:
+            xml2rfc.log.note('Could not write the bundle index %s: %s' % (path, e))
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return None
+
+    def scan(self):
+        """ Return (name, data offset, stored size, size, compression) for each file in the bundle """
+        members = []
+        if self.path.endswith('.zip'):
+            with zipfile.ZipFile(self.path) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if not info.compress_type in (STORED, DEFLATED):
+                        xml2rfc.log.note('Skipping %s in %s, with unsupported compression' % (info.filename, self.path))
+                        continue
+                    # The name and extra field lengths of the local header
+                    # may differ from those of the central directory
+                    name_length, extra_length = struct.unpack_from('<HH', self.data, info.header_offset + 26)
+                    offset = info.header_offset + 30 + name_length + extra_length
+                    members.append((info.filename, offset, info.compress_size, info.file_size, info.compress_type))
+        else:
+            # Compressed tar files can't be read at an offset
+            with tarfile.open(self.path, 'r:') as archive:
+                for info in archive:
+                    if info.isfile():
+                        members.append((info.name, info.offset_data, info.size, info.size, STORED))
+        return members
+
+    def build_index(self, stat):
+        """ Return the index of the bundle, as bytes """
+        members = self.scan()
+        slots = 1
+        while slots < 2 * len(members):
+            slots *= 2
+        table = [ None ] * slots
+        names = io.BytesIO()
+        names_offset = HEADER.size + slots * SLOT.size
+        for name, offset, stored_size, size, compression in members:
+            if name.startswith('./'):
+                name = name[2:]
+            name = name.encode('utf-8')
+            h = name_hash(name)
+            i = h & (slots - 1)
+            while table[i] is not None:
+                i = (i + 1) & (slots - 1)
+            table[i] = (h, names_offset + names.tell(), offset, stored_size, size, compression)
+            names.write(NAME_LENGTH.pack(len(name)) + name)
+        index = io.BytesIO()
+        index.write(HEADER.pack(INDEX_MAGIC, slots, len(members), stat.st_size, stat.st_mtime_ns))
+        for slot in table:
+            index.write(SLOT.pack(*slot) if slot else SLOT.pack(0, 0, 0, 0, 0, 0))
+        index.write(names.getvalue())
+        xml2rfc.log.note('Indexed %s files in the bibxml bundle %s' % (len(members), self.path))
+        return index.getvalue()
+
+    def lookup(self, name):
+        """ Return the hash table slot of member name, or None """
+        name = name.encode('utf-8')
+        h = name_hash(name)
+        mask = self.slots - 1
+        i = h & mask
+        while True:
+            slot = SLOT.unpack_from(self.index, HEADER.size + i * SLOT.size)
+            if not slot[1]:
+                return None
+            if slot[0] == h:
+                length, = NAME_LENGTH.unpack_from(self.index, slot[1])
+                start = slot[1] + NAME_LENGTH.size
+                if self.index[start:start+length] == name:
+                    return slot
+            i = (i + 1) & mask
+
+    def find(self, name):
+        """ Return the path of member name, or None if there is no such member """
+        return self.path + MEMBER_SEPARATOR + name if self.lookup(name) else None
+
+    def read(self, name):
+        """ Return the content of member name, or None if there is no such member """
+        slot = self.lookup(name)
+        if not slot:
+            return None
+        h, name_offset, offset, stored_size, size, compression = slot
+        data = self.data[offset:offset+stored_size]
+        if compression == DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        return data
@@ -0,0 +1,316 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" An index of the entries of a reference cache directory
+
+    The index is an SQLite database in the cache directory, with a row for
+    each cached reference, holding the URL it was fetched from, when it was
+    fetched, the modification time and sha256 digest of the cached file,
+    its root tag, whether it validated against the reference schemas, and
+    the HTTP validators needed to revalidate it.
+
+    A cache hit then costs an index lookup, instead of parsing and
+    validating the cached file.  Cached files which are not in the index,
+    or whose modification time doesn't match the index (they were written
+    by another tool, or an older version of xml2rfc), are parsed,
+    validated and indexed again by the resolver.
+
+    The index also holds the bibxml subdirectory where references with a
+    given name prefix were last found, see CachingResolver.get_subdirs(),
+    and the URLs which were recently not found, see --negative-cache-ttl.
+
+    Cache hits and misses are counted, and the time each entry was last
+    used is kept for eviction, see --cache-stats and --evict-cache.  These
+    are collected in memory, and written to the index at most every
+    FLUSH_SECS and at exit, so that a cache hit doesn't cost a write.
+    Worker processes, which don't run exit handlers, call flush_all() after
+    each document instead.
+
+    The index is rebuilt, from the cached files, when SCHEMA_VERSION
+    changes.
+
+    If the sqlite3 module is not available, or the index can't be opened,
+    the cache is used without an index.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+try:
+    import sqlite3
+except ImportError:
+    # Python may be built without sqlite3
+    sqlite3 = None
+
+import xml2rfc.log
+
+
+INDEX_NAME = 'index.sqlite'
+
+FIELDS = ['basename', 'url', 'fetched', 'mtime', 'sha256', 'root', 'valid', 'etag', 'last_modified', 'used', 'hits', ]
+
+FLUSH_SECS = 60
+
+SCHEMA_VERSION = 2
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        basename        TEXT PRIMARY KEY,
+        url             TEXT,
+        fetched         REAL,
+        mtime           REAL,
+        sha256          TEXT,
+        root            TEXT,
+        valid           INTEGER,
+        etag            TEXT,
+        last_modified   TEXT,
+        used            REAL,
+        hits            INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS subdirs (
+        prefix          TEXT PRIMARY KEY,
+        subdir          TEXT
+    );
+    CREATE TABLE IF NOT EXISTS misses (
+        url             TEXT PRIMARY KEY,
+        error           TEXT,
+        checked         REAL
+    );
+    CREATE TABLE IF NOT EXISTS stats (
+        name            TEXT PRIMARY KEY,
+        value           INTEGER
+    );
+"""
+TABLES = ['entries', 'subdirs', 'misses', 'stats', ]
+
+indexes = {}
+registry_lock = threading.Lock()
+
+
+def get_index(dir):
+    """ Return the index of the cache directory dir, or None if it has none """
+    if sqlite3 is None:
+        return None
+    dir = os.path.normpath(dir)
+    with registry_lock:
+        if not dir in indexes:
+            index = CacheIndex(dir)
+            indexes[dir] = index if index.open() else None
+        return indexes[dir]
+
+def flush_all():
+    """ Write what was collected in memory to all the open indexes, see CacheIndex.flush() """
+    with registry_lock:
+        open_indexes = [ index for index in indexes.values() if index ]
+    for index in open_indexes:
+        index.flush()
+
+def forget(dir):
+    """ Drop the index of dir from the registry, after the directory was deleted """
+    with registry_lock:
+        indexes.pop(os.path.normpath(dir), None)
+
+
+class CacheIndex(object):
+    """ The index of one cache directory
+
+        SQLite connections can't be shared by threads, so each thread gets
+        its own connection.
+    """
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.path = os.path.join(dir, INDEX_NAME)
+        self.readonly = not os.access(dir, os.W_OK)
+        self.local = threading.local()
+        # Hits and misses not yet written to the index
+        self.pending_lock = threading.Lock()
+        self.pending_uses = {}
+        self.pending_counts = {}
+        self.flushed = time.time()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            if self.readonly:
+                db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True, timeout=10, isolation_level=None)
+            else:
+                db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.db = db
+        return db
+
+    def open(self):
+        """ Open the index, creating it if needed; returns False if that fails """
+        if self.readonly and not os.path.exists(self.path):
+            return False
+        try:
+            if not self.readonly:
+                db = self.connect()
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                        for table in TABLES:
+                            db.execute('DROP TABLE IF EXISTS %s' % table)
+                        for statement in SCHEMA.split(';'):
+                            db.execute(statement)
+                        db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+                    db.execute('COMMIT')
+                except sqlite3.Error:
+                    db.execute('ROLLBACK')
+                    raise
+                atexit.register(self.flush)
+            else:
+                self.connect().execute('SELECT 1 FROM entries LIMIT 1')
+            return True
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Not using the cache index at %s: %s' % (self.path, e))
+            return False
+
+    def get(self, basename):
+        """ Return the entry for basename as a dictionary, or None """
+        try:
+            row = self.connect().execute('SELECT %s FROM entries WHERE basename = ?' % ', '.join(FIELDS), (basename, )).fetchone()
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not read the cache index at %s: %s' % (self.path, e))
+            return None
+        return dict(zip(FIELDS, row)) if row else None
+
+    def put(self, entry):
+        """ Add or replace an entry, given as a dictionary with the keys in FIELDS """
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('INSERT OR REPLACE INTO entries (%s) VALUES (%s)' % (', '.join(FIELDS), ', '.join('?'*len(FIELDS))),
+                                   [ entry.get(f) for f in FIELDS ])
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def touch(self, basename, fetched, mtime):
+        """ Mark an entry as fetched at the given time, after revalidation """
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('UPDATE entries SET fetched = ?, mtime = ? WHERE basename = ?', (fetched, mtime, basename))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def delete(self, basename):
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('DELETE FROM entries WHERE basename = ?', (basename, ))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def entries(self):
+        """ Return all entries, as a dictionary of entry dictionaries by basename """
+        try:
+            rows = self.connect().execute('SELECT %s FROM entries' % ', '.join(FIELDS)).fetchall()
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not read the cache index at %s: %s' % (self.path, e))
+            return {}
+        return dict( (row[0], dict(zip(FIELDS, row))) for row in rows )
+
+    def get_subdir(self, prefix):
+        """ Return the subdirectory where references with prefix were last found, or None """
+        try:
+            row = self.connect().execute('SELECT subdir FROM subdirs WHERE prefix = ?', (prefix, )).fetchone()
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not read the cache index at %s: %s' % (self.path, e))
+            return None
+        return row[0] if row else None
+
+    def put_subdir(self, prefix, subdir):
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('INSERT OR REPLACE INTO subdirs (prefix, subdir) VALUES (?, ?)', (prefix, subdir))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def get_miss(self, url):
+        """ Return (error, time) of the last failure to fetch url, or None """
+        try:
+            return self.connect().execute('SELECT error, checked FROM misses WHERE url = ?', (url, )).fetchone()
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not read the cache index at %s: %s' % (self.path, e))
+            return None
+
+    def put_miss(self, url, error, checked):
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('INSERT OR REPLACE INTO misses (url, error, checked) VALUES (?, ?, ?)', (url, error, checked))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def delete_miss(self, url):
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('DELETE FROM misses WHERE url = ?', (url, ))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def record_hit(self, basename):
+        self.record('hits', basename)
+
+    def record_miss(self):
+        self.record('misses')
+
+    def record(self, counter, basename=None):
+        if self.readonly:
+            return
+        with self.pending_lock:
+            self.pending_counts[counter] = self.pending_counts.get(counter, 0) + 1
+            if basename:
+                uses = self.pending_uses.get(basename, 0)
+                self.pending_uses[basename] = uses + 1
+            due = time.time() - self.flushed > FLUSH_SECS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """ Write the hits, misses and entry uses collected in memory to the index """
+        with self.pending_lock:
+            uses, self.pending_uses = self.pending_uses, {}
+            counts, self.pending_counts = self.pending_counts, {}
+            self.flushed = now = time.time()
+        if not uses and not counts:
+            return
+        try:
+            db = self.connect()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                for basename, hits in uses.items():
+                    db.execute('UPDATE entries SET used = ?, hits = coalesce(hits, 0) + ? WHERE basename = ?', (now, hits, basename))
+                for name, value in counts.items():
+                    db.execute('INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)', (name, ))
+                    db.execute('UPDATE stats SET value = value + ? WHERE name = ?', (value, name))
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
+
+    def stats(self):
+        """ Return the counters, such as 'hits' and 'misses', and the number of negative entries """
+        try:
+            db = self.connect()
+            stats = dict(db.execute('SELECT name, value FROM stats').fetchall())
+            stats['negative'] = db.execute('SELECT count(*) FROM misses').fetchone()[0]
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not read the cache index at %s: %s' % (self.path, e))
+            return {}
+        return stats
+
+    def prune_misses(self, before):
+        """ Remove the negative entries checked before the given time """
+        if self.readonly:
+            return
+        try:
+            self.connect().execute('DELETE FROM misses WHERE checked < ?', (before, ))
+        except sqlite3.Error as e:
+            xml2rfc.log.note('Could not update the cache index at %s: %s' % (self.path, e))
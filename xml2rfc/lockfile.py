@@ -0,0 +1,114 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" Reference lockfiles
+
+    A lockfile records the external resources a render resolved: external
+    entities, include PIs, XIncludes, artwork and sourcecode src files, and
+    the CSS and JavaScript of the HTML output.  Each entry is keyed by the
+    request as it appeared in the document, and holds the location it was
+    resolved to, the sha256 digest of the content, and the content itself.
+
+    With --lockfile, a lockfile is written next to the outputs; with
+    --locked, the resources are read from it, without network access and
+    without searching the library and cache directories, so that a
+    document renders the same as when the lockfile was written.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+
+import xml2rfc
+import xml2rfc.bundle
+import xml2rfc.log
+
+
+LOCKFILE_SUFFIX = '.lock.json'
+LOCKFILE_VERSION = 1
+
+
+class LockfileError(Exception):
+    pass
+
+
+def read_resource(path):
+    """ Return the content of a local file or bibxml bundle member, or None if there is none """
+    data = xml2rfc.bundle.read(path)
+    if data is not None:
+        return data
+    try:
+        with io.open(path, 'rb') as file:
+            return file.read()
+    except (IOError, OSError):
+        return None
+
+def write(filename, resources, locked=None):
+    """ Write a lockfile of the resources of a render, see CachingResolver.add_resource()
+
+        The content of the resources is read again from where they were
+        resolved, or with --locked, from the lockfile used.  Resources
+        which can't be read again, such as network resources which are not
+        cached, are left out, with a warning.
+    """
+    entries = {}
+    for request, resource in sorted(resources.items()):
+        path = resource['path']
+        data = locked.read(path) if locked else read_resource(path)
+        if data is None or hashlib.sha256(data).hexdigest() != resource['sha256']:
+            xml2rfc.log.warn('Could not add %s to the lockfile, as its content at %s is no longer available, or has changed' % (request, path))
+            continue
+        entry = { 'path': path, 'sha256': resource['sha256'], }
+        try:
+            entry['text'] = data.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['base64'] = base64.b64encode(data).decode('ascii')
+        entries[request] = entry
+    content = {
+        'lockfile': LOCKFILE_VERSION,
+        'version': xml2rfc.__version__,
+        'resources': entries,
+    }
+    tmp_path = '%s.%s.tmp' % (filename, os.getpid())
+    with io.open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(content, file, indent=1, sort_keys=True, ensure_ascii=False)
+        file.write('\n')
+    os.replace(tmp_path, filename)
+
+
+class Lockfile(object):
+    """ The resources of a lockfile, for rendering with --locked """
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with io.open(filename, encoding='utf-8') as file:
+                content = json.load(file)
+        except (IOError, OSError, ValueError) as e:
+            raise LockfileError('Could not read the lockfile %s: %s' % (filename, e))
+        if content.get('lockfile') != LOCKFILE_VERSION:
+            raise LockfileError('Expected a lockfile of version %s in %s, but found %s' % (LOCKFILE_VERSION, filename, content.get('lockfile')))
+        self.entries = content['resources']
+        # The content, by the path resources were resolved to
+        self.data = {}
+        for request, entry in self.entries.items():
+            if 'text' in entry:
+                data = entry['text'].encode('utf-8')
+            else:
+                data = base64.b64decode(entry['base64'])
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                raise LockfileError('The content of %s in the lockfile %s does not match its sha256 digest' % (request, filename))
+            self.data[entry['path']] = data
+
+    def get(self, request):
+        """ Return the entry for request, or None if it isn't locked """
+        entry = self.entries.get(request)
+        if entry is None and request.startswith('file://'):
+            entry = self.entries.get(request[7:])
+        return entry
+
+    def read(self, path):
+        """ Return the content of the resource resolved to path, or None if there is none """
+        return self.data.get(path)
@@ -9,7 +9,10 @@
     python exception.
 """
 
+import contextlib
+import io
 import sys
+import threading
 
 quiet = False
 verbose = False
@@ -17,16 +20,34 @@ verbose = False
 write_out = sys.stdout
 write_err = sys.stderr
 
+# Per-thread redirection of write_err, see capture()
+local = threading.local()
+
+def get_write_err():
+    """ Return where the messages of the current thread go """
+    return getattr(local, 'write_err', None) or write_err
+
+@contextlib.contextmanager
+def capture():
+    """ Collect the messages of the current thread in a StringIO, instead of writing them """
+    output = io.StringIO()
+    saved = getattr(local, 'write_err', None)
+    local.write_err = output
+    try:
+        yield output
+    finally:
+        local.write_err = saved
+
 
 def write_on_line(*args):
     """ Writes a message without ending the line, i.e. in a loading bar """
-    write_err.write(' '.join(args))
-    write_err.flush()
+    err = get_write_err()
+    err.write(' '.join(args))
+    err.flush()
 
 def write(*args):
     """ Prints a message to write_out """
-    write_err.write(' '.join(args))
-    write_err.write('\n')
+    get_write_err().write(' '.join(args) + '\n')
 
 def note(*args):
     if verbose and not quiet:
@@ -35,13 +56,11 @@ def note(*args):
 def warn(*args):
     """ Prints a warning message unless quiet """
     if not quiet:
-        write_err.write('Warning: ' + ' '.join(args).strip())
-        write_err.write('\n')
+        get_write_err().write('Warning: ' + ' '.join(args).strip() + '\n')
 
 def error(*args):
     """ This is typically called after an exception was already raised. """
-    write_err.write('Error: ' + ' '.join(args))
-    write_err.write('\n')
+    get_write_err().write('Error: ' + ' '.join(args) + '\n')
 
 def exception(message, list):
     error(message)
@@ -51,4 +70,4 @@ def exception(message, list):
         attr = dict( [ (n,str(getattr(e, n)).replace("\n"," ")) for n in dir(e) if not n.startswith("_") ] )
         if attr["message"].endswith(", got "):
             attr["message"] += "nothing."
-        write_err.write(" %(filename)s: Line %(line)s: %(message)s\n" % attr )
+        get_write_err().write(" %(filename)s: Line %(line)s: %(message)s\n" % attr )
@@ -5,19 +5,32 @@
 """ Public XML parser module """
 
 import base64
+import concurrent.futures
+import contextlib
+import copy
 import hashlib
 import io
 import lxml.etree
 import os
 import re
-import requests
 import shutil
+import threading
 import time
+import xml2rfc.bundle
+import xml2rfc.cacheindex
 import xml2rfc.log
+import xml2rfc.schemas
 import xml2rfc.utils
 
 from xml2rfc.writers import base
-from xml2rfc.util.file import can_access, FileAccessError
+from xml2rfc.timings import timed
+from xml2rfc.util.file import can_access, file_sha256, get_include, FileAccessError
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
 
 try:
     from urllib.parse import urlparse, urljoin, urlsplit
@@ -32,6 +45,42 @@ except ImportError:
 
 __all__ = ['XmlRfcParser', 'XmlRfc', 'XmlRfcError']
 
+# Cached references older than this are fetched again, if network access
+# is permitted
+CACHE_REFRESH_SECS = 60*60*24*14 # 14 days
+
+# Cached references older than CACHE_REFRESH_SECS, but younger than this,
+# are used as they are while they're refreshed in the background
+CACHE_STALE_SECS = 60*60*24*90 # 90 days
+
+# The number of bibxml subdirectories probed concurrently for a reference
+# which isn't cached, see CachingResolver.probe()
+PROBE_JOBS = 8
+
+# Locks on cache entries are shared by all processes using a cache
+# directory, and kept in this many lock files in CACHE_LOCK_DIR, see
+# cache_lock()
+CACHE_LOCK_DIR = '.locks'
+CACHE_LOCK_STRIPES = 256
+
+# Cache entries used more recently than this are not evicted, as they're
+# likely to be in use by a running process, see CachingResolver.evict_cache()
+CACHE_EVICT_GRACE_SECS = 60*10 # 10 minutes
+
+# Cache entries being refreshed in the background
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+# The size of the pieces of a document fed to the parser by
+# XmlRfcParser.scan_root(), which stops at the root element
+SCAN_CHUNK_SIZE = 1 << 14
+
+# External resources referenced from a document: external entities, include
+# PIs and XIncludes, see XmlRfcParser.prefetch()
+ENTITY_RE = re.compile(rb'''<!ENTITY\s+(%\s+)?([^\s"']+)\s+(?:SYSTEM|PUBLIC\s+(?:"[^"]*"|'[^']*'))\s+(?:"([^"]+)"|'([^']+)')''')
+INCLUDE_PI_RE = re.compile(rb'''<\?rfc\s[^>]*?\binclude=(?:"([^"]+)"|'([^']+)')''')
+XINCLUDE_RE = re.compile(rb'''<(?:[\w.-]+:)?include\s[^>]*?\bhref=(?:"([^"]+)"|'([^']+)')''')
+
 class XmlRfcError(Exception):
     """ Application XML errors with positional information
     
@@ -56,7 +105,8 @@ class CachingResolver(lxml.etree.Resolver):
                  no_network=None, network_locs= [
                      'https://bib.ietf.org/public/rfc/',
                  ],
-                 rfc_number=None, options=base.default_options):
+                 rfc_number=None, options=base.default_options, resources=None, includes=None,
+                 unreachable=None, locked=None):
         self.quiet = quiet if quiet != None else options.quiet
         self.verbose = verbose if verbose != None else options.verbose
         self.no_network = no_network if no_network != None else options.no_network
@@ -67,8 +117,22 @@ class CachingResolver(lxml.etree.Resolver):
         self.network_locs = network_locs
         self.include = False
         self.rfc_number = rfc_number
-        self.cache_refresh_secs = (60*60*24*14) # 14 days
+        self.cache_refresh_secs = CACHE_REFRESH_SECS
+        self.cache_stale_secs = CACHE_STALE_SECS
+        self.probe_jobs = PROBE_JOBS
+        # URLs not fetched, as they recently failed to fetch
+        self.negative = set()
         self.options = options
+        # External resources resolved, see add_resource()
+        self.resources = resources if resources != None else {}
+        # In-memory include files, see xml2rfc.util.file.get_include()
+        self.includes = includes
+        # Network locations which failed to connect, with the error; these
+        # are not tried again
+        self.unreachable = unreachable if unreachable != None else {}
+        # The lockfile to resolve requests from, with --locked, see
+        # xml2rfc.lockfile
+        self.locked = locked
 
         # Get directory of source
         if self.source:
@@ -96,9 +160,13 @@ class CachingResolver(lxml.etree.Resolver):
                     os.makedirs(dir)
                     xml2rfc.log.note('Created cache directory at', dir)
                     self.write_cache = dir
+                    break
                 except OSError:
-                    # Can't write to this directory, try the next one
-                    pass
+                    # Can't write to this directory, try the next one,
+                    # unless another process just created it
+                    if os.path.isdir(dir) and os.access(dir, os.W_OK):
+                        self.write_cache = dir
+                        break
         if not self.write_cache:
             xml2rfc.log.warn('Unable to find a suitable cache directory to '
                             'write to, trying the following directories:\n ',
@@ -107,10 +175,10 @@ class CachingResolver(lxml.etree.Resolver):
         else:
             # Create the prefix directory if it doesnt exist
             pdir = os.path.join(self.write_cache, xml2rfc.CACHE_PREFIX)
-            if not os.path.exists(pdir):
-                os.makedirs(pdir)
+            os.makedirs(pdir, exist_ok=True)
                 
         self.sessions = {}
+        self.sessions_lock = threading.Lock()
 
     def delete_cache(self, path=None):
         # Explicit path given?
@@ -119,9 +187,63 @@ class CachingResolver(lxml.etree.Resolver):
             path = os.path.join(dir, xml2rfc.CACHE_PREFIX)
             if os.access(path, os.W_OK):
                 shutil.rmtree(path)
+                xml2rfc.cacheindex.forget(path)
                 xml2rfc.log.note('Deleted cache directory at', path)
 
+    def evict_cache(self, max_size, path=None):
+        """ Remove the least recently used entries of a cache until it's no larger than max_size bytes
+
+            Entries used within CACHE_EVICT_GRACE_SECS are kept, even if the
+            cache is then larger than max_size.  Negative entries older than
+            the negative cache TTL, and temporary files left by interrupted
+            writes, are removed as well.  Returns the number of entries and
+            bytes removed.
+        """
+        dir = os.path.join(path or self.write_cache, xml2rfc.CACHE_PREFIX)
+        if not os.access(dir, os.W_OK):
+            return 0, 0
+        index = xml2rfc.cacheindex.get_index(dir)
+        if index:
+            index.flush()
+            if self.options.negative_cache_ttl:
+                index.prune_misses(time.time() - self.options.negative_cache_ttl)
+        now = time.time()
+        entries = []
+        total = 0
+        for name in os.listdir(dir):
+            file_path = os.path.join(dir, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            if name.endswith('.tmp'):
+                if now - stat.st_mtime > CACHE_EVICT_GRACE_SECS:
+                    os.unlink(file_path)
+            elif name.endswith('.xml'):
+                entry = (index and index.get(name)) or {}
+                used = entry.get('used') or entry.get('fetched') or stat.st_mtime
+                entries.append((used, name, entry.get('url') or name, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        count = size = 0
+        for used, name, key, file_size in entries:
+            if total <= max_size or now - used < CACHE_EVICT_GRACE_SECS:
+                break
+            with cache_lock(dir, key):
+                if index:
+                    index.delete(name)
+                try:
+                    os.unlink(os.path.join(dir, name))
+                except OSError:
+                    continue
+            total -= file_size
+            count += 1
+            size += file_size
+        xml2rfc.log.note('Evicted %s entries, %s bytes, from cache directory at %s' % (count, size, dir))
+        return count, size
+
                 
+    @timed('resolve')
     def resolve(self, request, public_id, context):
         """ Called internally by lxml """
         if not request:
@@ -138,8 +260,14 @@ class CachingResolver(lxml.etree.Resolver):
         # Warn if .ent file is referred.
         if request.endswith('.ent'):
             xml2rfc.log.warn('{} is no longer needed as the special processing of non-ASCII characters has been superseded by direct support for non-ASCII characters in RFCXML.'.format(request))
+        if self.includes:
+            path = request[7:] if request.startswith("file://") else request
+            data = get_include(self.includes, self.source, path)
+            if data is not None:
+                self.add_resource(request, path, data=data)
+                return self.resolve_string(data, context)
         url = urlparse(request)
-        if not url.netloc or url.scheme == 'file':
+        if (not url.netloc or url.scheme == 'file') and not (self.locked and self.locked.get(request)):
             if request.startswith("file://"):
                 request = request[7:]
             try:
@@ -151,6 +279,9 @@ class CachingResolver(lxml.etree.Resolver):
                 raise XmlRfcError(str(error))
         try:
             path = self.getReferenceRequest(request)
+            data = self.read(path)
+            if data is not None:
+                return self.resolve_string(data, context, base_url=path)
             return self.resolve_filename(path, context)
         except Exception as e:
             xml2rfc.log.error(str(e))
@@ -190,7 +321,10 @@ class CachingResolver(lxml.etree.Resolver):
             - LOCAL_LIB_DIRS refers to a list of local directories to consult,
               on the CLI this is set by $XML_LIBRARY, defaulting to 
               ['/usr/share/xml2rfc'].  On the GUI this can be configured
-              manually but has the same initial defaults.
+              manually but has the same initial defaults.  Bibxml bundles
+              in LOCAL_LIB_DIRS are searched like directories, and are also
+              searched for NETWORK requests before the cache, see
+              xml2rfc.bundle.
             - NETWORK refers to the online citation library.
 
             The caches in read_dirs are consulted in sequence order to find the
@@ -201,6 +335,8 @@ class CachingResolver(lxml.etree.Resolver):
             properly resolved
         """
         self.include = include # include state
+        if self.locked:
+            return self.get_locked(request, line_no)
         tried_cache = False
         attempts = []  # Store the attempts
         original = request  # Used for the error message only
@@ -241,16 +377,23 @@ class CachingResolver(lxml.etree.Resolver):
                 # URL requested, cache it
                 origloc = urlparse(paths[0]).netloc
                 if True in [ urlparse(loc).netloc == urlparse(paths[0]).netloc for loc in self.network_locs ]:
+                    # Look in the bundles in the library first
+                    names = []
                     for loc in self.network_locs:
-                        newloc = urlparse(loc).netloc
-                        for path in paths:
-                            path = path.replace(origloc, newloc)
-                            attempts.append(path)
-                            result = self.cache(path)
+                        prefix = urlparse(loc).path
+                        names += [ urlparse(path).path[len(prefix):] for path in paths if urlparse(path).path.startswith(prefix) ]
+                    result = self.find_in_bundles(names, attempts)
+                    if not result:
+                        for loc in self.network_locs:
+                            newloc = urlparse(loc).netloc
+                            for path in paths:
+                                path = path.replace(origloc, newloc)
+                                attempts.append(path)
+                                result = self.cache(path)
+                                if result:
+                                    break
                             if result:
                                 break
-                        if result:
-                            break
                 else:
                     for path in paths:
                         attempts.append(path)
@@ -262,7 +405,7 @@ class CachingResolver(lxml.etree.Resolver):
                         xml2rfc.log.warn("The v3 formatters require full explicit URLs of external resources.  Did you forget to add '.xml' (or some other extension)?")
                     if self.no_network:
                         xml2rfc.log.warn("Document not found in cache, and --no-network specified -- couldn't resolve %s" % request)
-                tried_cache = True
+                tried_cache = not xml2rfc.bundle.MEMBER_SEPARATOR in (result or '')
             else:
                 if os.path.dirname(paths[0]):
                     # Intermediate directories, only do flat searches
@@ -274,6 +417,8 @@ class CachingResolver(lxml.etree.Resolver):
                             if os.path.exists(attempt):
                                 result = attempt
                                 break
+                        if not result:
+                            result = self.find_in_bundles(paths, attempts, dirs=[dir])
                     if not result:
                         # Try network location
                         for loc in self.network_locs:
@@ -303,21 +448,19 @@ class CachingResolver(lxml.etree.Resolver):
                             if os.path.exists(attempt):
                                 result = attempt
                                 break
+                        if not result:
+                            # Try the bibxml subdirectories of bundles
+                            names = paths + [ subdir + '/' + path for subdir in xml2rfc.NET_SUBDIRS for path in paths ]
+                            result = self.find_in_bundles(names, attempts, dirs=[dir])
                     if not result:
                         # Try network subdirs
-                        for subdir in xml2rfc.NET_SUBDIRS:
-                            for loc in self.network_locs:
-                                for path in paths:
-                                    url = urljoin(loc, subdir + '/' + path)
-                                    attempts.append(url)
-                                    result = self.cache(url)
-                                    if result:
-                                        break
-                                if result:
-                                    break
-                            tried_cache = True
-                            if result:
-                                break
+                        candidates = [ (subdir, urljoin(loc, subdir + '/' + path))
+                                       for subdir in self.get_subdirs(paths[0])
+                                       for loc in self.network_locs
+                                       for path in paths ]
+                        attempts += [ url for subdir, url in candidates ]
+                        result = self.probe(candidates, paths[0])
+                        tried_cache = True
                         if not result and self.no_network:
                             xml2rfc.log.warn("Document not found in cache, and --no-network specified -- couldn't resolve %s" % request)
                     # if not result:
@@ -326,7 +469,8 @@ class CachingResolver(lxml.etree.Resolver):
                     #     attempts.append(result)
 
         # Verify the result -- either raise exception or return it
-        if not result or (not os.path.exists(result) and not urlparse(original).netloc):
+        if not result or (not os.path.exists(result) and not urlparse(original).netloc
+                          and xml2rfc.bundle.read(result) is None):
             if os.path.isabs(original):
                 xml2rfc.log.warn('A reference was requested with an absolute path: "%s", but not found '
                     'in that location.  Removing the path component will cause xml2rfc to look for '
@@ -334,6 +478,8 @@ class CachingResolver(lxml.etree.Resolver):
             # Couldn't resolve.  Throw an exception
             error = XmlRfcError('Unable to resolve external request: '
                                       + '"' + original + '"', line_no=line_no, filename=self.source)
+            if self.negative.intersection(attempts):
+                error.msg += ' (recently failed to fetch; use --refresh-negative to try again)'
             if self.verbose and len(attempts) > 1:
                 # Reveal attemps
                 error.msg += ', trying the following location(s):\n    ' + \
@@ -344,12 +490,138 @@ class CachingResolver(lxml.etree.Resolver):
                 # Haven't printed a verbose message yet
                 typename = self.include and 'include' or 'entity'
                 xml2rfc.log.note('Resolving ' + typename + '...', result)
+            self.add_resource(original, result, cached=tried_cache)
             return result
 
-    def cache(self, url):
+    def get_locked(self, request, line_no=0):
+        """ Return the path request was resolved to when the lockfile was written """
+        entry = self.locked.get(request)
+        if not entry:
+            raise XmlRfcError('Unable to resolve external request: "%s", which is not in the lockfile %s'
+                              % (request, self.locked.filename), line_no=line_no, filename=self.source)
+        path = entry['path']
+        typename = self.include and 'include' or 'entity'
+        xml2rfc.log.note('Resolving ' + typename + '...', path, '(from lockfile)')
+        self.add_resource(request, path, data=self.locked.read(path))
+        return path
+
+    def read(self, path):
+        """ Return the content of a resolved path, if it's not a local file, or else None
+
+            That is the content of a bibxml bundle member, or with --locked,
+            of a resource in the lockfile.
+        """
+        if self.locked:
+            return self.locked.read(path)
+        return xml2rfc.bundle.read(path)
+
+    def get_subdirs(self, name):
+        """ Return the bibxml subdirectories to search for name, in order
+
+            The subdirectory where a reference with the same name prefix
+            was last found comes first.
+        """
+        index = self.get_write_index()
+        prefix = subdir_prefix(name)
+        subdir = index.get_subdir(prefix) if index and prefix else None
+        if subdir in xml2rfc.NET_SUBDIRS:
+            return [ subdir ] + [ s for s in xml2rfc.NET_SUBDIRS if s != subdir ]
+        return xml2rfc.NET_SUBDIRS
+
+    def probe(self, candidates, name):
+        """ Return the first of the candidate URLs which can be resolved, or None
+
+            The candidates are (subdir, url) pairs, in order of priority.
+            They are looked for in the caches first.  Then the first
+            candidate is fetched on its own, and if that fails, the others
+            are fetched concurrently, and the first which is found in order
+            of priority wins.  The subdirectory where name was found is
+            remembered for the name prefix.
+        """
+        result = None
+        for subdir, url in candidates:
+            result = self.cache(url, network=False)
+            if result:
+                break
+        else:
+            subdir, url = candidates[0]
+            result = self.cache(url)
+            if not result and len(candidates) > 1:
+                pool = concurrent.futures.ThreadPoolExecutor(min(self.probe_jobs, len(candidates) - 1))
+                futures = [ (subdir, pool.submit(self.probe_cache, url)) for subdir, url in candidates[1:] ]
+                try:
+                    # The messages of the probes are written in order of
+                    # priority, up to the one which wins, as when the
+                    # candidates were tried one at a time
+                    for subdir, future in futures:
+                        result, messages = future.result()
+                        xml2rfc.log.get_write_err().write(messages)
+                        if result:
+                            break
+                finally:
+                    # Wait for the probes which have started, so that they
+                    # don't log or write to the cache after this returns,
+                    # such as while the next document is processed
+                    pool.shutdown(wait=True, cancel_futures=True)
+        if result:
+            index = self.get_write_index()
+            prefix = subdir_prefix(name)
+            if index and prefix and index.get_subdir(prefix) != subdir:
+                index.put_subdir(prefix, subdir)
+        return result
+
+    def probe_cache(self, url):
+        """ Return the path to a cached URL, see cache(), and the messages logged meanwhile """
+        with xml2rfc.log.capture() as output:
+            result = self.cache(url)
+        return result, output.getvalue()
+
+    def get_write_index(self):
+        if not self.write_cache:
+            return None
+        return xml2rfc.cacheindex.get_index(os.path.join(self.write_cache, xml2rfc.CACHE_PREFIX))
+
+    def find_in_bundles(self, names, attempts, dirs=None):
+        """ Return the path of the first of names found in a bibxml bundle, or None
+
+            The bundles are those among dirs, by default the library
+            directories.  The bundle member paths tried are added to attempts.
+        """
+        for dir in (dirs if dirs != None else self.library_dirs or []):
+            bundle = xml2rfc.bundle.get_bundle(dir)
+            if bundle:
+                for name in names:
+                    attempts.append(dir + xml2rfc.bundle.MEMBER_SEPARATOR + name)
+                    path = bundle.find(name)
+                    if path:
+                        return path
+        return None
+
+    def add_resource(self, request, path, cached=False, data=None):
+        """ Record an external resource resolved for the document
+
+            The resources are kept in a dictionary keyed by request, with the
+            path the request resolved to, the sha256 digest of its content
+            (None if the content is not available locally), and whether the
+            path is a reference cache entry.  The content of in-memory
+            include files is given as data.
+        """
+        if not request in self.resources:
+            if data is None:
+                data = xml2rfc.bundle.read(path)
+            if data is not None:
+                digest = hashlib.sha256(data).hexdigest()
+            elif cached and self.read_cache_metadata(path).get('sha256'):
+                digest = self.read_cache_metadata(path)['sha256']
+            else:
+                digest = file_sha256(path) if os.path.isfile(path) else None
+            self.resources[request] = { 'path': path, 'sha256': digest, 'cached': cached, }
+
+    def cache(self, url, network=True):
         """ Return the path to a cached URL
 
             Checks for the existence of the cache and creates it if necessary.
+            Without network, returns '' if the URL isn't cached.
         """
         scheme, netloc, path, query, fragment = urlsplit(url)
         root, ext = os.path.splitext(path)
@@ -359,34 +631,69 @@ class CachingResolver(lxml.etree.Resolver):
         # Try to load the URL from each cache in `read_cache`
         for dir in self.read_caches:
             cached_path = os.path.join(dir, xml2rfc.CACHE_PREFIX, basename)
-            if os.path.exists(cached_path):
-                if os.path.getmtime(cached_path) < (time.time() - self.cache_refresh_secs) and not self.no_network:
-                    xml2rfc.log.note('Cached version at %s too old; will refresh cache for %s %s' % (cached_path, typename, url))
-                    break
-                else:
-                    xml2rfc.log.note('Resolving ' + typename + '...', url)
-                    xml2rfc.log.note('Loaded from cache', cached_path)
-                    xml = lxml.etree.parse(cached_path)
-                    if xml.getroot().tag == 'reference':
-                        if self.validate_ref(xml):
-                            return cached_path
-                        else:
-                            xml2rfc.log.error('Failure validating reference xml from %s' % cached_path )
-                            os.path.unlink(cached_path)
-                            return url
-                    elif xml.getroot().tag == 'referencegroup':
-                        if self.validate_ref_group(xml):
-                            return cached_path
-                        else:
-                            xml2rfc.log.error('Failure validating referencegroup xml from %s' % cached_path )
-                            os.path.unlink(cached_path)
+            entry = self.get_cache_entry(cached_path)
+            if entry:
+                age = time.time() - entry['fetched']
+                if age > self.cache_refresh_secs and not self.no_network:
+                    if age < self.cache_stale_secs:
+                        xml2rfc.log.note('Cached version at %s too old; will refresh cache in the background for %s %s' % (cached_path, typename, url))
+                        self.refresh_in_background(url, cached_path, basename)
                     else:
-                        return cached_path
+                        xml2rfc.log.note('Cached version at %s too old; will refresh cache for %s %s' % (cached_path, typename, url))
+                        cached_path = self.revalidate(url, cached_path, basename)
+                        entry = cached_path and self.get_cache_entry(cached_path)
+                        if not entry:
+                            break
+                xml2rfc.log.note('Resolving ' + typename + '...', url)
+                xml2rfc.log.note('Loaded from cache', cached_path)
+                if entry['valid'] is None or entry['valid']:
+                    self.record_hit(cached_path)
+                    return cached_path
+                # Left in place, as other processes may be reading it; it's
+                # replaced when the URL is fetched again
+                xml2rfc.log.error('Failure validating %s xml from %s' % (entry['root'], cached_path))
 
+        if not network:
+            return ''
         xml2rfc.log.note('Resolving ' + typename + '...', url)
-        if not netloc in self.sessions:
-            self.sessions[netloc] = requests.Session()
-        session = self.sessions[netloc]
+        error = self.get_negative(url)
+        if error:
+            xml2rfc.log.note('Not fetching %s, which recently failed (%s)' % (url, error))
+            self.negative.add(url)
+            return ''
+        if not self.write_cache:
+            return self.fetch(url, basename)
+        with cache_lock(os.path.join(self.write_cache, xml2rfc.CACHE_PREFIX), url):
+            # Another process or thread may have fetched the URL, or failed
+            # to, while this one waited for the lock
+            cached_path = os.path.join(self.write_cache, xml2rfc.CACHE_PREFIX, basename)
+            entry = self.get_cache_entry(cached_path)
+            if entry and (entry['valid'] is None or entry['valid']) and time.time() - entry['fetched'] < self.cache_refresh_secs:
+                xml2rfc.log.note('Loaded from cache', cached_path)
+                self.record_hit(cached_path)
+                return cached_path
+            error = self.get_negative(url)
+            if error:
+                xml2rfc.log.note('Not fetching %s, which just failed (%s)' % (url, error))
+                self.negative.add(url)
+                return ''
+            return self.fetch(url, basename)
+
+    def fetch(self, url, basename):
+        """ Fetch url, and add it to the cache as basename, returning its path or '' """
+        index = self.get_write_index()
+        if index:
+            index.record_miss()
+        netloc = urlsplit(url).netloc
+        # Hosts which can't be reached are only remembered by this process,
+        # as the failure may well be transient; only responses which say
+        # that the URL doesn't exist go in the negative cache
+        if netloc in self.unreachable:
+            xml2rfc.log.error('Failure fetching URL %s (%s)' % (url, self.unreachable[netloc]))
+            return ''
+        # Imported here, as it's slow to import and often not needed
+        import requests
+        session = self.get_session(netloc)
         exc = None
         for i in range(4):
             try:
@@ -396,55 +703,241 @@ class CachingResolver(lxml.etree.Resolver):
                 exc = e
                 xml2rfc.log.note('  retrying %s (%s)' % (url, e.args[0].args[0]))
         else:
-            xml2rfc.log.error('Failure fetching URL %s (%s)' % (url, exc.args[0].args[0]))
+            # The reason is also given for other URLs on the host, so it
+            # mustn't name this one, as the requests exception does.  Use
+            # the urllib3 reason, without the connection it starts with
+            reason = getattr(exc.args[0], 'reason', None) or exc
+            reason = re.sub(r'^(<[^>]*>|\w+\([^)]*\)): ', '', str(reason))
+            self.unreachable[netloc] = 'host %s unreachable: %s' % (netloc, reason)
+            xml2rfc.log.error('Failure fetching URL %s (%s)' % (url, self.unreachable[netloc]))
             return ''
         for rr in r.history + [r, ]:
             xml2rfc.log.note(' ... %s %s' % (rr.status_code, rr.url))
         if r.status_code == 200:
-            if self.write_cache:
-                try:
-                    xml = lxml.etree.fromstring(r.text.encode('utf8'))
-                    if xml.tag == 'reference':
-                        if self.validate_ref(xml):
-                            return self.add_to_cache(r.url, xml, basename)
-                        else:
-                            xml2rfc.log.error('Failure validating reference xml from %s' % url )
-                            return url
-                    elif xml.tag == 'referencegroup':
-                        if self.validate_ref_group(xml):
-                            return self.add_to_cache(r.url, xml, basename)
-                        else:
-                            xml2rfc.log.error('Failure validating referencegroup xml from %s' % url )
-                            return url
+            self.set_negative(url, None)
+            return self.cache_response(url, r, basename)
+        else:
+            # Invalid URL -- Error will be displayed in getReferenceRequest
+            xml2rfc.log.note("URL retrieval failed with status code %s for '%s'" % (r.status_code, r.url))
+            if r.status_code in (404, 410):
+                self.set_negative(url, 'status code %s' % r.status_code)
+            return ''
+
+    def record_hit(self, cached_path):
+        """ Count a cache hit, and note that cached_path was used, for eviction """
+        index = xml2rfc.cacheindex.get_index(os.path.dirname(cached_path))
+        if index:
+            index.record_hit(os.path.basename(cached_path))
+
+    def get_negative(self, url):
+        """ Return the error of a failure to fetch url within the negative cache TTL, or None """
+        index = self.get_write_index()
+        if not index or not self.options.negative_cache_ttl or self.options.refresh_negative:
+            return None
+        miss = index.get_miss(url)
+        if miss and time.time() - miss[1] < self.options.negative_cache_ttl:
+            return miss[0]
+        return None
+
+    def set_negative(self, url, error):
+        """ Record a failure to fetch url, or with error None, that it was fetched """
+        index = self.get_write_index()
+        if index and self.options.negative_cache_ttl:
+            if error:
+                index.put_miss(url, error, time.time())
+            elif self.options.refresh_negative or index.get_miss(url):
+                index.delete_miss(url)
+
+    def cache_response(self, url, r, basename):
+        """ Add a fetched reference to the cache, returning its path
+
+            Returns url if the response is not a valid reference or
+            referencegroup, or can't be cached.
+        """
+        if self.write_cache:
+            try:
+                xml = lxml.etree.fromstring(r.text.encode('utf8'))
+                if xml.tag == 'reference':
+                    if self.validate_ref(xml):
+                        return self.add_to_cache(r.url, xml, basename, headers=r.headers)
                     else:
+                        xml2rfc.log.error('Failure validating reference xml from %s' % url )
                         return url
-                except Exception as e:
-                    xml2rfc.log.error(str(e))
+                elif xml.tag == 'referencegroup':
+                    if self.validate_ref_group(xml):
+                        return self.add_to_cache(r.url, xml, basename, headers=r.headers)
+                    else:
+                        xml2rfc.log.error('Failure validating referencegroup xml from %s' % url )
+                        return url
+                else:
                     return url
-            else:
+            except Exception as e:
+                xml2rfc.log.error(str(e))
                 return url
         else:
-            # Invalid URL -- Error will be displayed in getReferenceRequest
-            xml2rfc.log.note("URL retrieval failed with status code %s for '%s'" % (r.status_code, r.url))
-            return ''
+            return url
+
+    def revalidate(self, url, cached_path, basename):
+        """ Check with the server whether a stale cache entry is still current
+
+            Makes a conditional request with the validators saved when the
+            entry was fetched.  If the server says the entry is unchanged,
+            the entry is marked as fresh, and its path returned.  If the
+            server returns new content, the entry is replaced, and the path
+            of the new entry returned.  Otherwise returns None, and the entry
+            should be fetched again.
+        """
+        metadata = self.read_cache_metadata(cached_path)
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        netloc = urlsplit(url).netloc
+        if not headers or netloc in self.unreachable:
+            return None
+        # Imported here, as it's slow to import and often not needed
+        import requests
+        try:
+            r = self.get_session(netloc).get(url, headers=headers)
+        except requests.exceptions.RequestException:
+            return None
+        xml2rfc.log.note(' ... %s %s' % (r.status_code, r.url))
+        if r.status_code == 304:
+            try:
+                os.utime(cached_path)
+                mtime = os.stat(cached_path).st_mtime
+            except OSError:
+                return None
+            index = xml2rfc.cacheindex.get_index(os.path.dirname(cached_path))
+            if index:
+                index.touch(os.path.basename(cached_path), time.time(), mtime)
+            return cached_path
+        elif r.status_code == 200:
+            path = self.cache_response(url, r, basename)
+            return path if path != url else None
+        return None
+
+    def refresh(self, url, cached_path, basename):
+        """ Revalidate, or else fetch again, a stale cache entry """
+        try:
+            if not self.revalidate(url, cached_path, basename):
+                r = self.get_session(urlsplit(url).netloc).get(url)
+                if r.status_code == 200:
+                    self.cache_response(url, r, basename)
+        except Exception as e:
+            xml2rfc.log.note('Could not refresh cache for %s: %s' % (url, e))
+        finally:
+            with refreshing_lock:
+                refreshing.discard(cached_path)
+
+    def refresh_in_background(self, url, cached_path, basename):
+        """ Refresh a stale cache entry in a new thread
+
+            The thread is not a daemon thread, so a refresh started near the
+            end of a run is completed before the program exits.
+        """
+        with refreshing_lock:
+            if cached_path in refreshing:
+                return
+            refreshing.add(cached_path)
+        threading.Thread(target=self.refresh, args=(url, cached_path, basename), name='cache refresh').start()
+
+    def read_cache_metadata(self, cached_path):
+        """ Return the cache index entry of cached_path, or an empty dictionary """
+        index = xml2rfc.cacheindex.get_index(os.path.dirname(cached_path))
+        return (index and index.get(os.path.basename(cached_path))) or {}
+
+    def get_cache_entry(self, cached_path):
+        """ Return the cache index entry of cached_path, or None if it doesn't exist
+
+            Cached files which are not in the index, or were changed after
+            they were indexed, are parsed and validated, and indexed again.
+            An entry's 'valid' is None if the file isn't a reference or
+            referencegroup.
+        """
+        try:
+            mtime = os.stat(cached_path).st_mtime
+        except OSError:
+            return None
+        dir, basename = os.path.split(cached_path)
+        index = xml2rfc.cacheindex.get_index(dir)
+        entry = index.get(basename) if index else None
+        if entry and entry['mtime'] == mtime:
+            return entry
+        digest = file_sha256(cached_path)
+        if entry and entry['sha256'] == digest:
+            # Only touched, the modification time is the fetch time
+            entry.update(fetched=mtime, mtime=mtime)
+        else:
+            xml = lxml.etree.parse(cached_path)
+            root = xml.getroot()
+            if root.tag == 'reference':
+                valid = self.validate_ref(xml)
+            elif root.tag == 'referencegroup':
+                valid = self.validate_ref_group(xml)
+            else:
+                valid = None
+            entry = {
+                'basename': basename,
+                'url': root.get('{%s}base'%xml2rfc.utils.namespaces['xml']),
+                'fetched': mtime,
+                'mtime': mtime,
+                'sha256': digest,
+                'root': root.tag,
+                'valid': valid,
+            }
+        if index:
+            index.put(entry)
+        return entry
+
+    def get_session(self, netloc):
+        """ Return the keep-alive session for netloc, which may be shared by threads """
+        import requests
+        with self.sessions_lock:
+            if not netloc in self.sessions:
+                session = requests.Session()
+                # Keep a connection per prefetch thread
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, PROBE_JOBS, self.options.prefetch_jobs or 0))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[netloc] = session
+            return self.sessions[netloc]
 
     def validate_ref(self, xml):
-        ref_rng_file = os.path.join(os.path.dirname(__file__), 'data', 'reference.rng')
-        ref_rng = lxml.etree.RelaxNG(file=ref_rng_file)
-        return ref_rng.validate(xml)
+        return xml2rfc.schemas.validate('reference', xml)
 
     def validate_ref_group(self, xml):
-        ref_rng_file = os.path.join(os.path.dirname(__file__), 'data', 'referencegroup.rng')
-        ref_rng = lxml.etree.RelaxNG(file=ref_rng_file)
-        return ref_rng.validate(xml)
+        return xml2rfc.schemas.validate('referencegroup', xml)
 
-    def add_to_cache(self, url, xml, basename):
+    def add_to_cache(self, url, xml, basename, headers=None):
+        """ Write a valid reference to the cache, and index it with the HTTP validators from headers
+
+            The file is written under a temporary name and renamed into
+            place, so that readers, possibly in other threads, never see a
+            partially written file.
+        """
         xml.set('{%s}base'%xml2rfc.utils.namespaces['xml'], url)
         text = lxml.etree.tostring(xml, encoding='utf-8')
         write_path = os.path.join(self.write_cache,
                                   xml2rfc.CACHE_PREFIX, basename)
-        with io.open(write_path, 'w', encoding='utf-8') as cache_file:
-            cache_file.write(text.decode('utf-8'))
+        tmp_path = '%s.%s-%s.tmp' % (write_path, os.getpid(), threading.get_ident())
+        with io.open(tmp_path, 'wb') as cache_file:
+            cache_file.write(text)
+        os.replace(tmp_path, write_path)
+        index = xml2rfc.cacheindex.get_index(os.path.dirname(write_path))
+        if index:
+            index.put({
+                'basename': basename,
+                'url': url,
+                'fetched': time.time(),
+                'mtime': os.stat(write_path).st_mtime,
+                'sha256': hashlib.sha256(text).hexdigest(),
+                'root': xml.tag,
+                'valid': True,
+                'etag': headers.get('ETag') if headers else None,
+                'last_modified': headers.get('Last-Modified') if headers else None,
+            })
         xml2rfc.log.note('Added file to cache: ', write_path)
         return write_path
 
@@ -459,6 +952,75 @@ class AnnotatedElement(lxml.etree.ElementBase):
         else:
             return str(value)
 
+@contextlib.contextmanager
+def cache_lock(dir, key):
+    """ Hold an exclusive lock on key in the cache directory dir
+
+        The lock is shared by the threads and processes using the cache
+        directory.  Keys are hashed to one of CACHE_LOCK_STRIPES lock files,
+        so unrelated keys occasionally share a lock.  Without file locking
+        (on Windows), or if the lock file can't be opened, nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+    stripe = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % CACHE_LOCK_STRIPES
+    path = os.path.join(dir, CACHE_LOCK_DIR, '%02x' % stripe)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = io.open(path, 'ab')
+    except (IOError, OSError):
+        file = None
+    if file is None:
+        yield
+        return
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the file releases the lock
+        file.close()
+
+def subdir_prefix(name):
+    """ Return the prefix of a reference name which determines its bibxml subdirectory
+
+        For instance 'reference.RFC.' for 'reference.RFC.2119.xml'.  Returns
+        None for names without a prefix.
+    """
+    parts = name.split('.')
+    return '.'.join(parts[:2]) + '.' if len(parts) > 2 else None
+
+def find_requests(text, base):
+    """ Return the external resources referenced in text, as (request, include) pairs
+
+        External entity and XInclude requests are made absolute relative to
+        base, the URL or path of text, as libxml2 does before asking the
+        resolver.  Include PI requests are returned as given (include=True),
+        to be looked up in the library directories and network locations.
+    """
+    found = []
+    for match in ENTITY_RE.finditer(text):
+        # Entities which are declared but not used are not resolved
+        if (b'%' if match.group(1) else b'&') + match.group(2) + b';' in text:
+            found.append((match.group(3) or match.group(4), False))
+    for regex, include in [(XINCLUDE_RE, False), (INCLUDE_PI_RE, True)]:
+        for match in regex.finditer(text):
+            found.append((match.group(1) or match.group(2), include))
+    requests = []
+    for request, include in found:
+        request = request.decode('utf-8', 'replace').replace('&amp;', '&')
+        if request.endswith('.dtd') or request.endswith('.ent') or request.startswith('internal:'):
+            continue
+        if not include:
+            if request.startswith('file://'):
+                request = request[7:]
+            if urlparse(base).netloc:
+                request = urljoin(base, request)
+            elif not urlparse(request).netloc and not os.path.isabs(request):
+                request = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(base)), request))
+        requests.append((request, include))
+    return requests
+
 class XmlRfcParser:
 
     nsmap = {
@@ -471,7 +1033,8 @@ class XmlRfcParser:
                  cache_path=None, templates_path=base.default_options.template_dir, library_dirs=None, add_xmlns=False,
                  no_network=None, network_locs=[
                      'https://bib.ietf.org/public/rfc/',
-                 ]
+                 ],
+                 text=None, includes=None, locked=None,
                  ):
         self.options = options
         self.quiet = quiet if quiet != None else options.quiet
@@ -480,13 +1043,28 @@ class XmlRfcParser:
         self.source = source
         self.cache_path = cache_path or options.cache
         self.network_locs = network_locs
+        # External resources used by the document, see
+        # CachingResolver.add_resource()
+        self.resources = {}
+        # In-memory include files, see xml2rfc.util.file.get_include()
+        self.includes = includes
+        # Unreachable network locations, shared by the resolvers of this
+        # parser, see CachingResolver.cache()
+        self.unreachable = {}
+        # The lockfile used with --locked, see xml2rfc.lockfile
+        self.locked = locked
 
-        if self.source:
+        if text is not None:
+            self.text = text
+        elif self.source:
             with io.open(self.source, "rb", newline=None) as f:
                 self.text = f.read()
 
         # Initialize templates directory
         self.templates_path = templates_path
+        self.prefetched = False
+        # The number and version of the <rfc> element, see scan_root()
+        self.root_attributes = None
 
         if options and options.vocabulary == 'v2':
             self.default_dtd_path = os.path.join(self.templates_path, 'rfc2629.dtd')
@@ -523,14 +1101,141 @@ class XmlRfcParser:
                                         verbose=self.verbose,
                                         quiet=self.quiet,
                                         options=options,
+                                        resources=self.resources,
+                                        includes=self.includes,
+                                        unreachable=self.unreachable,
+                                        locked=self.locked,
                                     )
 
     def delete_cache(self, path=None):
         self.cachingResolver.delete_cache(path=path)
 
+    def evict_cache(self, max_size, path=None):
+        return self.cachingResolver.evict_cache(max_size, path=path)
+
+    @timed('prefetch')
+    def prefetch(self, requests=None):
+        """ Fetch the network resources the document uses into the reference cache
+
+            libxml2 asks the resolver for one external resource at a time
+            while parsing, which makes a network round trip for each
+            reference not yet cached.  Instead, scan the source, and in turn
+            the files it includes, for external entities, include PIs and
+            XIncludes, and resolve them concurrently with options.prefetch_jobs
+            threads before parsing.  Errors are not reported here, but when
+            the resource is resolved again during parsing.
+
+            If requests, a list of (request, include) pairs, is given, those
+            are fetched instead of the resources found in the source, see
+            --warm-cache.
+        """
+        if self.prefetched or self.no_network or self.locked or not self.options.prefetch_jobs:
+            return
+        self.prefetched = True
+        resolver = CachingResolver(cache_path=self.cache_path,
+                                   library_dirs=self.library_dirs,
+                                   templates_path=self.templates_path,
+                                   source=self.source,
+                                   no_network=self.no_network,
+                                   network_locs=self.network_locs,
+                                   verbose=self.verbose,
+                                   quiet=self.quiet,
+                                   options=self.options,
+                                   unreachable=self.unreachable,
+                               )
+        # The prefetch threads probe bibxml subdirectories one at a time
+        resolver.probe_jobs = 1
+        seen = set()
+        waiting = []
+        pending = {}
+        # The first request to each host is made alone, so that an
+        # unreachable host is found once, and the others fail right away
+        contacted = set()
+        probing = set()
+        write_err = xml2rfc.log.write_err
+        xml2rfc.log.write_err = io.StringIO()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.options.prefetch_jobs) as pool:
+                if requests is None:
+                    requests = find_requests(self.text, self.source)
+                while requests or waiting or pending:
+                    for item in requests:
+                        if not item in seen:
+                            seen.add(item)
+                            waiting.append(item)
+                    for item in list(waiting):
+                        request, include = item
+                        host = urlparse(request).netloc or (include and urlparse(self.network_locs[0]).netloc)
+                        if host and not host in contacted:
+                            if host in probing:
+                                continue
+                            probing.add(host)
+                        waiting.remove(item)
+                        pending[pool.submit(self.prefetch_request, resolver, *item)] = host
+                    done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED).done
+                    requests = []
+                    for future in done:
+                        contacted.add(pending.pop(future))
+                        requests += future.result()
+        finally:
+            xml2rfc.log.write_err = write_err
+        xml2rfc.log.note('Prefetched %s external resources' % len(seen))
+
+    def prefetch_request(self, resolver, request, include):
+        """ Resolve one request for prefetch(), returning the requests in its content """
+        try:
+            if include:
+                path = base = resolver.getReferenceRequest(request, include=True)
+            elif urlparse(request).netloc:
+                path = resolver.getReferenceRequest(request)
+                base = request
+            else:
+                path = base = request
+                data = get_include(self.includes, self.source, path)
+                if data is not None:
+                    return find_requests(data, base)
+                can_access(self.options, self.source, path)
+            data = xml2rfc.bundle.read(path)
+            if data is not None:
+                return find_requests(data, base)
+            with io.open(path, 'rb') as file:
+                return find_requests(file.read(), base)
+        except Exception:
+            return []
+
+    def scan_root(self):
+        """ Return the number and version attributes of the <rfc> element
+
+            Only the prolog and the start tag of the root element are
+            parsed, without loading the DTD or resolving entities, so this
+            is cheap even for large documents.  Returns (None, None) if
+            there is no <rfc> root element, or it can't be parsed, in which
+            case the full parse reports the error.
+        """
+        if self.root_attributes is None:
+            self.root_attributes = (None, None)
+            parser = lxml.etree.XMLPullParser(events=('start', ), load_dtd=False, no_network=True,
+                                              resolve_entities=False, huge_tree=True)
+            events = []
+            try:
+                for offset in range(0, len(self.text), SCAN_CHUNK_SIZE):
+                    parser.feed(self.text[offset:offset+SCAN_CHUNK_SIZE])
+                    events = list(parser.read_events())
+                    if events:
+                        break
+            except lxml.etree.XMLSyntaxError:
+                events = []
+            if events:
+                action, element = events[0]
+                if element.tag == 'rfc':
+                    self.root_attributes = (element.get('number'), element.get('version'))
+        return self.root_attributes
+
+    @timed('parse')
     def parse(self, remove_comments=True, remove_pis=False, quiet=False, strip_cdata=True, normalize=False, add_xmlns=False):
         """ Parses the source XML file and returns an XmlRfc instance """
         xml2rfc.log.note('Parsing file', self.source)
+        self.prefetch()
 
         # workaround for not being able to explicitly set namespaces on the
         # xml root element in lxml: Insert it before we parse:
@@ -541,48 +1246,13 @@ class XmlRfcParser:
             else:
                 text = text.replace(b'<rfc ', b'<rfc xmlns:%s="%s" ' % (b'xi', self.nsmap[b'xi']), 1)
 
-        # Get an iterating parser object
-        with io.BytesIO(text) as file:
-            file.name = self.source
-            context = lxml.etree.iterparse(file,
-                                          dtd_validation=False,
-                                          load_dtd=True,
-                                          attribute_defaults=True,
-                                          no_network=self.no_network,
-                                          remove_comments=remove_comments,
-                                          remove_pis=remove_pis,
-                                          remove_blank_text=True,
-                                          resolve_entities=False,
-                                          strip_cdata=strip_cdata,
-                                          events=("start",),
-                                          tag="rfc",
-                                      )
-            # resolver without knowledge of rfc_number:
-            caching_resolver = CachingResolver(cache_path=self.cache_path,
-                                            library_dirs=self.library_dirs,
-                                            templates_path=self.templates_path,
-                                            source=self.source,
-                                            no_network=self.no_network,
-                                            network_locs=self.network_locs,
-                                            verbose=self.verbose,
-                                            quiet=self.quiet,
-                                            options=self.options,
-                                         )
-            context.resolvers.add(caching_resolver)
-
-            # Get hold of the rfc number (if any) in the rfc element, so we can
-            # later resolve the "&rfc.number;" entity.
-            self.rfc_number = None
-            self.format_version = None
-            for action, element in context:
-                if element.tag == "rfc":
-                    self.rfc_number = element.attrib.get("number", None)
-                    self.format_version = element.attrib.get("version", None)
-                    break
+        # Get hold of the rfc number (if any) in the rfc element, so we can
+        # later resolve the "&rfc.number;" entity.
+        self.rfc_number, self.format_version = self.scan_root()
         if self.format_version == "3":
             self.default_dtd_path = None
 
-        # now get a regular parser, and parse again, this time resolving entities
+        # now get a regular parser, and parse, resolving entities
         parser = lxml.etree.XMLParser(dtd_validation=False,
                                       load_dtd=True,
                                       attribute_defaults=True,
@@ -604,6 +1274,10 @@ class XmlRfcParser:
                                         quiet=self.quiet,
                                         rfc_number = self.rfc_number,
                                         options=self.options,
+                                        resources=self.resources,
+                                        includes=self.includes,
+                                        unreachable=self.unreachable,
+                                        locked=self.locked,
                                     )
 
         # Add our custom resolver
@@ -620,6 +1294,9 @@ class XmlRfcParser:
             tree = lxml.etree.parse(file, parser)
         xmlrfc = XmlRfc(tree, self.default_dtd_path, nsmap=self.nsmap)
         xmlrfc.source = self.source
+        xmlrfc.resources = self.resources
+        xmlrfc.includes = self.includes
+        xmlrfc.locked = self.locked
 
         # Evaluate processing instructions before root element
         xmlrfc._eval_pre_pi()
@@ -653,7 +1330,11 @@ class XmlRfcParser:
                                                       strip_cdata=strip_cdata)
                         parser.set_element_class_lookup(element_lookup)
                         # parser.resolvers.add(self.cachingResolver) --- should this be done?
-                        ref_root = lxml.etree.parse(path, parser).getroot()
+                        data = self.cachingResolver.read(path)
+                        if data is not None:
+                            ref_root = lxml.etree.parse(io.BytesIO(data), parser, base_url=path).getroot()
+                        else:
+                            ref_root = lxml.etree.parse(path, parser).getroot()
                         ref_root.pis = pis
                         xmlrfc._elements_cache.append(ref_root)
                         for e in ref_root.iterdescendants():
@@ -696,6 +1377,13 @@ class XmlRfc(object):
         self.default_dtd_path = default_dtd_path
         self.tree = tree
         self.nsmap = nsmap
+        # External resources used by the document; shared with the parser
+        # and with copies of this instance
+        self.resources = {}
+        # In-memory include files, if any
+        self.includes = None
+        # The lockfile used with --locked, if any
+        self.locked = None
         if source:
             self.source = source
         # Pi default values
@@ -756,11 +1444,24 @@ class XmlRfc(object):
         """ Returns a list of the XML processing instructions """
         return self.pis.copy()
 
+    def copy(self):
+        """ Returns a copy of this instance with its own copy of the tree
+
+            Writers may modify the tree they are given, so each writer which
+            works from a shared parsed (and possibly prepped) document should
+            be handed a copy.
+        """
+        xmlrfc = copy.copy(self)
+        xmlrfc.tree = copy.deepcopy(self.tree)
+        xmlrfc.pis = self.pis.copy()
+        return xmlrfc
+
     def sanitize(self):
         """ Sanitize the document """
         # Strip link attachments
         xml2rfc.utils.strip_link_attachments(self.tree)
     
+    @timed('validate')
     def validate(self, dtd_path=None):
         """ Validate the document with its default dtd, or an optional one 
         
@@ -2,15 +2,21 @@
 
 from __future__ import print_function, unicode_literals
 
+import argparse
 import platformdirs
 import configargparse
+import copy
 import datetime
+import glob
 import io
 import json
 import lxml.etree
+import multiprocessing
 import os
-import pycountry
 import sys
+import time
+
+from urllib.parse import urlparse
 
 # If this script is renamed to 'xml2rfc.py' on a Windows system, the import
 # of the real xml2rfc module will break.  In order to handle this, we remove
@@ -20,6 +26,13 @@ if script_dir in sys.path:
     sys.path.remove(script_dir)
 
 import xml2rfc
+import xml2rfc.buildcache
+import xml2rfc.cacheindex
+import xml2rfc.lockfile
+import xml2rfc.timings
+
+from xml2rfc.api import extract_anchor_info, get_prepped_xmlrfc
+from xml2rfc.timings import timer
 
 try:
     from xml2rfc import debug
@@ -37,6 +50,23 @@ def get_missing_pdf_libs():
     return missing
 
 
+# The help text for --pdf depends on whether the PDF libraries can be
+# loaded.  That is slow, so is checked only when the help text is shown.
+PDF_FORMAT_HELP = 'outputs formatted PDF to file'
+
+def get_pdf_format_help():
+    if xml2rfc.HAVE_PANGO:
+        return PDF_FORMAT_HELP
+    else:
+        return '(unavailable due to missing external library)'
+
+class HelpFormatter(argparse.HelpFormatter):
+    def _get_help_string(self, action):
+        if action.help == PDF_FORMAT_HELP:
+            return get_pdf_format_help()
+        return super(HelpFormatter, self)._get_help_string(action)
+
+
 def print_pi_help(options, parser):
     pis = xml2rfc.parser.XmlRfc(None, None).pis.items()
     pis.sort()
@@ -50,6 +80,7 @@ def print_pi_help(options, parser):
 
 
 def print_country_help(options, parser):
+    import pycountry
     from xml2rfc.util.postal import country_alias
     country_ids = {}
     for c in list(pycountry.countries):
@@ -121,17 +152,105 @@ def print_values(options, parser, config_paths):
           + "%s\n  %s" % ('Config file search path:', config_paths))
     
 
-def extract_anchor_info(xml):
-    info = {
-        'version': 1,
-        'sections': {},
-        }
-    for item in xml.xpath('./middle//section'):
-        anchor = item.get('anchor')
-        label  = item.get('pn')
-        if anchor and label and not anchor.startswith('anchor-'):
-            info['sections'][anchor] = label.replace('section-','')
-    return info
+def read_batch_file(filename):
+    """ Read source file names from a batch file, one per line
+
+        Blank lines and lines starting with '#' are ignored.  The file name
+        '-' reads from standard input.
+    """
+    try:
+        if filename == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with io.open(filename, encoding='utf-8') as file:
+                lines = file.read().splitlines()
+    except IOError as e:
+        sys.exit('Could not read the batch file %s: %s' % (filename, e))
+    return [ l.strip() for l in lines if l.strip() and not l.strip().startswith('#') ]
+
+def expand_batch_sources(sources):
+    """ Expand any glob patterns among the given sources
+
+        Names which don't match any files are kept as-is, so that they will
+        be reported as missing.
+    """
+    expanded = []
+    for source in sources:
+        matches = sorted(glob.glob(source)) if glob.has_magic(source) else []
+        for path in matches or [ source ]:
+            if not path in expanded:
+                expanded.append(path)
+    return expanded
+
+# Age buckets of --cache-stats, as (upper bound in seconds, label)
+CACHE_AGE_BUCKETS = [
+    (60*60*24, '< 1 day'),
+    (60*60*24*7, '< 1 week'),
+    (xml2rfc.parser.CACHE_REFRESH_SECS, '< %s days' % (xml2rfc.parser.CACHE_REFRESH_SECS//(60*60*24))),
+    (xml2rfc.parser.CACHE_STALE_SECS, '< %s days' % (xml2rfc.parser.CACHE_STALE_SECS//(60*60*24))),
+    (None, 'older'),
+]
+
+def print_cache_stats(options):
+    """ Print the number and size of the entries of each reference cache, their ages, and the hit ratio """
+    resolver = xml2rfc.parser.XmlRfcParser('', options=options).cachingResolver
+    now = time.time()
+    for cache in resolver.read_caches:
+        dir = os.path.join(cache, xml2rfc.CACHE_PREFIX)
+        if not os.path.isdir(dir):
+            continue
+        index = xml2rfc.cacheindex.get_index(dir)
+        if index:
+            index.flush()
+        entries = index.entries() if index else {}
+        stats = index.stats() if index else {}
+        count = size = 0
+        ages = [ 0 ] * len(CACHE_AGE_BUCKETS)
+        for name in os.listdir(dir):
+            if not name.endswith('.xml'):
+                continue
+            try:
+                stat = os.stat(os.path.join(dir, name))
+            except OSError:
+                continue
+            count += 1
+            size += stat.st_size
+            age = now - (entries.get(name, {}).get('fetched') or stat.st_mtime)
+            for i, (limit, label) in enumerate(CACHE_AGE_BUCKETS):
+                if limit is None or age < limit:
+                    ages[i] += 1
+                    break
+        hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+        print('Cache directory %s:' % os.path.normpath(dir))
+        print('  entries:   %s (%s bytes)' % (count, size))
+        if index:
+            ratio = ' (%.0f%% hits)' % (100.0 * hits / (hits + misses)) if hits + misses else ''
+            print('  hits:      %s, misses: %s%s' % (hits, misses, ratio))
+            print('  negative:  %s' % stats.get('negative', 0))
+        print('  fetched:   %s' % ', '.join( '%s: %s' % (label, n) for (limit, label), n in zip(CACHE_AGE_BUCKETS, ages) ))
+
+def warm_cache(sources, options):
+    """ Fetch the references used by the given drafts, and the given reference names or URLs, into the cache
+
+        The references of each draft, and the given references, are
+        fetched concurrently with --prefetch-jobs threads.
+    """
+    options.prefetch_jobs = options.prefetch_jobs or 1
+    names = []
+    for source in sources:
+        if os.path.isfile(source):
+            xml2rfc.log.note('Warming the cache for', source)
+            xml2rfc.parser.XmlRfcParser(source, options=options).prefetch()
+        else:
+            names.append((source, not urlparse(source).netloc))
+    if names:
+        xml2rfc.parser.XmlRfcParser('', options=options, text=b'').prefetch(requests=names)
+
+# The allowed values of options with a fixed set of values, which the render
+# server also checks for request options
+OPTION_CHOICES = {
+    'table_borders': ['full', 'light', 'minimal', 'min', ],
+}
 
 optionparser = None
 
@@ -149,9 +268,10 @@ def main():
                                         add_help=False,
                                         add_config_file_help=False,
                                         default_config_files=config_paths,
+                                        formatter_class=HelpFormatter,
                                     )
     input_options = optionparser.add_argument_group('Positional arguments')
-    input_options.add_argument('source', nargs='?', help="Input XML file to render to one or more of the available formats.")
+    input_options.add_argument('source', nargs='*', help="Input XML file to render to one or more of the available formats.")
 
     help_options = optionparser.add_argument_group('Documentation options',
                     'Some options to generate built-in documentation.')
@@ -188,12 +308,8 @@ def main():
                            help='outputs formatted HTML to file')
     formatgroup.add_argument('--nroff', action='store_true',
                            help='outputs formatted nroff to file (only v2 input)')
-    if xml2rfc.HAVE_PANGO:
-        formatgroup.add_argument('--pdf', action='store_true',
-                               help='outputs formatted PDF to file')
-    else:
-        formatgroup.add_argument('--pdf', action='store_true',
-                               help='(unavailable due to missing external library)')
+    formatgroup.add_argument('--pdf', action='store_true',
+                           help=PDF_FORMAT_HELP)
     formatgroup.add_argument('--raw', action='store_true',
                            help='outputs formatted text to file, unpaginated (only v2 input)')
     formatgroup.add_argument('--expand', action='store_true',
@@ -211,12 +327,30 @@ def main():
 
 
     plain_options = optionparser.add_argument_group('Generic Switch Options')
+    plain_options.add_argument(      '--batch', action='store_true', default=False,
+                            help='render all the given source files, which may also be given as glob patterns, '
+                                 'in one run, and report which of them failed')
     plain_options.add_argument('-C', '--clear-cache', action='store_true', default=False,
                             help='purge the cache and exit')
+    plain_options.add_argument(      '--cache-stats', action='store_true', default=False,
+                            help='show the number, size and age of the entries of the reference caches, and '
+                                 'the cache hit ratio, and exit')
     plain_options.add_argument(      '--debug', action='store_true',
                             help='Show debugging output')
+    plain_options.add_argument(      '--evict-cache', action='store_true', default=False,
+                            help='remove the least recently used entries of the reference cache until it is no '
+                                 'larger than --cache-size, and exit')
+    plain_options.add_argument(      '--lockfile', action='store_true', default=False,
+                            help='write a lockfile next to the outputs, with the external resources the render '
+                                 'used: entities, includes, references, artwork and sourcecode files, CSS and '
+                                 'JavaScript')
+    plain_options.add_argument(      '--locked', action='store_true', default=False,
+                            help='resolve the external resources from the lockfile written with --lockfile, '
+                                 'without network access or searching the library and cache directories')
     plain_options.add_argument('-n', '--no-dtd', action='store_true',
                             help='disable DTD validation step')
+    plain_options.add_argument(      '--no-build-cache', action='store_true',
+                            help="don't use the build cache, even if --build-cache is given")
     plain_options.add_argument('-N', '--no-network', action='store_true', default=False,
                             help='don\'t use the network to resolve references')
     plain_options.add_argument('-O', '--no-org-info', dest='first_page_author_org', action='store_false', default=True,
@@ -227,19 +361,36 @@ def main():
                             help='ignore config file settings')
     plain_options.add_argument('--allow-local-file-access', action="store_true", default=False,
                             help='Allow local file system references')
+    plain_options.add_argument(      '--refresh-negative', action='store_true', default=False,
+                            help='try again to fetch references which recently failed to fetch, see --negative-cache-ttl')
     plain_options.add_argument('-r', '--remove-pis', action='store_true', default=False,
                             help='Remove XML processing instructions')
     plain_options.add_argument('-u', '--utf8', action='store_true',
                             help='generate utf8 output')
     plain_options.add_argument('-v', '--verbose', action='store_true',
                             help='print extra information')
+    plain_options.add_argument(      '--warm-cache', action='store_true', default=False,
+                            help='fetch the references used by the given source files, and the given reference '
+                                 'names (such as reference.RFC.2119) or URLs, into the reference cache, and exit')
+    plain_options.add_argument(      '--watch', action='store_true', default=False,
+                            help='keep running, and render the source file again whenever it, or a file it '
+                                 'includes, changes')
 
 
     value_options = optionparser.add_argument_group('Generic Options with Values')
     value_options.add_argument('-b', '--basename', dest='basename', metavar='NAME',
                             help='specify the base name for output files')
+    value_options.add_argument(      '--batch-file', dest='batch_file', metavar='FILE',
+                            help='read the names of source files to render from FILE, one per line; implies --batch')
+    value_options.add_argument(      '--build-cache', dest='build_cache', metavar='DIR',
+                            help='keep rendered outputs in a cache in DIR, and reuse them when the source, the '
+                                 'files and references it uses, and the options are unchanged')
+    value_options.add_argument(      '--build-cache-size', dest='build_cache_size', type=int, default=1024, metavar='MB',
+                            help='the maximum size of the build cache, in megabytes; default: 1024')
     value_options.add_argument('-c', '--cache', dest='cache', metavar='PATH',
                             help='specify a primary cache directory to write to; default: try [ %s ]'%', '.join(xml2rfc.CACHES) )
+    value_options.add_argument(      '--cache-size', dest='cache_size', type=int, default=256, metavar='MB',
+                            help='with --evict-cache: the maximum size of the reference cache, in megabytes; default: 256')
     value_options.add_argument(      '--config-file', dest="config_file", metavar='FILE', is_config_file_arg=True,
                             help='specify a configuration file')
     value_options.add_argument('-d', '--dtd', dest='dtd', metavar='DTDFILE', help='specify an alternate dtd file')
@@ -249,12 +400,41 @@ def main():
                             help='Deprecated.  The same as -o')
     value_options.add_argument('-i', '--indent', type=int, default=2, metavar='INDENT',
                             help='With some v3 formatters: Indentation to use when pretty-printing XML')
+    value_options.add_argument(      '--jobs', type=int, default=None, metavar='N',
+                            help='with --batch or --serve: the number of worker processes to use; default: the number of CPUs')
+    value_options.add_argument(      '--negative-cache-ttl', dest='negative_cache_ttl', type=int, default=3600, metavar='SECS',
+                            help='the time during which a reference which was not found (HTTP status 404 or 410) '
+                                 'is not tried again, or 0 to always try again; default: 3600')
     value_options.add_argument('-o', '--out', dest='output_filename', metavar='FILE',
                             help='specify an explicit output filename')
     value_options.add_argument('-p', '--path', dest='output_path', metavar='PATH',
                             help='specify the directory path for output files')
+    value_options.add_argument(      '--render-profile', dest='render_profile', nargs='?', const='table',
+                            choices=['table', 'stacks'], metavar='FORMAT',
+                            help='with v3 --text and --html: report the number of calls and the time spent in the '
+                                 'renderer of each element, as a table on stderr or, with --render-profile=stacks, as '
+                                 'collapsed stacks for flame graph tools on stdout')
+    value_options.add_argument(      '--render-timeout', dest='render_timeout', type=int, default=300, metavar='SECS',
+                            help='with --serve: the time after which a render request fails with status 504, and '
+                                 'the worker processes are restarted if the render is still running, or 0 for no '
+                                 'limit; default: 300')
+    value_options.add_argument(      '--prefetch-jobs', dest='prefetch_jobs', type=int, default=8, metavar='N',
+                            help='the number of external references and includes to fetch concurrently before '
+                                 'parsing, or 0 to fetch them one at a time while parsing; default: 8')
     value_options.add_argument('-s', '--silence', action='append', type=str, metavar='STRING',
                             help="Silence any warning beginning with the given string")
+    value_options.add_argument(      '--serve', metavar='ADDRESS',
+                            help='run as a render server on [HOST:]PORT, or on the Unix domain socket unix:PATH, '
+                                 'using --jobs worker processes.  Other options given are used as defaults for '
+                                 'the render requests')
+    value_options.add_argument(      '--timings', nargs='?', const='text', choices=['text', 'json'], metavar='FORMAT',
+                            help='report the wall time, CPU time and peak memory growth of each processing stage, '
+                                 'as text on stderr or, with --timings=json, as a line of JSON on stdout')
+    value_options.add_argument(      '--validate', choices=['once', 'never', 'always'], default='once', metavar='POLICY',
+                            help='when to validate documents against the v3 schema in the preptool: once, not '
+                                 'validating content again which was found valid before in this process; never, '
+                                 'for documents which were validated before, for instance when submitted; or '
+                                 'always; default: once')
 
     formatoptions = optionparser.add_argument_group('Generic Format Options')
     formatoptions.add_argument('--v3', action='store_true', default=True,
@@ -284,7 +464,7 @@ def main():
                             help='don\'t do pagination of v3 draft text format')
     textoptions.add_argument('--table-hyphen-breaks', action='store_true', default=False,
                             help='More easily do line breaks after hyphens in table cells to give a more compact table')
-    textoptions.add_argument('--table-borders', default='full', choices=['full', 'light', 'minimal', 'min', ],
+    textoptions.add_argument('--table-borders', default='full', choices=OPTION_CHOICES['table_borders'],
                             help='The style of table borders to use for text output; one of full/light/minimal')
     textoptions.add_argument('--rfc-html-archive-url', default="https://www.rfc-editor.org/rfc/",
                            help='URL for HTML file archive of RFCs')
@@ -343,7 +523,7 @@ def main():
     # in order to know if we should ignore config files
     if options.skip_config_files:
         options = optionparser.parse_args(config_file_contents='')
-    args = [ options.source ]
+    args = list(options.source)
     # Some additional values not exposed as options
     options.doi_base_url = "https://doi.org/"
     options.no_css = False
@@ -391,6 +571,12 @@ def main():
     if (options.docfile or options.manpage) and not options.list_symbols:
         options.list_symbols = default_options.list_symbols
 
+    if options.docfile or options.manpage:
+        # The documentation shows the option help texts
+        for action in optionparser._actions:
+            if action.help == PDF_FORMAT_HELP:
+                action.help = get_pdf_format_help()
+
     if not options.silence:
         options.silence = default_options.silence
 
@@ -413,7 +599,35 @@ def main():
         xml2rfc.parser.XmlRfcParser('').delete_cache(path=options.cache)
         sys.exit(0)
 
-    if len(args) < 1:
+    if options.cache_stats:
+        print_cache_stats(options)
+        sys.exit(0)
+
+    if options.evict_cache:
+        if options.cache_size < 0:
+            sys.exit('The --cache-size must not be negative.')
+        count, size = xml2rfc.parser.XmlRfcParser('', options=options).evict_cache(options.cache_size*1024*1024, path=options.cache)
+        print('Evicted %s cache entries, %s bytes' % (count, size))
+        sys.exit(0)
+
+    if options.warm_cache:
+        if options.no_network:
+            sys.exit('Cannot use --warm-cache together with --no-network.')
+        if len(args) < 1:
+            sys.exit('Expected source files or reference names to be given with --warm-cache.')
+        warm_cache(args, options)
+        sys.exit(0)
+
+    if options.batch_file:
+        options.batch = True
+        args += read_batch_file(options.batch_file)
+
+    if options.serve:
+        if args:
+            sys.exit('No source files can be given together with --serve.')
+        if not options.serve.startswith('unix:') and not options.serve.rpartition(':')[2].isdigit():
+            sys.exit('Expected --serve to be given [HOST:]PORT or unix:PATH, but found "%s"' % options.serve)
+    elif len(args) < 1:
         optionparser.print_help()
         sys.exit(2)
 
@@ -426,12 +640,25 @@ def main():
             pdf_requirements_info = get_pdf_help(missing_libs)
             sys.exit(header+pdf_requirements_info)
 
-    source = args[0]
-    if not source:
-        sys.exit('No source file given')
-    if not os.path.exists(source):
-        sys.exit('No such file: ' + source)
-    
+    if options.batch:
+        args = expand_batch_sources(args)
+    elif len(args) > 1:
+        sys.exit('Only one source file can be given, unless --batch is used.')
+    if options.watch and (options.batch or options.serve):
+        sys.exit('Cannot use --watch together with --batch or --serve.')
+    if (options.timings or options.render_profile) and options.serve:
+        sys.exit('Cannot use --timings or --render-profile together with --serve.')
+    if options.jobs is not None and options.jobs < 1:
+        sys.exit('The number of --jobs must be at least 1.')
+    if options.prefetch_jobs < 0:
+        sys.exit('The number of --prefetch-jobs must not be negative.')
+    if options.negative_cache_ttl < 0:
+        sys.exit('The --negative-cache-ttl must not be negative.')
+    if options.render_timeout < 0:
+        sys.exit('The --render-timeout must not be negative.')
+    if options.locked:
+        options.no_network = True
+
     options.legacy = not options.v3
     # Default (this may change over time):
     options.vocabulary = 'v2' if options.legacy else 'v3'
@@ -461,6 +688,8 @@ def main():
     if num_formats > 1 and (options.filename or options.output_filename):
         sys.exit('Cannot use an explicit output filename when generating more than one format, '
                  'use --path instead.')
+    if (options.batch or options.serve) and (options.filename or options.output_filename):
+        sys.exit('Cannot use an explicit output filename with --batch or --serve, use --path instead.')
     if num_formats < 1:
         # Default to paginated text output
         options.text = True
@@ -509,20 +738,145 @@ def main():
     xml2rfc.log.quiet = options.quiet and True or False
     xml2rfc.log.verbose = options.verbose
 
+    if options.serve:
+        from xml2rfc.server import serve
+        serve(options)
+        sys.exit(0)
+
+    if options.batch:
+        failures = process_batch(args, options)
+        sys.exit(1 if failures else 0)
+
+    if options.watch:
+        watch(args[0], options)
+        sys.exit(0)
+
+    process(args[0], options)
+
+
+# Output file extensions, by format option
+OUTPUT_EXTENSIONS = [
+    ('expand',      '.exp.xml'),
+    ('html',        '.html'),
+    ('raw',         '.raw.txt'),
+    ('text',        '.txt'),
+    ('nroff',       '.nroff'),
+    ('use_bib',     '.bib.xml'),
+    ('v2v3',        '.v2v3.xml'),
+    ('preptool',    '.prepped.xml'),
+    ('unprep',      '.plain.xml'),
+    ('pdf',         '.pdf'),
+    ('info',        '.json'),
+]
+
+def get_output_files(source, options):
+    """ Return a list of (format, filename) for the files process() writes """
+    source_path, source_base = os.path.split(source)
+    source_name, source_ext  = os.path.splitext(source_base)
+    if options.output_path:
+        if not os.path.isdir(options.output_path):
+            return []
+        basename = os.path.join(options.output_path, source_name)
+    else:
+        basename = os.path.join(source_path, source_name)
+    outputs = []
+    for fmt, ext in OUTPUT_EXTENSIONS:
+        if getattr(options, fmt):
+            if options.output_filename or options.filename:
+                filename = options.output_filename or options.filename
+            elif fmt == 'unprep':
+                filename = basename.replace('.prepped','') + ext
+            else:
+                filename = basename + ext
+            outputs.append((fmt, filename))
+    return outputs
+
+def get_lockfile(source, options):
+    """ Return the name of the lockfile of source, next to the outputs, see --lockfile """
+    source_path, source_base = os.path.split(source)
+    source_name, source_ext  = os.path.splitext(source_base)
+    return os.path.join(options.output_path or source_path, source_name + xml2rfc.lockfile.LOCKFILE_SUFFIX)
+
+def process(source, options):
+    """ Render one source file to all the requested output formats
+
+        Errors are reported by logging them and calling sys.exit(), as for
+        the command line.  The options may be modified while processing.
+
+        With --build-cache, the outputs are copied from the build cache
+        instead, if the document has been rendered before with the same
+        source, external resources and options.
+
+        With --timings, a report of the time spent in each processing stage
+        is written when done, also if processing fails.
+
+        Returns the external resources used, see CachingResolver.add_resource()
+    """
+    if not options.timings:
+        return process_cached(source, options)
+    xml2rfc.timings.start()
+    try:
+        with timer('total'):
+            return process_cached(source, options)
+    finally:
+        xml2rfc.timings.stop()
+        xml2rfc.timings.write_report(source, options.timings)
+
+def process_cached(source, options):
+    if not source:
+        sys.exit('No source file given')
+    if not os.path.exists(source):
+        sys.exit('No such file: ' + source)
+
+    if not options.build_cache or options.no_build_cache:
+        return render(source, options)
+
+    build_cache = xml2rfc.buildcache.BuildCache(options.build_cache, options.build_cache_size*1024*1024)
+    outputs = get_output_files(source, options)
+    key = build_cache.key(source, options) if outputs else None
+    if not key:
+        return render(source, options)
+    manifest = build_cache.get(key, source, outputs, options)
+    if manifest != None:
+        # Repeat the warnings of the cached render
+        xml2rfc.log.write_err.write(manifest['diagnostics'])
+        if not options.quiet:
+            for fmt, filename in outputs:
+                xml2rfc.log.write(' Created file', filename, '(from build cache)')
+        return manifest['resources']
+    write_err = xml2rfc.log.write_err
+    recorder = xml2rfc.buildcache.DiagnosticsRecorder(write_err)
+    xml2rfc.log.write_err = recorder
+    try:
+        resources = render(source, options)
+    finally:
+        xml2rfc.log.write_err = write_err
+    build_cache.put(key, source, outputs, resources, recorder.getvalue())
+    return resources
+
+def render(source, options):
+    """ Render one source file, returning the external resources it used """
+    locked = None
+    if options.locked:
+        try:
+            locked = xml2rfc.lockfile.Lockfile(get_lockfile(source, options))
+        except xml2rfc.lockfile.LockfileError as e:
+            sys.exit(str(e))
     # Parse the document into an xmlrfc tree instance
     parser = xml2rfc.XmlRfcParser(source,
                                   options=options,
                                   templates_path=options.template_dir,
+                                  locked=locked,
                               )
     try:
         xmlrfc = parser.parse(remove_pis=options.remove_pis, normalize=True)
     except xml2rfc.parser.XmlRfcError as e:
-        xml2rfc.log.exception('Unable to parse the XML document: ' + args[0], e)
+        xml2rfc.log.exception('Unable to parse the XML document: ' + source, e)
         sys.exit(1)
     except lxml.etree.XMLSyntaxError as e:
         # Give the lxml.etree.XmlSyntaxError exception a line attribute which
         # matches lxml.etree._LogEntry, so we can use the same logging function
-        xml2rfc.log.exception('Unable to parse the XML document: ' + args[0], e.error_log)
+        xml2rfc.log.exception('Unable to parse the XML document: ' + source, e.error_log)
         sys.exit(1)
     # check doctype
     if xmlrfc.tree.docinfo and xmlrfc.tree.docinfo.system_url:
@@ -574,11 +928,12 @@ def main():
     if not options.no_dtd:
         ok, errors = xmlrfc.validate(dtd_path=options.dtd)
         if not ok:
-            xml2rfc.log.exception('Unable to validate the XML document: ' + args[0], errors)
+            xml2rfc.log.exception('Unable to validate the XML document: ' + source, errors)
             sys.exit(1)
 
     # sanitize the document
-    xmlrfc.sanitize()
+    with timer('sanitize'):
+        xmlrfc.sanitize()
 
     if options.filename:
         xml2rfc.log.warn("The -f and --filename options are deprecated and will"
@@ -615,7 +970,8 @@ def main():
             expwriter = xml2rfc.ExpandedXmlWriter(new_xmlrfc,
                                                   options=options,
                                                   date=options.date)
-            expwriter.write(filename)
+            with timer('expand'):
+                expwriter.write(filename)
             options.output_filename = None
 
         if options.html and options.legacy:
@@ -627,7 +983,8 @@ def main():
                                                options=options,
                                                date=options.date,
                                                templates_dir=options.template_dir or None)
-            htmlwriter.write(filename)
+            with timer('html'):
+                htmlwriter.write(filename)
             options.output_filename = None
 
         if options.raw:
@@ -638,7 +995,8 @@ def main():
             rawwriter = xml2rfc.RawTextRfcWriter(xmlrfc,
                                                  options=options,
                                                  date=options.date)
-            rawwriter.write(filename)
+            with timer('raw'):
+                rawwriter.write(filename)
             options.output_filename = None
 
         if options.text and options.legacy:
@@ -651,7 +1009,8 @@ def main():
                                                          date=options.date,
                                                          omit_headers=options.omit_headers,
                                                      )
-            pagedwriter.write(filename)
+            with timer('text'):
+                pagedwriter.write(filename)
             options.output_filename = None
 
         if options.nroff:
@@ -662,7 +1021,8 @@ def main():
             nroffwriter = xml2rfc.NroffRfcWriter(xmlrfc,
                                                  options=options,
                                                  date=options.date)
-            nroffwriter.write(filename)
+            with timer('nroff'):
+                nroffwriter.write(filename)
             options.output_filename = None
 
         # --- End of legacy formatter invocations ---
@@ -673,7 +1033,8 @@ def main():
                 filename = basename + '.bib.xml'
                 options.output_filename = filename
             expander = xml2rfc.DatatrackerToBibConverter(xmlrfc, options=options, date=options.date)
-            expander.write(filename)
+            with timer('bib'):
+                expander.write(filename)
             options.output_filename = None
 
         if options.expand and not options.legacy:
@@ -685,7 +1046,8 @@ def main():
             #v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
             #xmlrfc.tree = v2v3.convert2to3()
             expander = xml2rfc.ExpandV3XmlWriter(xmlrfc, options=options, date=options.date)
-            expander.write(filename)
+            with timer('expand'):
+                expander.write(filename)
             options.output_filename = None
 
         if options.v2v3:
@@ -695,7 +1057,8 @@ def main():
                 filename = basename + '.v2v3.xml'
                 options.output_filename = filename
             v2v3writer = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
-            v2v3writer.write(filename)
+            with timer('v2v3'):
+                v2v3writer.write(filename)
             options.output_filename = None
 
         if options.preptool:
@@ -707,7 +1070,8 @@ def main():
             v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
             xmlrfc.tree = v2v3.convert2to3()
             preptool = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date)
-            preptool.write(filename)
+            with timer('prep'):
+                preptool.write(filename)
             options.output_filename = None
 
         if options.unprep:
@@ -717,80 +1081,194 @@ def main():
                 filename = basename.replace('.prepped','') + '.plain.xml'
                 options.output_filename = filename
             unprep = xml2rfc.UnPrepWriter(xmlrfc, options=options, date=options.date)
-            unprep.write(filename)
+            with timer('unprep'):
+                unprep.write(filename)
             options.output_filename = None
 
+        # The v3 text, html and pdf formatters, and --info, all work from the
+        # same prepped document.  Parse, convert and prep it only once, and
+        # hand each writer its own copy of the result.
+        prepped = None
+        if options.info or options.pdf or (not options.legacy and (options.text or options.html)):
+            with timer('prep'):
+                prepped = get_prepped_xmlrfc(parser, options)
+
         if options.text and not options.legacy:
-            xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+            xmlrfc = prepped.copy()
             filename = options.output_filename
             if not filename:
                 filename = basename + '.txt'
                 options.output_filename = filename
-            if not xmlrfc.tree.getroot().get('prepTime'):
-                v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
-                xmlrfc.tree = v2v3.convert2to3()
-                prep = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date, liberal=True, keep_pis=[xml2rfc.V3_PI_TARGET])
-                xmlrfc.tree = prep.prep()
             if xmlrfc.tree:
                 writer = xml2rfc.TextWriter(xmlrfc, options=options, date=options.date)
-                writer.write(filename)
+                with timer('text'):
+                    writer.write(filename)
+                if writer.profile:
+                    writer.profile.write_report(source, writer.root, options.render_profile)
                 options.output_filename = None
 
         if options.html and not options.legacy:
-            xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+            xmlrfc = prepped.copy()
             filename = options.output_filename
             if not filename:
                 filename = basename + '.html'
                 options.output_filename = filename
-            if not xmlrfc.tree.getroot().get('prepTime'):
-                v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
-                xmlrfc.tree = v2v3.convert2to3()
-                prep = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date, liberal=True, keep_pis=[xml2rfc.V3_PI_TARGET])
-                xmlrfc.tree = prep.prep()
             if xmlrfc.tree:
                 writer = xml2rfc.HtmlWriter(xmlrfc, options=options, date=options.date)
-                writer.write(filename)
+                with timer('html'):
+                    writer.write(filename)
+                if writer.profile:
+                    writer.profile.write_report(source, writer.root, options.render_profile)
                 options.output_filename = None
 
         if options.pdf:
-            xmlrfc = parser.parse(remove_comments=False, quiet=True, add_xmlns=True)
+            xmlrfc = prepped.copy()
             filename = options.output_filename
             if not filename:
                 filename = basename + '.pdf'
                 options.output_filename = filename
-            if not xmlrfc.tree.getroot().get('prepTime'):
-                v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
-                xmlrfc.tree = v2v3.convert2to3()
-                prep = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date, liberal=True, keep_pis=[xml2rfc.V3_PI_TARGET])
-                xmlrfc.tree = prep.prep()
             if xmlrfc.tree:
                 writer = xml2rfc.PdfWriter(xmlrfc, options=options, date=options.date)
-                writer.write(filename)
+                with timer('pdf'):
+                    writer.write(filename)
                 options.output_filename = None
 
         if options.info:
-            xmlrfc = parser.parse(remove_comments=False, quiet=True)
+            xmlrfc = prepped
             filename = options.output_filename
             if not filename:
                 filename = basename + '.json'
                 options.output_filename = filename
-            v2v3 = xml2rfc.V2v3XmlWriter(xmlrfc, options=options, date=options.date)
-            xmlrfc.tree = v2v3.convert2to3()
-            prep = xml2rfc.PrepToolWriter(xmlrfc, options=options, date=options.date, liberal=True, keep_pis=[xml2rfc.V3_PI_TARGET])
-            xmlrfc.tree = prep.prep()
             if xmlrfc.tree:
-                info = extract_anchor_info(xmlrfc.tree)
-                with io.open(filename, 'w', encoding='utf-8') as fp:
-                    json.dump(info, fp, indent=2, ensure_ascii=False)
+                with timer('info'):
+                    info = extract_anchor_info(xmlrfc.tree)
+                    with io.open(filename, 'w', encoding='utf-8') as fp:
+                        json.dump(info, fp, indent=2, ensure_ascii=False)
                 if not options.quiet:
                     xml2rfc.log.write('Created file', filename)
 
 
     except xml2rfc.RfcWriterError as e:
         xml2rfc.log.write(e.msg)
-        xml2rfc.log.write('Unable to complete processing %s' % args[0])
+        xml2rfc.log.write('Unable to complete processing %s' % source)
         sys.exit(1)
 
+    if options.lockfile:
+        xml2rfc.lockfile.write(get_lockfile(source, options), parser.resources, locked=locked)
+        if not options.quiet:
+            xml2rfc.log.write('Created file', get_lockfile(source, options))
+
+    return parser.resources
+
+def init_worker(options):
+    """ Set up logging in a batch or server worker process
+
+        Module state is not inherited by worker processes on platforms which
+        don't fork, so repeat the setup done in main().
+    """
+    xml2rfc.log.quiet = options.quiet and True or False
+    xml2rfc.log.verbose = options.verbose
+
+def process_batch_source(item):
+    """ Render one source file of a batch, returning (source, error) """
+    source, options = item
+    try:
+        process(source, copy.deepcopy(options))
+    except SystemExit as e:
+        if e.code:
+            return source, e.code if isinstance(e.code, str) else 'exit status %s' % e.code
+    except Exception as e:
+        return source, '%s: %s' % (type(e).__name__, e)
+    finally:
+        # Pool workers exit without running atexit handlers
+        xml2rfc.cacheindex.flush_all()
+    return source, None
+
+def process_batch(sources, options):
+    """ Render a list of source files, using a pool of worker processes
+
+        Each worker keeps its imported modules, compiled schemas and
+        reference cache sessions across the documents it renders.  Prints a
+        per-document summary, and returns the list of failed sources.
+    """
+    jobs = min(options.jobs or os.cpu_count() or 1, len(sources))
+    items = [ (source, options) for source in sources ]
+    if jobs > 1:
+        with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(options, )) as pool:
+            results = dict(pool.imap_unordered(process_batch_source, items))
+    else:
+        results = dict(process_batch_source(item) for item in items)
+    failures = [ source for source in sources if results[source] ]
+    if not options.quiet:
+        xml2rfc.log.write('\nBatch summary:')
+    for source in sources:
+        error = results[source]
+        if error:
+            xml2rfc.log.write('  failed  %s: %s' % (source, error))
+        elif not options.quiet:
+            xml2rfc.log.write('  ok      %s' % source)
+    if not options.quiet or failures:
+        xml2rfc.log.write('%s of %s documents rendered, %s failed' % (len(sources)-len(failures), len(sources), len(failures)))
+    return failures
+
+# How often to look for changed files in --watch mode, in seconds
+WATCH_INTERVAL = 0.25
+
+def get_mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+def watch(source, options):
+    """ Render source, and render it again whenever a file it uses changes
+
+        The files watched are the source and the local files the last
+        render used: entity and include files, cached references, and
+        artwork and sourcecode files.  Rendering in the same process each
+        time avoids the startup cost of imports and data tables.  Runs
+        until interrupted.
+    """
+    paths = [ source ]
+    try:
+        while True:
+            start = time.time()
+            try:
+                resources = process(source, copy.deepcopy(options))
+                error = None
+            except SystemExit as e:
+                resources = None
+                error = e.code if isinstance(e.code, str) else None
+            except Exception as e:
+                resources = None
+                error = '%s: %s' % (type(e).__name__, e)
+            if error:
+                xml2rfc.log.write(error)
+            if resources != None:
+                paths = [ source ] + sorted(set( r['path'] for r in resources.values() if r['sha256'] ))
+            if not options.quiet:
+                xml2rfc.log.write('%s in %.2fs, watching %s files for changes (press Ctrl-C to stop)'
+                                    % ('Failed' if resources is None else 'Rendered', time.time()-start, len(paths)))
+            mtimes = get_mtimes(paths)
+            while True:
+                time.sleep(WATCH_INTERVAL)
+                changed = [ p for p, t in get_mtimes(paths).items() if t != mtimes[p] ]
+                if changed:
+                    # Let editors finish writing before rendering again
+                    mtimes = get_mtimes(paths)
+                    time.sleep(WATCH_INTERVAL)
+                    while get_mtimes(paths) != mtimes:
+                        mtimes = get_mtimes(paths)
+                        time.sleep(WATCH_INTERVAL)
+                    if not options.quiet:
+                        xml2rfc.log.write('\nChanged: %s' % ', '.join(changed))
+                    break
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == '__main__':
 
     major, minor = sys.version_info[:2]
@@ -0,0 +1,83 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" A process-wide registry of compiled RelaxNG schemas
+
+    Each schema is compiled at most once per process, when first used, and
+    is then shared by all writers and resolvers.  An lxml validator keeps
+    the error log of its last validation, so validation with a shared schema
+    is serialized with a lock per schema; use validate() and assert_valid()
+    rather than calling the schema directly.
+
+    Trees found valid can also be remembered, by a digest of their canonical
+    XML, so that the same content isn't validated again in this process;
+    see assert_valid() and --validate.  Only valid verdicts are kept, as
+    the errors of an invalid tree are needed to report it.
+"""
+
+import hashlib
+import os
+import threading
+
+import lxml.etree
+
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+
+# Schema files, by schema name
+SCHEMA_FILES = {
+    'v3':               'v3.rng',
+    'reference':        'reference.rng',
+    'referencegroup':   'referencegroup.rng',
+    'svg':              'SVG-1.2-RFC.rng',
+}
+
+# The number of valid verdicts kept, see assert_valid()
+MAX_VERDICTS = 1000
+
+schemas = {}
+locks = {}
+registry_lock = threading.Lock()
+verdicts = set()
+
+
+def get_schema(name):
+    """ Return the compiled schema name, compiling it on first use """
+    schema = schemas.get(name)
+    if schema is None:
+        with registry_lock:
+            if not name in schemas:
+                schemas[name] = lxml.etree.RelaxNG(file=os.path.join(data_dir, SCHEMA_FILES[name]))
+                locks[name] = threading.Lock()
+            schema = schemas[name]
+    return schema
+
+def validate(name, tree):
+    """ Return True if tree is valid according to the schema name """
+    schema = get_schema(name)
+    with locks[name]:
+        return schema.validate(tree)
+
+def assert_valid(name, tree, cache=False):
+    """ Raise lxml.etree.DocumentInvalid if tree isn't valid according to the schema name
+
+        The exception's error_log holds the errors of this validation.  With
+        cache, a tree with the same canonical XML as one found valid before
+        is not validated again.
+    """
+    schema = get_schema(name)
+    if cache:
+        verdict = (name, tree_digest(tree))
+        if verdict in verdicts:
+            return
+    with locks[name]:
+        schema.assertValid(tree)
+    if cache:
+        with registry_lock:
+            if len(verdicts) >= MAX_VERDICTS:
+                verdicts.clear()
+            verdicts.add(verdict)
+
+def tree_digest(tree):
+    """ Return the sha256 digest of the canonical XML of tree """
+    return hashlib.sha256(lxml.etree.tostring(tree, method='c14n')).hexdigest()
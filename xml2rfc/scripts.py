@@ -4,6 +4,7 @@ from __future__ import unicode_literals, print_function
 
 import intervaltree
 import os
+import threading
 from codecs import open
 
 try:
@@ -12,10 +13,16 @@ try:
 except ImportError:
     pass
 
-scripts = intervaltree.IntervalTree()
+# The script table, loaded on first use rather than at import time.  It is
+# only assigned once complete, so that other threads never see a partly
+# filled table.
+scripts = None
+scripts_lock = threading.Lock()
 
 def init():
     # Clocked to less than 0.2 seconds on a 2GHz core 08 Feb 2018
+    global scripts
+    table = intervaltree.IntervalTree()
     fn = os.path.join(os.path.dirname(__file__), 'data', 'Scripts.txt')
     with open(fn, encoding='utf-8') as f:
         text = f.read()
@@ -29,10 +36,11 @@ def init():
         codepoints, script = data.split(';', 1)
         if '..' in codepoints:
             start, stop = [ int(x.strip(), base=16) for x in codepoints.split('..') ]
-            scripts[start:stop+1] = script.strip()
+            table[start:stop+1] = script.strip()
         else:
             start = int(codepoints.strip(), base=16)
-            scripts[start:start+1] = script.strip()
+            table[start:start+1] = script.strip()
+    scripts = table
 
 def get_scripts(text):
     """"Return the unicode scripts used in text.
@@ -41,6 +49,10 @@ def get_scripts(text):
     Clocked to about 0.5 seconds per million characters
     on a 2Ghz core given input with about 60% ascii.
     """
+    if scripts is None:
+        with scripts_lock:
+            if scripts is None:
+                init()
     scriptset = set()
     for i, c in enumerate(text):
         o = ord(c)
@@ -48,5 +60,3 @@ def get_scripts(text):
             scriptset |= scripts[o]
     return set([ s.data for s in scriptset ])
 
-init()
-
@@ -0,0 +1,317 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" A long-running render server
+
+    The server keeps a pool of worker processes with all modules imported and
+    data tables loaded, and renders documents posted to it over HTTP, on a
+    localhost TCP port or a Unix domain socket, using the in-memory render
+    API (see xml2rfc.api):
+
+      POST /render?format=text&format=html  source in the request body;
+                                            returns JSON with the base64
+                                            encoded outputs and diagnostics
+      POST /render/FORMAT                   returns the output itself
+      GET  /health                          liveness check; 503 if the
+                                            worker pool is broken
+
+    A render which takes longer than --render-timeout seconds fails with
+    status 504, and the worker processes are restarted if it is still
+    running.
+      GET  /queue                           number of workers, running and
+                                            queued jobs
+"""
+
+import base64
+import concurrent.futures
+import copy
+import datetime
+import http.server
+import json
+import os
+import re
+import socketserver
+import stat
+import sys
+import threading
+
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+import xml2rfc
+import xml2rfc.api
+import xml2rfc.cacheindex
+import xml2rfc.log
+
+from xml2rfc.api import FORMATS
+
+# Options which a render request may set, in addition to the formats.  Other
+# options, in particular those which give access to the local file system or
+# the network, are fixed when the server is started.
+REQUEST_OPTIONS = [
+    'bom',
+    'id_is_work_in_progress',
+    'inline_version_info',
+    'legacy_date_format',
+    'pagination',
+    'rfc_local',
+    'strict',
+    'table_borders',
+    'table_hyphen_breaks',
+]
+
+MAX_QUEUED_PER_WORKER = 4
+MAX_SOURCE_SIZE = 64*1024*1024
+
+
+class RenderError(Exception):
+    """ A render request which can't be processed """
+    def __init__(self, status, msg):
+        self.status = status
+        self.msg = msg
+
+
+def warm_up():
+    """ Make sure a worker process has been started and initialized """
+    return os.getpid()
+
+def render_job(source, formats, options, name):
+    """ Render a document in a worker process, see xml2rfc.api.render() """
+    try:
+        return xml2rfc.api.render(source, formats, None, options, name)
+    finally:
+        # Worker processes exit without running atexit handlers
+        xml2rfc.cacheindex.flush_all()
+
+
+class RenderRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'xml2rfc/%s' % xml2rfc.__version__
+
+    def address_string(self):
+        # Unix domain socket clients don't have an address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.renderer.options.verbose:
+            super(RenderRequestHandler, self).log_message(format, *args)
+
+    def send_data(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, data):
+        self.send_data(status, json.dumps(data, indent=2).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        renderer = self.server.renderer
+        if path == '/health':
+            if renderer.broken:
+                self.send_json(503, {'status': 'broken', 'version': xml2rfc.__version__, })
+            else:
+                self.send_json(200, {'status': 'ok', 'version': xml2rfc.__version__, })
+        elif path == '/queue':
+            self.send_json(200, renderer.queue_info())
+        else:
+            self.send_json(404, {'error': 'Not found: %s' % path, })
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        renderer = self.server.renderer
+        try:
+            if url.path == '/render':
+                formats = [ f for v in query.pop('format', ['text']) for f in v.split(',') if f ]
+                raw = False
+            elif url.path.startswith('/render/'):
+                formats = [ url.path[len('/render/'):] ]
+                raw = True
+            else:
+                raise RenderError(404, 'Not found: %s' % url.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                raise RenderError(400, 'Expected the document source in the request body')
+            if length > MAX_SOURCE_SIZE:
+                raise RenderError(413, 'The document source is larger than %s bytes' % MAX_SOURCE_SIZE)
+            source = self.rfile.read(length)
+            outputs, diagnostics = renderer.render(source, formats, query)
+        except RenderError as e:
+            self.send_json(e.status, {'error': e.msg, })
+            return
+        except Exception as e:
+            xml2rfc.log.error('Render request failed: %s: %s' % (type(e).__name__, e))
+            self.send_json(500, {'error': 'Internal error: %s: %s' % (type(e).__name__, e), })
+            return
+        if outputs is None:
+            self.send_json(422, {'error': 'Rendering failed', 'diagnostics': diagnostics, })
+        elif raw:
+            fmt = formats[0]
+            if fmt in outputs:
+                self.send_data(200, outputs[fmt], FORMATS[fmt][1])
+            else:
+                self.send_json(422, {'error': 'No %s output was produced' % fmt, 'diagnostics': diagnostics, })
+        else:
+            self.send_json(200, {
+                'outputs': dict( (f, base64.b64encode(o).decode('ascii')) for f, o in outputs.items() ),
+                'diagnostics': diagnostics,
+            })
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class RenderServer(object):
+    """ Accepts render jobs, and runs them in a bounded pool of warm workers """
+
+    def __init__(self, options):
+        self.options = options
+        self.workers = options.jobs or os.cpu_count() or 1
+        self.max_jobs = self.workers * (1 + MAX_QUEUED_PER_WORKER)
+        self.jobs = 0
+        self.lock = threading.Lock()
+        # Set when a worker process died, which breaks the pool, until the
+        # pool has been restarted
+        self.broken = False
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        from xml2rfc.run import init_worker
+        pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.options, ))
+        # Start all the workers up front, rather than on the first requests
+        for f in [ pool.submit(warm_up) for i in range(self.workers) ]:
+            f.result()
+        return pool
+
+    def stop_pool(self, pool):
+        """ Shut down a pool without waiting, stopping workers which may be stuck in a render """
+        # The executor has no public way to stop running jobs
+        processes = list((getattr(pool, '_processes', None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def restart_pool(self, broken_pool):
+        """ Replace a broken or stuck pool, unless another request already did """
+        with self.lock:
+            if self.pool is not broken_pool and not self.broken:
+                return
+            self.broken = True
+            self.stop_pool(broken_pool)
+            try:
+                self.pool = self.start_pool()
+                self.broken = False
+            except Exception as e:
+                xml2rfc.log.error('Could not restart the render worker pool: %s: %s' % (type(e).__name__, e))
+
+    def queue_info(self):
+        with self.lock:
+            jobs = self.jobs
+        return {
+            'workers': self.workers,
+            'running': min(jobs, self.workers),
+            'queued': max(0, jobs - self.workers),
+            'limit': self.max_jobs,
+        }
+
+    def request_options(self, query):
+        from xml2rfc.run import OPTION_CHOICES
+        options = copy.deepcopy(self.options)
+        options.date = datetime.date.today()
+        for key, values in query.items():
+            value = values[-1]
+            if key == 'name':
+                continue
+            elif key == 'date':
+                try:
+                    options.date = datetime.datetime.strptime(value, "%Y-%m-%d").date()
+                except ValueError:
+                    raise RenderError(400, 'Expected a date on the form yyyy-mm-dd, but found "%s"' % value)
+            elif key.replace('-', '_') in REQUEST_OPTIONS:
+                key = key.replace('-', '_')
+                if isinstance(getattr(options, key), bool) or getattr(options, key) is None:
+                    value = value.lower() not in ['0', 'false', 'no', 'off', ]
+                elif key in OPTION_CHOICES and not value in OPTION_CHOICES[key]:
+                    raise RenderError(400, 'Expected %s to be one of %s, but found "%s"' % (key, ', '.join(OPTION_CHOICES[key]), value))
+                setattr(options, key, value)
+            else:
+                raise RenderError(400, 'Unknown or disallowed option: %s' % key)
+        return options
+
+    def render(self, source, formats, query):
+        for fmt in formats:
+            if not fmt in FORMATS:
+                raise RenderError(400, 'Unknown format "%s", expected one of %s' % (fmt, ', '.join(FORMATS)))
+        name = os.path.basename(query.get('name', ['draft.xml'])[-1])
+        if not re.match(r'^[A-Za-z0-9][A-Za-z0-9._-]*\.xml$', name):
+            raise RenderError(400, 'Expected a source name ending in .xml, but found "%s"' % name)
+        options = self.request_options(query)
+        with self.lock:
+            if self.jobs >= self.max_jobs:
+                raise RenderError(503, 'Too many queued render jobs, try again later')
+            self.jobs += 1
+        pool = self.pool
+        try:
+            if self.broken:
+                # An earlier restart failed, try again
+                self.restart_pool(pool)
+                pool = self.pool
+            future = pool.submit(render_job, source, formats, options, name)
+            try:
+                return future.result(timeout=self.options.render_timeout or None)
+            except concurrent.futures.TimeoutError:
+                if not future.cancel():
+                    xml2rfc.log.error('A render took more than %s seconds, restarting the worker pool' % self.options.render_timeout)
+                    self.restart_pool(pool)
+                raise RenderError(504, 'Rendering took more than %s seconds' % self.options.render_timeout)
+        except BrokenProcessPool:
+            xml2rfc.log.error('A render worker process failed, restarting the worker pool')
+            self.restart_pool(pool)
+            raise RenderError(500, 'A render worker process failed while rendering the document')
+        finally:
+            with self.lock:
+                self.jobs -= 1
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def serve(options):
+    """ Run a render server on the address given by options.serve
+
+        The address is either [HOST:]PORT, or unix:PATH for a Unix domain
+        socket.  Runs until interrupted.
+    """
+    address = options.serve
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        # Remove a socket left behind by an earlier server, but nothing else
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                sys.exit('Cannot serve on %s: the file exists, and is not a socket.' % path)
+            os.unlink(path)
+    renderer = RenderServer(options)
+    if address.startswith('unix:'):
+        httpd = ThreadingUnixHTTPServer(path, RenderRequestHandler)
+    else:
+        host, _, port = address.rpartition(':')
+        httpd = http.server.ThreadingHTTPServer((host or 'localhost', int(port)), RenderRequestHandler)
+    httpd.renderer = renderer
+    if not options.quiet:
+        xml2rfc.log.write('Serving render requests on %s with %s workers' % (address, renderer.workers))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        renderer.shutdown()
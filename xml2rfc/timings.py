@@ -0,0 +1,176 @@
+# Copyright The IETF Trust 2026, All Rights Reserved
+# -*- coding: utf-8 -*-
+
+""" Per-stage timing and memory measurements, see --timings
+
+    Stages are timed by wrapping them in timer(name), or by decorating a
+    function with timed(name).  Stages may nest, and are recorded by their
+    path, for instance 'total/prep/preptool/element_xref'.
+    For each stage path the number of times it was run, the wall time, the
+    CPU time and the growth of the peak resident set size are accumulated.
+
+    Timing is off unless start() has been called, and timer() then costs
+    very little.
+
+    RenderProfile records finer grained call counts and times for the
+    render_<tag> methods of the text and html writers, see --render-profile.
+"""
+
+import contextlib
+import functools
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+import xml2rfc
+
+
+enabled = False
+stack = []
+stages = {}
+
+
+def peak_rss():
+    """ Return the peak resident set size of this process, in bytes """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In kilobytes, except on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def start():
+    global enabled
+    enabled = True
+    stack.clear()
+    stages.clear()
+
+def stop():
+    global enabled
+    enabled = False
+
+@contextlib.contextmanager
+def timer(name):
+    """ Time the enclosed stage, if timing is enabled """
+    if not enabled:
+        yield
+        return
+    stack.append(name)
+    path = '/'.join(stack)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    rss = peak_rss()
+    try:
+        yield
+    finally:
+        stack.pop()
+        stage = stages.setdefault(path, [0, 0.0, 0.0, 0])
+        stage[0] += 1
+        stage[1] += time.perf_counter() - wall
+        stage[2] += time.process_time() - cpu
+        stage[3] += peak_rss() - rss
+
+def timed(name):
+    """ Decorator which times each call of a function as the stage name """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def report():
+    """ Return the recorded stages, slowest first """
+    items = [ dict(stage=path, count=count, wall=wall, cpu=cpu, rss_delta=rss)
+              for path, (count, wall, cpu, rss) in stages.items() ]
+    items.sort(key=lambda i: (-i['wall'], i['stage']))
+    return items
+
+def write_report(source, fmt):
+    """ Write the recorded stages for source, as text to stderr or as JSON to stdout
+
+        The JSON report is written as a single line, so the reports of a
+        --batch run can be read one document per line.
+    """
+    items = report()
+    if fmt == 'json':
+        data = {
+            'source': source,
+            'version': xml2rfc.__version__,
+            'stages': items,
+        }
+        sys.stdout.write(json.dumps(data) + '\n')
+        sys.stdout.flush()
+    else:
+        lines = [ 'Timings for %s:' % source,
+                  '  %9s %9s %9s %7s  %s' % ('wall', 'cpu', 'peak rss', 'count', 'stage') ]
+        for i in items:
+            lines.append('  %8.3fs %8.3fs %8.1fM %7d  %s' % (i['wall'], i['cpu'], i['rss_delta']/(1024*1024), i['count'], i['stage']))
+        sys.stderr.write('\n'.join(lines) + '\n')
+        sys.stderr.flush()
+
+
+class RenderProfile(object):
+    """ Call counts and times of the render methods of a writer
+
+        Cumulative times include the time of nested calls, but count
+        recursive calls of the same method only once.  Self times exclude
+        the time of nested calls.  The self times are also recorded by call
+        stack, for flame graphs.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = []
+        self.calls = {}
+        self.stacks = {}
+
+    def call(self, func, *args, **kwargs):
+        name = func.__name__
+        self.frames.append([name, 0.0])
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack = ';'.join([self.name] + [ f[0] for f in self.frames ])
+            name, nested = self.frames.pop()
+            stats = self.calls.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            if not any( f[0] == name for f in self.frames ):
+                stats[1] += elapsed
+            stats[2] += elapsed - nested
+            if self.frames:
+                self.frames[-1][1] += elapsed
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - nested
+
+    def write_report(self, source, root, fmt):
+        """ Write the profile as a table to stderr, or as collapsed stacks to stdout
+
+            The collapsed stacks have their self time in microseconds, in the
+            format read by flamegraph.pl and compatible tools.
+        """
+        if fmt == 'stacks':
+            for stack, secs in sorted(self.stacks.items()):
+                sys.stdout.write('%s %d\n' % (stack, round(secs*1000000)))
+            sys.stdout.flush()
+        else:
+            elements = {}
+            for e in root.iter():
+                if isinstance(e.tag, str):
+                    elements[e.tag.lower()] = elements.get(e.tag.lower(), 0) + 1
+            lines = [ 'Render profile for %s, %s:' % (source, self.name),
+                      '  %-32s %8s %8s %10s %10s' % ('method', 'elements', 'calls', 'cumulative', 'self') ]
+            for name, (count, cumulative, own) in sorted(self.calls.items(), key=lambda i: (-i[1][2], i[0])):
+                tag = name[len('render_'):] if name.startswith('render_') else None
+                lines.append('  %-32s %8s %8d %9.3fs %9.3fs' % (name, elements.get(tag, ''), count, cumulative, own))
+            sys.stderr.write('\n'.join(lines) + '\n')
+            sys.stderr.flush()
@@ -1,5 +1,6 @@
 # Copyright The IETF Trust 2025, All Rights Reserved
 # -*- coding: utf-8 -*-
+import hashlib
 import os
 import re
 
@@ -44,3 +45,25 @@ def can_access(options, source, path, access_templates=False):
         raise FileAccessError(f"Expected a file at '{path}', but no such file exists")
 
     return True
+
+
+def file_sha256(path):
+    """Return the hex sha256 digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_include(includes, source, path):
+    """Return the content of an in-memory include file, or None
+
+    The includes are a dictionary of file content keyed by path relative to
+    the directory of the source, with '/' as separator.
+    """
+    if not includes:
+        return None
+    dir = os.path.abspath(os.path.dirname(source))
+    path = os.path.relpath(os.path.abspath(os.path.join(dir, path)), dir)
+    return includes.get(path.replace(os.sep, "/"))
@@ -4,7 +4,6 @@ from __future__ import unicode_literals, print_function
 
 import i18naddress
 import lxml.etree
-import pycountry
 import re
 import xml2rfc.log
 
@@ -78,6 +77,8 @@ def get_iso_country_info(e):
     # Special case, this is used but unknown to pycountry
     if name in country_alias:
         name = country_alias[name]
+    # Imported here, as loading the country tables is slow
+    import pycountry
     try:
         if hasattr(pycountry.countries, 'lookup'):
             country_info = pycountry.countries.lookup(name)
@@ -362,6 +362,17 @@ def find_duplicate_attr_values(attr, tree):
                 seen.add(id)
     return dups
 
+def get_target_usage(tree):
+    """ Return the <xref> and <relref> elements which refer to each target,
+        as a dictionary of lists in document order, by target= value
+    """
+    usage = {}
+    for e in tree.iter('xref', 'relref'):
+        target = e.get('target')
+        if target:
+            usage.setdefault(target, []).append(e)
+    return usage
+
 def strip_link_attachments(tree):
     """
     Find link tags with rel="attachment".
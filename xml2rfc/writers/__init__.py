@@ -1,20 +1,27 @@
 
+import importlib
+
 from xml2rfc.writers.base import RfcWriterError
 from xml2rfc.writers.base import BaseRfcWriter
-from xml2rfc.writers.raw_txt import RawTextRfcWriter
-from xml2rfc.writers.paginated_txt import PaginatedTextRfcWriter
-from xml2rfc.writers.legacy_html import HtmlRfcWriter
-from xml2rfc.writers.nroff import NroffRfcWriter
-from xml2rfc.writers.expanded_xml import ExpandedXmlWriter
-from xml2rfc.writers.v2v3 import V2v3XmlWriter
-from xml2rfc.writers.preptool import PrepToolWriter
-from xml2rfc.writers.text import TextWriter
-from xml2rfc.writers.html import HtmlWriter
-from xml2rfc.writers.expand import ExpandV3XmlWriter
-from xml2rfc.writers.pdf import PdfWriter
-from xml2rfc.writers.unprep import UnPrepWriter
-from xml2rfc.writers.doc import DocWriter
-from xml2rfc.writers.bib import DatatrackerToBibConverter
+
+# The writer modules are imported when a writer is first used, rather than
+# here, to keep the startup time down.  See __getattr__() below.
+writer_modules = {
+    'RawTextRfcWriter':             'raw_txt',
+    'PaginatedTextRfcWriter':       'paginated_txt',
+    'HtmlRfcWriter':                'legacy_html',
+    'NroffRfcWriter':               'nroff',
+    'ExpandedXmlWriter':            'expanded_xml',
+    'V2v3XmlWriter':                'v2v3',
+    'PrepToolWriter':               'preptool',
+    'TextWriter':                   'text',
+    'HtmlWriter':                   'html',
+    'ExpandV3XmlWriter':            'expand',
+    'PdfWriter':                    'pdf',
+    'UnPrepWriter':                 'unprep',
+    'DocWriter':                    'doc',
+    'DatatrackerToBibConverter':    'bib',
+}
 
 # This defines what 'from xml2rfc.writers import *' actually imports:
 __all__ = ['BaseRfcWriter', 'RawTextRfcWriter', 'PaginatedTextRfcWriter',
@@ -23,3 +30,13 @@ __all__ = ['BaseRfcWriter', 'RawTextRfcWriter', 'PaginatedTextRfcWriter',
            'HtmlWriter', 'PdfWriter', 'ExpandV3XmlWriter', 'UnPrepWriter', 
            'DocWriter', 'DatatrackerToBibConverter',
        ]
+
+def __getattr__(name):
+    if name in writer_modules:
+        module = importlib.import_module('xml2rfc.writers.' + writer_modules[name])
+        writer = getattr(module, name)
+        globals()[name] = writer
+        return writer
+    if name in writer_modules.values():
+        return importlib.import_module('xml2rfc.writers.' + name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
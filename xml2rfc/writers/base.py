@@ -10,6 +10,7 @@ import textwrap
 import os
 import re
 import xml2rfc.log
+import xml2rfc.schemas
 import xml2rfc.util
 import xml2rfc.utils
 
@@ -24,11 +25,12 @@ except ImportError:
     pass
 
 from xml2rfc import strings, log
+from xml2rfc.timings import timed, timer
 from xml2rfc.util.date import extract_date, augment_date, format_date, get_expiry_date
-from xml2rfc.util.file import can_access, FileAccessError
+from xml2rfc.util.file import can_access, get_include, FileAccessError
 from xml2rfc.util.name import short_author_ascii_name_parts, full_author_name_expansion, short_author_name_parts
 from xml2rfc.util.unicode import is_svg
-from xml2rfc.utils import find_duplicate_ids, namespaces, slugify
+from xml2rfc.utils import find_duplicate_ids, get_target_usage, namespaces, slugify
 
 
 SUBSERIES = {
@@ -53,8 +55,14 @@ default_options.__dict__ = {
         'add_xinclude': None,
         'allow_local_file_access': False,
         'basename': None,
+        'batch': False,
+        'batch_file': None,
         'bom': False,
+        'build_cache': None,
+        'build_cache_size': 1024,
         'cache': None,
+        'cache_size': 256,
+        'cache_stats': False,
         'clear_cache': False,
         'css': None,
         'config_file': None,
@@ -67,6 +75,7 @@ default_options.__dict__ = {
         'doi_base_url': 'https://doi.org/',
         'draft_revisions': False,
         'dtd': None,
+        'evict_cache': False,
         'expand': False,
         'external_css': False,
         'external_js': False,
@@ -81,13 +90,18 @@ default_options.__dict__ = {
         'info': False,
         'info_base_url': 'https://www.rfc-editor.org/info/',
         'inline_version_info': True,
+        'jobs': None,
         'legacy': False,
         'legacy_date_format': False,
         'legacy_list_symbols': False,
         'list_symbols': ('*', '-', 'o', '+'),
+        'locked': False,
+        'lockfile': False,
         'manpage': False,
         'metadata_js_url': 'metadata.min.js',
+        'negative_cache_ttl': 3600,
         'no_css': False,
+        'no_build_cache': False,
         'no_dtd': None,
         'no_network': False,
         'nroff': False,
@@ -99,15 +113,20 @@ default_options.__dict__ = {
         'pi_help': False,
         'pdf': False,
         'pdf_help': False,
+        'prefetch_jobs': 8,
         'preptool': False,
         'quiet': False,
+        'refresh_negative': False,
         'remove_pis': False,
+        'render_profile': None,
+        'render_timeout': 300,
         'raw': False,
         'rfc': None,
         'rfc_base_url': 'https://www.rfc-editor.org/rfc/',
         'rfc_html_archive_url': 'https://www.rfc-editor.org/rfc/',
         'rfc_local': True,
         'rfc_reference_base_url': 'https://rfc-editor.org/rfc/',
+        'serve': None,
         'silence': default_silenced_messages,
         'skip_config_files': False,
         'source': None,
@@ -116,15 +135,19 @@ default_options.__dict__ = {
         'table_borders': 'full',
         'template_dir': os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'),
         'text': True,
+        'timings': None,
         'unprep': False,
         'use_bib': False,
         'utf8': False,
+        'validate': 'once',
         'values': False,
         'verbose': False,
         'version': False,
         'v2v3': False,
         'v3': True,
         'vocabulary': 'v2',
+        'warm_cache': False,
+        'watch': False,
         'widows': 2,
         'warn_bare_unicode': False,
     }
@@ -1650,6 +1673,43 @@ v3_rnc_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', '
 v3_rng_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'v3.rng')
 v3_schema = etree.ElementTree(file=v3_rng_file)
 
+SIMPLE_SELECTOR_RE = re.compile(r'^(\.?//)([A-Za-z][-\w]*|\*)(?:\[@([A-Za-z][-\w]*)(?:="([^"]*)")?\])?$')
+
+def compile_selector(selector):
+    """
+    Return a function which tells whether an element matches a simple
+    selector, of the form './/tag', '//tag', or './/*', with an optional
+    attribute test, '[@attr]' or '[@attr="value"]', as used for
+    dispatch() phases.  The function is called with the element and the
+    root element.  Raises ValueError for other selector forms.
+    """
+    m = SIMPLE_SELECTOR_RE.match(selector)
+    if not m:
+        raise ValueError("Expected a simple selector in a dispatch phase, but found '%s'" % selector)
+    axis, tag, attr, value = m.groups()
+    include_root = axis == '//'
+    def match(e, root):
+        if tag != '*' and e.tag != tag:
+            return False
+        if e is root and not include_root:
+            return False
+        if attr is None:
+            return True
+        if value is None:
+            return e.get(attr) is not None
+        return e.get(attr) == value
+    return match
+
+def flatten_selectors(selectors):
+    """ Return the selectors of a list of selectors and selector phases, see dispatch() """
+    flat = []
+    for s in selectors:
+        if isinstance(s, tuple):
+            flat.extend(s)
+        else:
+            flat.append(s)
+    return flat
+
 def get_element_tags():
     tags = set()
     elements = v3_schema.xpath("/x:grammar/x:define/x:element", namespaces=namespaces)
@@ -1724,6 +1784,54 @@ xref_tags   = get_xref_tags()
 
 # --------------------------------------------------------------------------------------------------
 
+class IdIndex(object):
+    """
+    An index of the elements under a root element by their anchor, pn and
+    slugifiedName attributes, see BaseV3Writer.get_element_from_id().
+
+    The index is built on first use.  A hit is checked against the element
+    before it is returned, and the index is rebuilt if the element has since
+    lost the attribute or has been removed from the tree, or if there is no
+    hit, in case the id has been added since the index was built.  A hit
+    can't tell whether an element earlier in the document has been given the
+    same id since, so writers which add or move ids must drop the index, see
+    BaseV3Writer.reset_id_index().
+    """
+
+    attributes = ['anchor', 'pn', 'slugifiedName', ]
+
+    def __init__(self, root):
+        self.root = root
+        self.ids = None
+
+    def build(self):
+        self.ids = dict( (a, {}) for a in self.attributes )
+        for e in self.root.iterdescendants(etree.Element):
+            for a in self.attributes:
+                value = e.get(a)
+                if value is not None and not value in self.ids[a]:
+                    self.ids[a][value] = e
+
+    def lookup(self, id):
+        for a in self.attributes:
+            elem = self.ids[a].get(id)
+            if elem is not None:
+                if elem.get(a) == id and any( p is self.root for p in elem.iterancestors() ):
+                    return elem
+                return None
+        return None
+
+    def get(self, id):
+        if self.ids is None:
+            self.build()
+        else:
+            elem = self.lookup(id)
+            if elem is not None:
+                return elem
+            self.build()
+        return self.lookup(id)
+
+
 class BaseV3Writer(object):
 
     def __init__(self, xmlrfc, quiet=None, options=default_options, date=None):
@@ -1734,7 +1842,6 @@ class BaseV3Writer(object):
         self.date = date if date is not None else datetime.date.today()
         self.v3_rnc_file = v3_rnc_file
         self.v3_rng_file = v3_rng_file
-        self.v3_rng = etree.RelaxNG(file=self.v3_rng_file)
         self.v3_schema = v3_schema
         self.schema = v3_schema
         self.index_items = []
@@ -1844,6 +1951,7 @@ class BaseV3Writer(object):
         self.errors.append(msg)
         raise RfcWriterError(msg)
 
+    @timed('xinclude')
     def xinclude(self):
         ## From RFC7998:
         ##
@@ -1867,6 +1975,11 @@ class BaseV3Writer(object):
         for xinclude in xincludes:
             href = urlparse(xinclude.get('href'))
             if not href.netloc or href.scheme == 'file':
+                if get_include(self.xmlrfc.includes, self.xmlrfc.source, href.path) is not None:
+                    continue
+                if self.xmlrfc.locked:
+                    # Resolved from the lockfile, without local file access
+                    continue
                 try:
                     can_access(self.options, self.xmlrfc.source, href.path)
                 except FileAccessError as error:
@@ -1882,7 +1995,8 @@ class BaseV3Writer(object):
 
         ## Entities has been resolved as part of the initial parsing.  Remove
         ## docinfo and PIs outside the <rfc/> element by copying the root
-        ## element and creating a new tree.
+        ## element and creating a new tree.  This is the only copy of the
+        ## document made by the preptool; validate() works on it in place.
         root = copy.deepcopy(self.root)
         self.tree = root.getroottree()
         self.root = root
@@ -1896,14 +2010,35 @@ class BaseV3Writer(object):
         refname_mapping.update(dict( (e.get('target'), e.get('to')) for e in self.root.xpath('.//displayreference') ))
         return refname_mapping
 
+    def get_handler_name(self, s):
+        slug = slugify(s.replace('self::', '').replace(' or ','_').replace(';','_'))
+        if '@' in s:
+            func_name = 'attribute_%s' % slug
+        elif "()" in s:
+            func_name = slug
+        else:
+            if not slug:
+                slug = 'rfc'
+            func_name = 'element_%s' % slug
+        return func_name
+
     def dispatch(self, selectors):
         """
         Process selectors, extracting an XPath selector and generating a method name
         from each entry in self.selectors, and calling the method with all elements
         matching the XPath expression, in order to process self.tree.
+
+        An entry may also be a tuple of selectors, which is processed as one
+        phase: the document is walked once, and each element is passed to the
+        handlers of all the selectors it matches, in the order of the tuple.
+        As for single selectors, the elements each selector matches are found
+        before any of the phase's handlers run.  Selectors may only be grouped
+        in a phase if their handlers don't depend on each other having
+        processed the whole document first, and they must be simple enough
+        for compile_selector().
         """
         # Setup
-        selector_visits = dict( (s, 0) for s in selectors)
+        selector_visits = dict( (s, 0) for s in flatten_selectors(selectors))
         # Check for duplicate <displayreference> 'to' values:
         seen = {}
         for e in self.root.xpath('.//displayreference'):
@@ -1915,34 +2050,63 @@ class BaseV3Writer(object):
         del seen
         ## Do remaining processing by xpath selectors (listed above)
         for s in selectors:
-            slug = slugify(s.replace('self::', '').replace(' or ','_').replace(';','_'))
-            if '@' in s:
-                func_name = 'attribute_%s' % slug
-            elif "()" in s:
-                func_name = slug
-            else:
-                if not slug:
-                    slug = 'rfc'
-                func_name = 'element_%s' % slug
+            # The handlers may add or remove ids and references
+            self.reset_id_index()
+            self.target_usage = None
+            if isinstance(s, tuple):
+                self.dispatch_phase(s, selector_visits)
+                continue
+            func_name = self.get_handler_name(s)
             # get rid of selector annotation
             ss = s.split(';')[0]
             func = getattr(self, func_name, None)
             if func:
                 if self.options.debug:
                     self.note(None, "Calling %s()" % func_name)
-                for e in self.tree.xpath(ss):
-                    func(e, e.getparent())
-                    selector_visits[s] += 1
+                with timer(func_name):
+                    for e in self.tree.xpath(ss):
+                        func(e, e.getparent())
+                        selector_visits[s] += 1
             else:
                 self.warn(None, "No handler %s() found" % (func_name, ))
         if self.options.debug:
-            for s in selectors:
+            for s in flatten_selectors(selectors):
                 if selector_visits[s] == 0:
                     self.note(None, "Selector '%s' has not matched" % (s))
         if self.errors:
             raise RfcWriterError("Not creating output file due to errors (see above)")
         return self.tree
 
+    def dispatch_phase(self, phase, selector_visits):
+        """
+        Process a tuple of selectors with a single walk of the document, see dispatch()
+        """
+        handlers = []
+        for s in phase:
+            func_name = self.get_handler_name(s)
+            func = getattr(self, func_name, None)
+            if func:
+                handlers.append((s, func_name, func, compile_selector(s.split(';')[0])))
+            else:
+                self.warn(None, "No handler %s() found" % (func_name, ))
+        if not handlers:
+            return
+        if self.options.debug:
+            self.note(None, "Calling %s()" % '(), '.join( h[1] for h in handlers ))
+        with timer('+'.join( h[1] for h in handlers )):
+            # Match all the elements before running any handler, like
+            # xpath() does for each selector, so that elements inserted or
+            # attributes changed by the handlers don't change what is visited
+            matches = []
+            for e in self.root.iter(etree.Element):
+                matched = [ h for h in handlers if h[3](e, self.root) ]
+                if matched:
+                    matches.append((e, matched))
+            for e, matched in matches:
+                for s, func_name, func, match in matched:
+                    func(e, e.getparent())
+                    selector_visits[s] += 1
+
     def get_all_attribute_defaults(self):
         defaults = {}
         elements = self.schema.xpath("/x:grammar/x:define/x:element", namespaces=namespaces)
@@ -1962,11 +2126,21 @@ class BaseV3Writer(object):
     # methods operating on the xml tree
 
     def get_element_from_id(self, id):
-        for a in 'anchor', 'pn', 'slugifiedName':
-            elem = self.root.find('.//*[@%s="%s"]'%(a, id, ))
-            if elem != None:
-                break
-        return elem
+        index = getattr(self, 'id_index', None)
+        if index is None or index.root is not self.root:
+            index = self.id_index = IdIndex(self.root)
+        return index.get(id)
+
+    def reset_id_index(self):
+        """ Drop the id index, after adding or moving anchor, pn or slugifiedName attributes """
+        self.id_index = None
+
+    def get_target_usage(self):
+        """ Return the elements which refer to each target, see xml2rfc.utils.get_target_usage() """
+        usage = getattr(self, 'target_usage', None)
+        if usage is None or usage[0] is not self.root:
+            usage = self.target_usage = (self.root, get_target_usage(self.root))
+        return usage[1]
 
     def get_element_page(self, e):
         page = getattr(e, 'page', None)
@@ -2111,6 +2285,11 @@ class BaseV3Writer(object):
         # Note: Our schema doesn't permit xi:include elements, so the document
         # must have had XInclude processing done before calling validate()
 
+        # With --validate=never, the document is trusted to have been
+        # validated before, for instance when it was submitted
+        if self.options.validate == 'never':
+            return True
+
         # The lxml Relax NG validator checks that xsd:ID values are unique,
         # but unfortunately the error messages are completely unhelpful (lxml
         # 4.1.1, libxml 2.9.1): "Element li has extra content: t" when 't' has
@@ -2124,10 +2303,11 @@ class BaseV3Writer(object):
         for attr, id, e in dups:
             self.warn(e, 'Duplicate xsd:ID attribute %s="%s" found.  This will cause validation failure.' % (attr, id, ))
 
+        # The tree is validated in place.  This relies on remove_dtd() having
+        # copied it into a new document, as the ID table of a document parsed
+        # with a DTD makes validation of xsd:ID attributes fail.
         try:
-            # Use a deepcopy to avoid any memory issues.
-            tree = copy.deepcopy(self.tree)
-            self.v3_rng.assertValid(tree)
+            xml2rfc.schemas.assert_valid('v3', self.tree, cache=self.options.validate == 'once')
             return True
         except Exception as e:
             deadly = False
@@ -2183,7 +2363,7 @@ class BaseV3Writer(object):
         # element attributes.  In order to avoid very long validation times, we
         # strip the root attributes before validation, and put them back
         # afterwards.
-        attrib = copy.deepcopy(e.attrib)
+        attrib = dict(e.attrib)
         e.attrib.clear()
         #
         if not self.validate('after', warn=True):
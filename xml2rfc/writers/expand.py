@@ -13,25 +13,29 @@ class ExpandV3XmlWriter(PrepToolWriter):
     # Note -- we don't need to subclass BaseRfcWriter because the behavior
     # is so different and so trivial
 
+    def tostring(self):
+        """ Expand the document, and return it as a string """
+        self.expand()
+        # Use lxml's built-in serialization
+        text = etree.tostring(self.tree,
+                                encoding='unicode',
+                                doctype='<!DOCTYPE rfc SYSTEM "rfc2629-xhtml.ent">',
+                                pretty_print=True)
+
+        # Use entities for some selected unicode code points, for later
+        # editing readability and convenience
+        text = text.replace(u'\u00A0', u'&nbsp;')
+        text = text.replace(u'\u200B', u'&zwsp;')
+        text = text.replace(u'\u2011', u'&nbhy;')
+        text = text.replace(u'\u2028', u'&br;')
+        text = text.replace(u'\u2060', u'&wj;')
+
+        return u"<?xml version='1.0' encoding='utf-8'?>\n" + text
+
     def write(self, filename):
         """ Public method to write the XML document to a file """
-        self.expand()
+        text = self.tostring()
         with open(filename, 'w', encoding='utf-8') as file:
-            # Use lxml's built-in serialization
-            text = etree.tostring(self.tree,
-                                    encoding='unicode',
-                                    doctype='<!DOCTYPE rfc SYSTEM "rfc2629-xhtml.ent">',
-                                    pretty_print=True)
-
-            # Use entities for some selected unicode code points, for later
-            # editing readability and convenience
-            text = text.replace(u'\u00A0', u'&nbsp;')
-            text = text.replace(u'\u200B', u'&zwsp;')
-            text = text.replace(u'\u2011', u'&nbhy;')
-            text = text.replace(u'\u2028', u'&br;')
-            text = text.replace(u'\u2060', u'&wj;')
-
-            file.write(u"<?xml version='1.0' encoding='utf-8'?>\n")
             file.write(text)
             if not self.options.quiet:
                 self.log(' Created file %s' % filename)
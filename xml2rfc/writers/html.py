@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function, division
 
+import hashlib
 import lxml
 import os
 import re
@@ -23,6 +24,7 @@ except ImportError:
     pass
 
 from xml2rfc import log, strings
+from xml2rfc.timings import timer, RenderProfile
 from xml2rfc.writers.base import default_options, BaseV3Writer, RfcWriterError, SUBSERIES
 from xml2rfc.uniscripts import is_script
 from xml2rfc.util.date import extract_date, augment_date, format_date, format_date_iso, get_expiry_date
@@ -230,6 +232,7 @@ class HtmlWriter(BaseV3Writer):
         self.duplicate_html_ids = set()
         self.filename = None
         self.refname_mapping = self.get_refname_mapping()
+        self.profile = RenderProfile('html') if self.options.render_profile else None
             
     def html_tree(self):
         if not self.root.get('prepTime'):
@@ -255,11 +258,10 @@ class HtmlWriter(BaseV3Writer):
         html = re.sub(r'[\x00-\x09\x0B-\x1F]+', ' ', html)
         return html
 
-    def write(self, filename):
-        self.filename = filename
-
-        """Write the document to a file """
-        html_tree = self.html_tree()
+    def tostring(self):
+        """Return the document as a string """
+        with timer('render'):
+            html_tree = self.html_tree()
 
         # Check for duplicate IDs
         dups = set(find_duplicate_html_ids(html_tree)) - self.duplicate_html_ids
@@ -270,26 +272,53 @@ class HtmlWriter(BaseV3Writer):
             raise RfcWriterError("Not creating output file due to errors (see above)")
 
         # Use lxml's built-in serialization
+        with timer('serialize'):
+            return self.html(html_tree)
+
+    def write(self, filename):
+        self.filename = filename
+
+        """Write the document to a file """
+        text = self.tostring()
         with open(filename, 'w', encoding='utf-8') as file:
-            text = self.html(html_tree)
             file.write(text)
 
         if not self.options.quiet:
             self.log(' Created file %s' % filename)
 
 
+    def read_resource(self, path):
+        """ Return the text of a CSS or JavaScript file or URL, and record it as a resource of the document
+
+            With --locked, the content is read from the lockfile, if it's there.
+        """
+        locked = self.xmlrfc.locked
+        entry = locked and locked.get(path)
+        if entry:
+            data = locked.read(entry['path'])
+        elif urlparse(path).scheme:
+            with closing(urlopen(path)) as f:
+                data = f.read()
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+        self.xmlrfc.resources[path] = {
+            'path': path,
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'cached': False,
+        }
+        return data.decode('utf-8')
+
     def read_css(self, data_dir, fn):
         try:
             if urlparse(fn).scheme:
-                with closing(urlopen(fn)) as f:
-                    return f.read(), fn
+                return self.read_resource(fn), fn
             else:
                 for path in ['.', data_dir, ]:
                     for ext in ['', '.css', ]:
                         cssin = os.path.join(path, fn + ext)
                         if os.path.exists(cssin):
-                            with open(cssin) as f:
-                                return f.read(), cssin
+                            return self.read_resource(cssin), cssin
         except IOError as e:
             self.err(self.root, "Error when trying to read external css: %s" % e)
         return None, None
@@ -314,7 +343,10 @@ class HtmlWriter(BaseV3Writer):
                 elif not x.tag in seen:
                     self.warn(x, "No renderer for <%s> found" % (x.tag, ))
                     seen.add(x.tag)
-            res = func(h, x)
+            if self.profile:
+                res = self.profile.call(func, h, x)
+            else:
+                res = func(h, x)
         return res
 
 
@@ -540,8 +572,7 @@ class HtmlWriter(BaseV3Writer):
             css, cssin = self.read_css(data_dir, self.options.css)
         if not css:
             cssin = os.path.join(data_dir, 'xml2rfc.css')
-            with open(cssin, encoding='utf-8') as f:
-                css = f.read()
+            css = self.read_resource(cssin)
         else:
             jsin = os.path.splitext(cssin)[0] + '.js'
             if os.path.exists(jsin):
@@ -573,15 +604,13 @@ class HtmlWriter(BaseV3Writer):
 
         scheme = urlparse(self.options.metadata_js_url).scheme
         if scheme in ['http', 'https', 'ftp', 'file', ]:
-            with closing(urlopen(self.options.metadata_js_url)) as f:
-                js = f.read()
+            js = self.read_resource(self.options.metadata_js_url)
         elif scheme:
             self.err(x, "Cannot handle scheme: %s in --metadata-js-url value" % scheme)
             js = ''
         else:
             jsin = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', self.options.metadata_js_url)
-            with open(jsin) as f:
-                js = f.read()
+            js = self.read_resource(jsin)
 
         if js:
             if self.filename:
@@ -662,8 +691,7 @@ class HtmlWriter(BaseV3Writer):
             self.part = c.tag
             self.render(body, c)
 
-        with open(self.css_js, encoding='utf-8') as f:
-            js = f.read()
+        js = self.read_resource(self.css_js)
         add.script(body, None, js)
 
         return html
@@ -2749,8 +2777,7 @@ class HtmlWriter(BaseV3Writer):
             self.err(x, e)
             text = ''
         anchor = x.get('anchor')
-        xref = self.root.find('.//xref[@target="%s"]'%anchor) if anchor else None
-        if xref != None:
+        if anchor in self.get_target_usage():
             # render only literal here
             text = x.text
         span = add.span(h, None, text, classes="unicode", id=anchor)
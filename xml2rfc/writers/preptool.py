@@ -4,6 +4,7 @@ from __future__ import unicode_literals, print_function
 
 import copy
 import datetime
+import hashlib
 import os
 import re
 import sys
@@ -31,16 +32,17 @@ from xml2rfc.boilerplate_id_guidelines import boilerplate_draft_status_of_memo
 from xml2rfc.boilerplate_rfc_7841 import boilerplate_rfc_status_of_memo
 from xml2rfc.boilerplate_tlp import boilerplate_tlp
 from xml2rfc.scripts import get_scripts
+from xml2rfc.timings import timed
 from xml2rfc.uniscripts import is_script
 from xml2rfc.util.date import get_expiry_date, format_date, normalize_month
-from xml2rfc.util.file import can_access, FileAccessError
+from xml2rfc.util.file import can_access, get_include, FileAccessError
 from xml2rfc.util.name import full_author_name_expansion
 from xml2rfc.util.num import ol_style_formatter
 from xml2rfc.util.unicode import (
         unicode_content_tags, unicode_attributes, expand_unicode_element,
         isascii, latinscript_attributes, is_svg)
 from xml2rfc.utils import build_dataurl, namespaces, sdict, clean_text
-from xml2rfc.writers.base import default_options, BaseV3Writer, RfcWriterError
+from xml2rfc.writers.base import default_options, BaseV3Writer, IdIndex, RfcWriterError
 
 
 pnprefix = {
@@ -131,6 +133,7 @@ class PrepToolWriter(BaseV3Writer):
             if self.prepped:
                 self.warn(elt, 'pn not set on element in prepped input, setting to {}'.format(value))
             elt.set('pn', value)
+            self.reset_id_index()
         elif existing_value != value:
             self.warn(elt, 'using existing pn ({}) instead of generated pn ({})'.format(existing_value, value))
 
@@ -138,6 +141,9 @@ class PrepToolWriter(BaseV3Writer):
         attrib = self.get_attribute_defaults(tag)
         attrib.update(kwargs)
         e = etree.Element(tag, **sdict(attrib))
+        if any( a in attrib for a in IdIndex.attributes ):
+            # The new element will be inserted with an id
+            self.reset_id_index()
         if line:
             e.sourceline = line
         elif self.options.debug:
@@ -175,6 +181,15 @@ class PrepToolWriter(BaseV3Writer):
 
         if not self.options.quiet:
             self.log(' Prepping %s' % self.xmlrfc.source)
+        text = self.tostring()
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+            if not self.options.quiet:
+                self.log(' Created file %s' % filename)
+
+    def tostring(self):
+        """ Prep the document, and return it as a string """
         self.prep()
         if self.errors:
             raise RfcWriterError("Not creating output file due to errors (see above)")
@@ -182,16 +197,12 @@ class PrepToolWriter(BaseV3Writer):
         # remove the processing instructions
         self.remove_pis()
 
-        with open(filename, 'w', encoding='utf-8') as file:
-            # Use lxml's built-in serialization
-            text = etree.tostring(self.root.getroottree(),
-                                            xml_declaration=True,
-                                            encoding='utf-8',
-                                            pretty_print=True)
-            file.write(text.decode('utf-8'))
-
-            if not self.options.quiet:
-                self.log(' Created file %s' % filename)
+        # Use lxml's built-in serialization
+        text = etree.tostring(self.root.getroottree(),
+                              xml_declaration=True,
+                              encoding='utf-8',
+                              pretty_print=True)
+        return text.decode('utf-8')
 
     def normalize_whitespace(self, e):
         lines = e.text.split('\n')
@@ -206,6 +217,7 @@ class PrepToolWriter(BaseV3Writer):
             lines[i] = line
         e.text = '\n'.join(lines)
 
+    @timed('preptool')
     def prep(self):
         self._seen_slugs = set()  # Reset cache before prepping
         self.xinclude()
@@ -221,6 +233,10 @@ class PrepToolWriter(BaseV3Writer):
     ## with the selector and the annotation separated by a semicolon (;).
     ## Everything from the semicolon to the end of the string is stripped
     ## before the selector is used as an XPath selector.
+    ##
+    ## Selectors grouped in a tuple are processed as one phase, with a single
+    ## walk of the document, see BaseV3Writer.dispatch().  Only group
+    ## selectors whose handlers don't depend on each other's results.
     selectors = [
         './/keyword',                       # 2.28.   Keyword
         '.;check_unnumbered_sections()',    # 2.46.2  "numbered" Attribute
@@ -239,18 +255,19 @@ class PrepToolWriter(BaseV3Writer):
         './front;insert_date())',           # 5.2.3.  <date> Insertion
         '.;insert_preptime()',              # 5.2.4.  "prepTime" Insertion
         './/ol[@group]',                    # 5.2.5.  <ol> Group "start" Insertion
-        '//*;insert_attribute_defaults()',  # 5.2.6.  Attribute Default Value Insertion
-        './/relref;to_xref()',
-        './/section',                       # 5.2.7.  Section "toc" attribute
-        './/note[@removeInRFC="true"]',     # 5.2.8.  "removeInRFC" Warning Paragraph
-        './/section[@removeInRFC="true"]',
+        ('//*;insert_attribute_defaults()', # 5.2.6.  Attribute Default Value Insertion
+         './/relref;to_xref()',
+         './/section',                      # 5.2.7.  Section "toc" attribute
+         './/note[@removeInRFC="true"]',    # 5.2.8.  "removeInRFC" Warning Paragraph
+         './/section[@removeInRFC="true"]', ),
         '//*[@*="yes" or @*="no"]',         #         convert old attribute false/true
         './front/date',                     # 5.3.1.  "month" Attribute
         './/*[@ascii]',                     # 5.3.2.  ASCII Attribute Processing
         './front/author',
         './/contact',
-        './/*[@title]',                     # 5.3.3.  "title" Conversion
-        './/*[@keepWithPrevious="true"]',   # 5.3.4.  "keepWithPrevious" Conversion
+        ('.//*[@title]',                    # 5.3.3.  "title" Conversion
+         './/*[@keepWithPrevious="true"]',  # 5.3.4.  "keepWithPrevious" Conversion
+         ),
         '.;fill_in_expires_date()',         # 5.4.1.  "expiresDate" Insertion
         './front;insert_boilerplate()',     # 5.4.2.  <boilerplate> Insertion
         './front;insert_toc()',
@@ -258,10 +275,11 @@ class PrepToolWriter(BaseV3Writer):
         './/boilerplate;insert_status_of_memo()',  # 5.4.2.2.  "Status of This Memo" Insertion
         './/boilerplate;insert_copyright_notice()', # 5.4.2.3.  "Copyright Notice" Insertion
         './/boilerplate//section',          # 5.2.7.  Section "toc" attribute
-        './/reference;insert_target()',     # 5.4.3.  <reference> "target" Insertion
-        './/referencegroup;insert_target()',        # <referencegroup> "target" Insertion
-        './/reference;insert_work_in_progress()',
-        './/reference;sort_series_info()',  #         <reference> sort <seriesInfo>
+        ('.//reference;insert_target()',    # 5.4.3.  <reference> "target" Insertion
+         './/referencegroup;insert_target()',       # <referencegroup> "target" Insertion
+         './/reference;insert_work_in_progress()',
+         './/reference;sort_series_info()', #         <reference> sort <seriesInfo>
+         ),
         './/name;insert_slugified_name()',  # 5.4.4.  <name> Slugification
         './/references;sort()',             # 5.4.5.  <reference> Sorting
         './/references;add_derived_anchor()',
@@ -1242,6 +1260,7 @@ class PrepToolWriter(BaseV3Writer):
         slug = self.slugify_name('name-'+text) if text else None
         if slug:
             e.set('slugifiedName', slug)
+            self.reset_id_index()
         
     # 
     # 5.4.5.  <reference> Sorting
@@ -1272,10 +1291,10 @@ class PrepToolWriter(BaseV3Writer):
 
     def references_check_usage(self, e, p):
         children = e.xpath('./reference') + e.xpath('./referencegroup')
+        usage = self.get_target_usage()
         for c in children:
             anchor = c.get('anchor')
-            if not (   self.root.xpath('.//xref[@target="%s"]'%anchor)
-                    or self.root.xpath('.//relref[@target="%s"]'%anchor)):
+            if not anchor in usage:
                         x = c if getattr(c, 'base') == getattr(e, 'base') else c.getparent()
                         self.warn(x, "Unused reference: There seems to be no reference to [%s] in the document" % anchor)
 
@@ -1549,13 +1568,9 @@ class PrepToolWriter(BaseV3Writer):
         target = e.get('target')
         if not target:
             self.die(e, "Expected <xref> to have a target= attribute, but found none")
-        t = self.root.find('.//*[@anchor="%s"]'%(target, ))
+        t = self.get_element_from_id(target)
         if t is None:
-            t = self.root.find('.//*[@pn="%s"]'%(target, ))
-            if t is None:
-                t = self.root.find('.//*[@slugifiedName="%s"]'%(target, ))
-                if t is None:
-                    self.die(e, "Found no element to match the <xref> target attribute '%s'" % (target, ))
+            self.die(e, "Found no element to match the <xref> target attribute '%s'" % (target, ))
         #
         p = t
         pn = None
@@ -1715,19 +1730,44 @@ class PrepToolWriter(BaseV3Writer):
         return (scheme, netloc, path, query, fragment)
 
     def check_src_file_path(self, e, scheme, netloc, path, query, fragment):
-        try:
-            can_access(self.options, self.xmlrfc.source, path)
-        except FileAccessError as err:
-            self.err(e, err)
-            return None
-        #
         dir = os.path.abspath(os.path.dirname(self.xmlrfc.source))
-        path = os.path.abspath(os.path.join(dir, path))
-        src = urlunsplit((scheme, '', path, '', ''))
+        src = urlunsplit((scheme, '', os.path.abspath(os.path.join(dir, path)), '', ''))
+        locked = self.xmlrfc.locked and self.xmlrfc.locked.get(src)
+        if get_include(self.xmlrfc.includes, self.xmlrfc.source, path) is None and not locked:
+            try:
+                can_access(self.options, self.xmlrfc.source, path)
+            except FileAccessError as err:
+                self.err(e, err)
+                return None
         #
         e.set('src', src)
         return src
 
+    def read_src(self, src):
+        """ Return the content of a src URI, from the in-memory include files or the lockfile if present """
+        scheme, netloc, path, query, fragment = urlsplit(src)
+        data = None
+        entry = self.xmlrfc.locked and self.xmlrfc.locked.get(src)
+        if entry:
+            data = self.xmlrfc.locked.read(entry['path'])
+        if data is None and scheme == 'file':
+            data = get_include(self.xmlrfc.includes, self.xmlrfc.source, path)
+        if data is None:
+            with closing(urlopen(src)) as f:
+                data = f.read()
+        self.add_resource(src, data)
+        return data
+
+    def add_resource(self, src, data):
+        """ Record external content included from a src attribute """
+        scheme, netloc, path, query, fragment = urlsplit(src)
+        if scheme != 'data':
+            self.xmlrfc.resources[src] = {
+                'path': path if scheme == 'file' else src,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'cached': False,
+            }
+
     def element_artset(self, e, p):
         anchors = [ w.get('anchor') for w in e.xpath('./artwork[@anchor]') ]
         if anchors:
@@ -1744,6 +1784,7 @@ class PrepToolWriter(BaseV3Writer):
                     self.warn(e, "-- Discarding anchors '%s'." % ("', '".join(anchors)))
             for w in e.xpath('./artwork[@anchor]'):
                 del w.attrib['anchor']
+            self.reset_id_index()
 
     def element_artwork(self, e, p):
 
@@ -1804,8 +1845,7 @@ class PrepToolWriter(BaseV3Writer):
     #           the value of the URI and remove the "src" attribute.
 
                     if scheme in ['file', 'http', 'https', 'data']:
-                        with closing(urlopen(src)) as f:
-                            data = f.read()
+                        data = self.read_src(src)
                         svg = etree.fromstring(data)
                         e.append(svg)
                         del e.attrib['src']
@@ -1843,6 +1883,7 @@ class PrepToolWriter(BaseV3Writer):
                         with closing(urlopen(src)) as f:
                             data = f.read()
                             mediatype = f.info().get_content_type()
+                        self.add_resource(src, data)
                         src = build_dataurl(mediatype, data)
                         e.set('src', src)
                     elif scheme == 'file':
@@ -1867,8 +1908,7 @@ class PrepToolWriter(BaseV3Writer):
                 else:
                     if scheme in ['file', 'http', 'https', 'data']:
                         try:
-                            with closing(urlopen(src)) as f:
-                                data = f.read().decode('utf-8')
+                            data = self.read_src(src).decode('utf-8')
                             e.text = data
                         except Exception as ex:
                             self.err(e, "Discarded unexpected <artwork> content with type='%s': '%s'" % (awtype, ex))
@@ -1932,8 +1972,7 @@ class PrepToolWriter(BaseV3Writer):
     #           the value of the URI and remove the "src" attribute.
 
             if src:                             # Test again, after check_src_file_path()
-                with closing(urlopen(src)) as f:
-                    data = f.read()
+                data = self.read_src(src)
                 e.text = data
                 del e.attrib['src']
 
@@ -2019,6 +2058,7 @@ class PrepToolWriter(BaseV3Writer):
                     self.warn(name, "Internal error: missing slugifiedName for %s" % (etree.tostring(name)))
                     slug = self.slugify_name('name-'+text)
                     name.set('slugifiedName', slug)
+                    self.reset_id_index()
                 xref = self.element('xref', target=slug, format='title', derivedContent='')
                 cc = copy_reduce(name)
                 xref.text = cc.text
@@ -2295,6 +2335,7 @@ class PrepToolWriter(BaseV3Writer):
                 if e.get('anchor'):
                     e.attrib.pop('anchor')
         back.append(s)
+        self.reset_id_index()
         #
         self.back_section_add_number(s, e)
         self.paragraph_add_numbers(s, e)
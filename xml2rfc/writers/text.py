@@ -23,6 +23,7 @@ except ImportError:
 from xml2rfc import strings
 from xml2rfc.writers.base import default_options, BaseV3Writer, RfcWriterError, SUBSERIES
 from xml2rfc import utils
+from xml2rfc.timings import timer, RenderProfile
 from xml2rfc.uniscripts import is_script
 from xml2rfc.util.date import extract_date, augment_date, get_expiry_date, format_date
 from xml2rfc.util.name import (short_author_name, short_author_ascii_name,
@@ -295,18 +296,21 @@ class TextWriter(BaseV3Writer):
         self.options.min_section_start_lines = 5
         self.refname_mapping = self.get_refname_mapping()
         self.rendered = None
+        self.profile = RenderProfile('text') if self.options.render_profile else None
 
     def process(self):
         if not self.rendered:
             joiners = base_joiners
             if self.options.pagination:
                 self.add_pageno_placeholders()
-            lines = self.render(self.root, width=MAX_WIDTH, joiners=joiners)
+            with timer('render'):
+                lines = self.render(self.root, width=MAX_WIDTH, joiners=joiners)
 
             if self.options.pagination:
-                lines = findblocks(lines)
-                lines = self.paginate(lines)
-                lines = self.update_toc(lines)
+                with timer('paginate'):
+                    lines = findblocks(lines)
+                    lines = self.paginate(lines)
+                    lines = self.update_toc(lines)
             if self.options.debug:
                 for i, l in enumerate(lines):
                     tag  = l.elem.tag  if l.elem!=None else '-'
@@ -334,14 +338,20 @@ class TextWriter(BaseV3Writer):
 
         return self.rendered
 
-    def write(self, filename):
-        """Write the document to a file """
-
+    def tostring(self):
+        """Return the document as a string """
         text = self.process()
 
         if self.errors:
             raise RfcWriterError("Not creating output file due to errors (see above)")
 
+        return text
+
+    def write(self, filename):
+        """Write the document to a file """
+
+        text = self.tostring()
+
         encoding = 'utf-8-sig' if self.options.bom else 'utf-8'
         with open(filename, 'w', encoding=encoding) as file:
             file.write(text)
@@ -361,6 +371,8 @@ class TextWriter(BaseV3Writer):
             elif not e.tag in seen:
                 self.warn(e, "No renderer for <%s> found" % (e.tag, ))
                 seen.add(e.tag)
+        if self.profile:
+            return self.profile.call(func, e, width, **kwargs)
         res = func(e, width, **kwargs)
         return res
 
@@ -4685,8 +4697,7 @@ class TextWriter(BaseV3Writer):
             text = ''
             self.err(e, exception)
         anchor = e.get('anchor')
-        xref = self.root.find('.//xref[@target="%s"]'%anchor) if anchor else None
-        if xref != None:
+        if anchor in self.get_target_usage():
             # render only literal here
             text = e.text
         text += e.tail or ''
@@ -13,6 +13,7 @@ from lxml.etree import Element, Comment, CDATA
 
 import xml2rfc
 from xml2rfc import log
+from xml2rfc.timings import timed
 from xml2rfc.utils import hastext, isempty, sdict, slugify, iscomment
 from xml2rfc.writers.base import default_options, BaseV3Writer
 
@@ -99,8 +100,8 @@ class V2v3XmlWriter(BaseV3Writer):
         output = [ line.replace(u'\u00A0', ' ') for line in lines ]
         return output
 
-    def write(self, filename):
-        """ Public method to write the XML document to a file """
+    def tostring(self):
+        """ Convert the document, and return it as a string """
 
         self.convert2to3()
         if self.options.add_xinclude:
@@ -113,14 +114,19 @@ class V2v3XmlWriter(BaseV3Writer):
   <!ENTITY nbhy   "&#8209;">
   <!ENTITY wj     "&#8288;">
 ]>"""
-        with open(filename, 'w', encoding='utf-8') as file:
-            # Use lxml's built-in serialization
-            text = lxml.etree.tostring(self.root.getroottree(),
-                                       encoding='unicode',
-                                       doctype=doctype_string,
-                                       pretty_print=True)
+        # Use lxml's built-in serialization
+        text = lxml.etree.tostring(self.root.getroottree(),
+                                   encoding='unicode',
+                                   doctype=doctype_string,
+                                   pretty_print=True)
+
+        return u"<?xml version='1.0' encoding='utf-8'?>\n" + text
 
-            file.write(u"<?xml version='1.0' encoding='utf-8'?>\n")
+    def write(self, filename):
+        """ Public method to write the XML document to a file """
+
+        text = self.tostring()
+        with open(filename, 'w', encoding='utf-8') as file:
             file.write(text)
 
             if not self.options.quiet:
@@ -251,6 +257,7 @@ class V2v3XmlWriter(BaseV3Writer):
 
     # ------------------------------------------------------------------
 
+    @timed('v2v3')
     def convert2to3(self):
         if self.root.get('version') in ['3', ]:
             return self.tree